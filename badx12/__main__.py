@@ -1,16 +1,26 @@
 # -*- coding: utf-8 -*-
 
 """Main module."""
+
 import logging
 import sys
 
 import click
 
-from .commands import parse
-from .common.click import add_commands
+from .common import profiling
+from .common.click import LazyGroup, add_commands
+
+COMMANDS = (
+    "badx12.commands.parse:parse",
+    "badx12.commands.watch:watch",
+    "badx12.commands.serve:serve",
+    "badx12.commands.grep:grep",
+    "badx12.commands.diff:diff",
+    "badx12.commands.split:split",
+)
 
 
-@click.group()
+@click.group(cls=LazyGroup)
 @click.option(
     "-l",
     "--log",
@@ -18,15 +28,39 @@ from .common.click import add_commands
     help="Set the logging level",
     type=click.Choice(["CRITICAL", "ERROR", "WARNING", "INFO", "DEBUG"]),
 )
-def cli(log):
+@click.option(
+    "--profile",
+    is_flag=True,
+    help="Time every phase and segment type, and print a breakdown when done.",
+)
+@click.option(
+    "--profile-slowest",
+    default=5,
+    show_default=True,
+    type=click.IntRange(min=0),
+    help="Number of slowest files to list in the profile breakdown.",
+)
+@click.option(
+    "--profile-dir",
+    default=None,
+    type=click.Path(file_okay=False, dir_okay=True),
+    help="Write cProfile and tracemalloc output for the slowest files here.",
+)
+def cli(log, profile, profile_slowest, profile_dir):
     logging.basicConfig(
         stream=sys.stdout,
         format="%(asctime)s|%(levelname)s|%(filename)s:%(lineno)s|%(message)s",
         level=log,
     )
 
+    if profile or profile_dir:
+        active = profiling.enable(profiling.Profile(profile_slowest, profile_dir))
+        context = click.get_current_context()
+        context.call_on_close(lambda: click.echo(active.table(), err=True))
+        context.call_on_close(profiling.disable)
+
 
-add_commands(cli, (parse,))
+add_commands(cli, COMMANDS)
 
 if __name__ == "__main__":
     sys.exit(cli())  # pragma: no cover
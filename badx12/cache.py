@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import logging
+import os
+import tempfile
+from pathlib import Path
+
+from badx12 import serialization
+from badx12.utils.errors import SerializationError
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_SIZE = 1024 * 1024 * 1024
+CACHE_SUFFIX = ".bx12"
+
+
+class ParseCache:
+    """
+    An on-disk cache of parsed documents keyed by the hash of the document text.
+    Entries are stored in the compact binary format, the least recently used
+    entries are evicted once the cache grows past max_size bytes.
+    """
+
+    def __init__(self, directory, max_size=DEFAULT_MAX_SIZE):
+        """
+        Create a new parse cache
+        :param directory: the directory holding the cache entries.
+        :param max_size: the size in bytes the cache is allowed to grow to.
+        """
+        self.directory = Path(directory)
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._size = None
+
+    def key(self, document_text, keep=None):
+        """
+        Compute the cache key for a document.
+        The key covers the badx12 and format versions so upgrades never load stale entries.
+        :param document_text: the normalized text of the document.
+        :param keep: the segment ids the document was parsed with, if not all of them.
+        """
+        from badx12 import __version__
+
+        digest = hashlib.sha256(
+            f"{__version__}:{serialization.FORMAT_VERSION}:".encode("utf-8")
+        )
+        if keep is not None:
+            digest.update(f"keep={','.join(keep)}:".encode("utf-8"))
+        digest.update(document_text.encode("utf-8"))
+        return digest.hexdigest()
+
+    def get(self, key):
+        """
+        Load a cached document.
+        :param key: the key returned by key().
+        :return: the EDIDocument or None if the key isn't cached.
+        """
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                document = serialization.load(f)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except SerializationError as e:
+            logger.warning(f"Discarding corrupt cache entry {path}. Exception: {e.msg}")
+            self._remove(path)
+            self.misses += 1
+            return None
+
+        os.utime(path)
+        self.hits += 1
+        return document
+
+    def put(self, key, document):
+        """
+        Store a document in the cache, evicting old entries when needed.
+        :param key: the key returned by key().
+        :param document: the EDIDocument to store.
+        """
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        data = serialization.dumps(document)
+
+        fd, temp_path = tempfile.mkstemp(dir=str(path.parent), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, str(path))
+        except BaseException:
+            self._remove(temp_path)
+            raise
+
+        if self._size is None:
+            self._size = sum(size for _, _, size in self._entries())
+        else:
+            self._size += len(data)
+
+        if self._size > self.max_size:
+            self.evict()
+
+    def evict(self):
+        """Remove the least recently used entries until the cache is below max_size"""
+        entries = sorted(self._entries(), key=lambda entry: entry[1])
+        size = sum(size for _, _, size in entries)
+        target = self.max_size * 0.9
+
+        for path, _, entry_size in entries:
+            if size <= target:
+                break
+            if self._remove(path):
+                size -= entry_size
+
+        self._size = size
+
+    def clear(self):
+        """Remove every entry from the cache"""
+        for path, _, _ in self._entries():
+            self._remove(path)
+        self._size = 0
+
+    def _path(self, key):
+        return self.directory / key[:2] / f"{key}{CACHE_SUFFIX}"
+
+    def _entries(self):
+        """Yield (path, last access, size) for every entry in the cache"""
+        if not self.directory.is_dir():
+            return
+
+        for bucket in os.scandir(str(self.directory)):
+            if not bucket.is_dir():
+                continue
+            for entry in os.scandir(bucket.path):
+                if entry.name.endswith(CACHE_SUFFIX):
+                    stat = entry.stat()
+                    yield entry.path, stat.st_mtime, stat.st_size
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(str(path))
+        except FileNotFoundError:
+            return False
+        return True
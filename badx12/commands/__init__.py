@@ -1,2 +1,17 @@
 # -*- coding: utf-8 -*-
-from .parse import parse
+from importlib import import_module
+
+# The commands are imported when they're looked up, so loading one command doesn't
+# import the others and their dependencies.
+COMMAND_NAMES = ("parse", "watch", "serve", "grep", "diff", "split")
+
+
+def get_command(name):
+    """
+    Import a command.
+    :param name: one of COMMAND_NAMES.
+    :return: the click command.
+    """
+    if name not in COMMAND_NAMES:
+        raise KeyError(f"Unknown command {name!r}")
+    return getattr(import_module(f"{__name__}.{name}"), name)
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+import logging
+
+import click
+
+from badx12.parser import Parser
+from badx12.utils.errors import PARSE_ERRORS
+
+logger = logging.getLogger(__name__)
+
+
+@click.command(
+    "diff", help="Compare two EDI files by transaction set, segment and element"
+)
+@click.argument("old", type=click.Path(exists=True, dir_okay=False))
+@click.argument("new", type=click.Path(exists=True, dir_okay=False))
+@click.option(
+    "-q", "--brief", is_flag=True, help="Only report whether the files differ."
+)
+def diff(old, new, brief):
+    context = click.get_current_context()
+    documents = []
+    for path in (old, new):
+        try:
+            documents.append(Parser(path).document)
+        except PARSE_ERRORS as e:
+            logger.error(f"Can't compare {path}: {e.msg}")
+            context.exit(2)
+
+    result = documents[0].diff(documents[1])
+    if brief:
+        if result:
+            click.echo(f"Files {old} and {new} differ")
+    else:
+        click.echo(f"--- {old}")
+        click.echo(f"+++ {new}")
+        for change in result:
+            for line in _format_change(change):
+                click.echo(line)
+
+    logger.info(
+        f"Compared {result.transaction_set_count} transaction sets, "
+        f"{result.changed_transaction_set_count} changed, {len(result)} differences"
+    )
+    if result:
+        context.exit(1)
+
+
+def _format_change(change):
+    """:return: the lines describing a TransactionSetChange or SegmentChange."""
+    from badx12.diff import ADDED, REMOVED, TransactionSetChange
+
+    if isinstance(change, TransactionSetChange):
+        header = change.transaction_set.header
+        yield f"{change.location}: {change.kind} {header.st01.content} transaction set"
+        return
+
+    where = change.location
+    if change.kind == ADDED:
+        position = change.new_position
+        yield f"{where}: added {_at(position)}+ {change.new}"
+    elif change.kind == REMOVED:
+        position = change.old_position
+        yield f"{where}: removed {_at(position)}- {change.old}"
+    else:
+        yield f"{where}: changed {_at(change.old_position)}- {change.old}"
+        yield f"{where}: changed {_at(change.new_position)}+ {change.new}"
+        for element in change.elements:
+            yield f"    {element.name}: {element.old!r} -> {element.new!r}"
+
+
+def _at(position):
+    return f"segment {position} " if position is not None else ""
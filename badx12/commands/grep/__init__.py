@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+import logging
+import os
+from functools import partial
+
+import click
+
+from badx12.common.paths import iter_files
+from badx12.utils.errors import QuerySyntaxError
+
+from .search import Expression, search_file
+
+logger = logging.getLogger(__name__)
+
+
+def _expression(ctx, param, value):
+    try:
+        return Expression(value, ignore_case=ctx.params.get("ignore_case", False))
+    except QuerySyntaxError as e:
+        raise click.BadParameter(e.msg)
+
+
+@click.command(
+    "grep", help="Search EDI files for segments without parsing them into documents"
+)
+@click.option(
+    "-i",
+    "--ignore-case",
+    is_flag=True,
+    is_eager=True,
+    help="Compare values and regular expressions without regard to case.",
+)
+@click.argument("expression", callback=_expression)
+@click.argument("paths", nargs=-1, required=True, type=click.Path(exists=True))
+@click.option(
+    "-j",
+    "--jobs",
+    default=1,
+    show_default=True,
+    type=click.IntRange(min=0),
+    help="Number of worker processes to search files with, 0 uses one per CPU.",
+)
+@click.option(
+    "-l",
+    "--files-with-matches",
+    is_flag=True,
+    help="Only print the names of files with a match, each file stops at its first.",
+)
+@click.option(
+    "-c", "--count", is_flag=True, help="Only print the number of matches per file."
+)
+@click.option(
+    "-r", "--recursive", is_flag=True, help="Search the files in sub directories too."
+)
+@click.option(
+    "--include",
+    multiple=True,
+    help="Only search files matching this glob pattern, can be repeated.",
+)
+@click.option(
+    "--exclude",
+    multiple=True,
+    help="Skip files and directories matching this glob pattern, can be repeated.",
+)
+def grep(
+    ignore_case,
+    expression,
+    paths,
+    jobs,
+    files_with_matches,
+    count,
+    recursive,
+    include,
+    exclude,
+):
+    files = (
+        file
+        for path in paths
+        for file in iter_files(
+            path, recursive=recursive, include=include, exclude=exclude
+        )
+    )
+    search = partial(
+        search_file, expression=expression, limit=1 if files_with_matches else None
+    )
+
+    jobs = jobs or os.cpu_count() or 1
+    if jobs == 1:
+        results = map(search, files)
+        found = _print_results(results, files_with_matches, count)
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            results = executor.map(search, files, chunksize=4)
+            found = _print_results(results, files_with_matches, count)
+
+    if not found:
+        click.get_current_context().exit(1)
+
+
+def _print_results(results, files_with_matches, count):
+    """Print results in the order of the files, :return: whether anything matched."""
+    found = False
+    for result in results:
+        if result.error is not None:
+            logger.warning(f"Skipped {result.path}: {result.error}")
+            continue
+
+        found = found or bool(result.matches)
+        if count:
+            click.echo(f"{result.path}:{len(result.matches)}")
+        elif files_with_matches:
+            if result.matches:
+                click.echo(str(result.path))
+        else:
+            for match in result.matches:
+                click.echo(
+                    f"{match.path}:{match.offset}:{match.isa13}/{match.gs06}/{match.st02}:"
+                    f"{match.segment}"
+                )
+    return found
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+Search x12 files segment by segment, without building documents.
+
+Files are only split into segments, a segment is split into elements when its
+id is the one searched for, and envelope segments are read for their control
+numbers.
+"""
+import re
+from collections import namedtuple
+
+from badx12.stream import SegmentReader
+from badx12.utils.errors import QuerySyntaxError
+
+Match = namedtuple("Match", ["path", "offset", "isa13", "gs06", "st02", "segment"])
+Match.__doc__ = "A matching segment with its byte offset and envelope control numbers"
+
+FileResult = namedtuple("FileResult", ["path", "matches", "error"])
+
+_EXPRESSION = re.compile(
+    r"(?P<segment_id>[A-Z][A-Z0-9]{1,2}?)"
+    r"(?:(?P<position>\d{2})(?:-(?P<component>\d+))?(?P<op>!=|=|~)(?P<value>.*))?",
+    re.DOTALL,
+)
+
+
+class Expression:
+    def __init__(self, text, ignore_case=False):
+        """
+        Compile a search expression.
+        :param text: a segment id, BEG, or an element compared to a value:
+            BEG03=4500012345, N101!=ST, or matched with a regular expression,
+            BEG03~^45. SVC01-2=D0120 compares one component of a composite.
+        :param ignore_case: compare values without regard to case.
+        """
+        self.text = text
+        self.ignore_case = ignore_case
+        match = _EXPRESSION.fullmatch(text)
+        if match is None:
+            raise QuerySyntaxError(
+                path=text,
+                msg=f"Expected a segment id such as BEG or a comparison such as "
+                f"BEG03=value, N101!=ST or BEG03~regex, got {text!r}",
+            )
+
+        self.segment_id = match.group("segment_id")
+        self.position = (
+            int(match.group("position")) if match.group("position") else None
+        )
+        self.component = int(match.group("component") or 0) or None
+        self.op = match.group("op")
+        self.value = match.group("value")
+        self.pattern = None
+        if self.op == "~":
+            try:
+                self.pattern = re.compile(
+                    self.value, re.IGNORECASE if ignore_case else 0
+                )
+            except re.error as e:
+                raise QuerySyntaxError(
+                    path=text, msg=f"Invalid regular expression {self.value!r}: {e}"
+                )
+        elif ignore_case and self.value is not None:
+            self.value = self.value.casefold()
+
+    def matches(self, fields, sub_element_separator):
+        """
+        :param fields: the segment split into elements, the id first.
+        :return: True when the segment satisfies the expression.
+        """
+        if self.op is None:
+            return True
+
+        value = fields[self.position] if self.position < len(fields) else ""
+        if self.component is not None:
+            components = value.split(sub_element_separator)
+            value = (
+                components[self.component - 1]
+                if self.component <= len(components)
+                else ""
+            )
+
+        if self.pattern is not None:
+            return self.pattern.search(value) is not None
+        if self.ignore_case:
+            value = value.casefold()
+        return (value == self.value) == (self.op == "=")
+
+    def __repr__(self):
+        return f"Expression({self.text!r})"
+
+
+def search_file(path, expression, limit=None):
+    """
+    Find the segments of a file that match an expression.
+    :param path: the x12 file to search.
+    :param expression: an Expression.
+    :param limit: stop after this many matches.
+    :return: a FileResult, with the error message instead of matches when the
+        file can't be read as x12.
+    """
+    try:
+        return FileResult(path, _search(path, expression, limit), None)
+    except Exception as e:
+        return FileResult(
+            path, [], getattr(e, "msg", None) or str(e) or type(e).__name__
+        )
+
+
+def _search(path, expression, limit):
+    reader = SegmentReader(path)
+    element_separator = reader.element_separator
+    sub_element_separator = reader.sub_element_separator
+    segment_id = expression.segment_id
+    prefix = segment_id + element_separator
+    isa13 = gs06 = st02 = ""
+    matches = []
+
+    for offset, segment in reader.segments_with_offsets():
+        if segment.startswith(("ISA", "GS", "ST")):
+            fields = segment.split(element_separator)
+            if fields[0] == "ISA":
+                isa13 = fields[13] if len(fields) > 13 else ""
+                gs06 = st02 = ""
+            elif fields[0] == "GS":
+                gs06 = fields[6] if len(fields) > 6 else ""
+                st02 = ""
+            elif fields[0] == "ST":
+                st02 = fields[2] if len(fields) > 2 else ""
+
+        if segment.startswith(prefix) or segment == segment_id:
+            fields = segment.split(element_separator)
+            if expression.matches(fields, sub_element_separator):
+                matches.append(Match(str(path), offset, isa13, gs06, st02, segment))
+                if limit is not None and len(matches) >= limit:
+                    reader.close()
+                    break
+
+    return matches
@@ -1,25 +1,28 @@
 # -*- coding: utf-8 -*-
 import logging
+import tempfile
+import time
 from pathlib import Path
 
 import click
 
-import badx12.utils.errors as err
-from badx12.common.paths import OUTPUT_DIR
-from badx12.parser import Parser
+from badx12.common import metrics, profiling
+from badx12.common.paths import OUTPUT_DIR, iter_files
+from badx12.control_numbers import ControlNumberIndex
 
-from .utils import export_file
+from .batch import ParsePipeline, parse_file, report_result
+from .manifest import Manifest
 
 logger = logging.getLogger(__name__)
 
 
-@click.command("parse", help="Parse an EDI file into JSON or XML")
+@click.command("parse", help="Parse an EDI file into JSON, XML, CSV or SQLite")
 @click.argument("path", type=click.Path(exists=True))
 @click.option(
     "-e",
     "--export_type",
     default="JSON",
-    type=click.Choice(["JSON", "XML"]),
+    type=click.Choice(["JSON", "XML", "CSV", "SQLITE"]),
     help="Specify the file output type.",
 )
 @click.option(
@@ -29,32 +32,178 @@ logger = logging.getLogger(__name__)
     type=click.Path(exists=True, file_okay=False, dir_okay=True),
     help="Specify an output directory.",
 )
-def parse(path, export_type, output_dir):
+@click.option(
+    "--cache-dir",
+    default=None,
+    type=click.Path(file_okay=False, dir_okay=True),
+    help="Cache parsed documents in this directory so unchanged files skip parsing.",
+)
+@click.option(
+    "--cache-size",
+    default=1024,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help="Maximum size of the parse cache in megabytes.",
+)
+@click.option(
+    "-j",
+    "--jobs",
+    default=1,
+    show_default=True,
+    type=click.IntRange(min=0),
+    help="Number of worker processes to parse files with, 0 uses one per CPU.",
+)
+@click.option(
+    "--readers",
+    default=1,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help="Number of threads reading input files.",
+)
+@click.option(
+    "--serializers",
+    default=0,
+    type=click.IntRange(min=0),
+    help="Number of workers formatting parsed documents, 0 uses the --jobs value.",
+)
+@click.option(
+    "--writers",
+    default=1,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help="Number of threads writing output files.",
+)
+@click.option(
+    "--queue-size",
+    default=8,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help="Number of files each queue between stages can hold.",
+)
+@click.option(
+    "--metrics-file",
+    default=None,
+    type=click.Path(dir_okay=False),
+    help="Write file, byte, segment and error counts here in the Prometheus text format.",
+)
+@click.option(
+    "--control-number-db",
+    default=None,
+    type=click.Path(dir_okay=False),
+    help="Record ISA13, GS06 and ST02 control numbers in this SQLite database and "
+    "warn about ones already used by another file.",
+)
+@click.option(
+    "--force",
+    is_flag=True,
+    help="Process every file, even those already recorded in the output manifest.",
+)
+@click.option(
+    "-r", "--recursive", is_flag=True, help="Parse the files in sub directories too."
+)
+@click.option(
+    "--include",
+    multiple=True,
+    help="Only parse files matching this glob pattern, can be repeated.",
+)
+@click.option(
+    "--exclude",
+    multiple=True,
+    help="Skip files and directories matching this glob pattern, can be repeated.",
+)
+def parse(
+    path,
+    export_type,
+    output_dir,
+    cache_dir,
+    cache_size,
+    jobs,
+    readers,
+    serializers,
+    writers,
+    queue_size,
+    metrics_file,
+    control_number_db,
+    force,
+    recursive,
+    include,
+    exclude,
+):
     path = Path(path)
     output_dir = Path(output_dir) if output_dir else OUTPUT_DIR
-    files = [f for f in path.glob("*") if f.is_file()] if path.is_dir() else [path]
-
-    for f in files:
-        logger.debug(f"Parsing {f}, export as {export_type} to {output_dir}")
-        try:
-            parser = Parser(f)
-            document = parser.document
-            report = document.validate()
-
-            if not report.is_document_valid():
-                logger.error(
-                    f"{f} contains the following errors. Issues: {[error.msg for error in report.error_list]}"
-                )
-                continue
-
-            doc_dict = document.to_dict()
-            export_file(doc_dict, export_type, output_dir)
-
-        except (
-            err.InvalidFileTypeError,
-            err.FieldValidationError,
-            err.SegmentCountError,
-            err.IDMismatchError,
-            err.SegmentTerminatorNotFoundError,
-        ) as e:
-            logger.error(f"{f} caused the following error. Exception: {e.msg}")
+    files = iter_files(path, recursive=recursive, include=include, exclude=exclude)
+    logger.debug(
+        f"Parsing {path} with {jobs} jobs, export as {export_type} to {output_dir}"
+    )
+
+    started = time.perf_counter()
+    file_count = byte_count = failed_count = 0
+
+    profile = profiling.active()
+    if profile is not None and jobs != 1:
+        logger.warning(
+            "Profiling parses every file in this process, --jobs is ignored."
+        )
+
+    output_dir.mkdir(exist_ok=True)
+    manifest = Manifest(output_dir)
+    if not force:
+        files = manifest.pending(files, export_type)
+
+    pipeline = ParsePipeline(
+        export_type,
+        output_dir,
+        jobs=jobs,
+        readers=readers,
+        serializers=serializers,
+        writers=writers,
+        queue_size=queue_size,
+        cache_dir=cache_dir,
+        cache_size=cache_size * 1024 * 1024,
+    )
+    control_numbers = (
+        ControlNumberIndex(control_number_db) if control_number_db else None
+    )
+    try:
+        with manifest:
+            for result in pipeline.run(files):
+                file_count += 1
+                byte_count += result.byte_size
+                report_result(result, manifest, export_type, control_numbers)
+                if result.output is None:
+                    failed_count += 1
+    finally:
+        if control_numbers is not None:
+            control_numbers.close()
+
+    elapsed = max(time.perf_counter() - started, 1e-9)
+    logger.info(
+        f"Parsed {file_count} files ({failed_count} failed, {manifest.skipped} skipped, "
+        f"{byte_count / 1e6:.2f} MB) "
+        f"in {elapsed:.2f}s: {file_count / elapsed:.1f} files/s, "
+        f"{byte_count / 1e6 / elapsed:.2f} MB/s"
+    )
+    logger.info(
+        "Stage utilization: "
+        + ", ".join(
+            f"{stage.name} {pipeline.utilization()[stage.name]:.0%} "
+            f"({stage.workers} workers)"
+            for stage in pipeline.pipeline.stages
+        )
+    )
+
+    if control_numbers is not None:
+        logger.info(
+            f"Found {control_numbers.duplicate_count} control numbers already used "
+            f"by another file"
+        )
+
+    if metrics_file:
+        metrics.REGISTRY.write(metrics_file)
+
+    if profile is not None and profile.dump_dir is not None:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            written = profile.dump_slowest(
+                lambda f: parse_file(f, export_type, Path(temp_dir))
+            )
+        logger.info(f"Wrote {len(written)} profile files to {profile.dump_dir}")
@@ -0,0 +1,421 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import io
+import logging
+import os
+import time
+from collections import namedtuple
+from functools import lru_cache
+from pathlib import Path
+
+from badx12.common import metrics, profiling
+from badx12.common.paths import file_digest
+from badx12.common.pipeline import Pipeline, Stage
+from badx12.control_numbers import extract_control_numbers
+from badx12.parser import Parser
+from badx12.utils.errors import PARSE_ERRORS
+
+from .utils import export_file, format_document, write_formatted
+
+logger = logging.getLogger(__name__)
+
+# A file that can't be read or isn't UTF-8 fails on its own, like an invalid one.
+READ_ERRORS = (OSError, UnicodeDecodeError)
+
+ParseResult = namedtuple(
+    "ParseResult",
+    [
+        "path",
+        "byte_size",
+        "sha256",
+        "output",
+        "issues",
+        "error",
+        "error_types",
+        "segment_count",
+        "transaction_set_count",
+        "parse_seconds",
+        "control_numbers",
+    ],
+)
+
+ParsedText = namedtuple(
+    "ParsedText",
+    [
+        "document",
+        "issues",
+        "error",
+        "error_types",
+        "segment_count",
+        "transaction_set_count",
+        "seconds",
+        "control_numbers",
+    ],
+)
+
+
+def parse_file(path, export_type, output_dir, cache_dir=None, cache_size=None):
+    """
+    Parse, validate and export a single file.
+    EDI errors are returned on the result rather than raised or logged so that
+    results from worker processes can be reported by the caller in order.
+    :param path: the EDI file to parse.
+    :return: a ParseResult.
+    """
+    byte_size = os.path.getsize(path)
+    sha256 = file_digest(path)
+    parsed = parse_text(path, cache_dir, cache_size)
+
+    output = None
+    if parsed.document is not None:
+        output = export_file(
+            parsed.document, export_type, output_dir, output_name(path, sha256)
+        )
+
+    return ParseResult(
+        path,
+        byte_size,
+        sha256,
+        output,
+        parsed.issues,
+        parsed.error,
+        parsed.error_types,
+        parsed.segment_count,
+        parsed.transaction_set_count,
+        parsed.seconds,
+        parsed.control_numbers,
+    )
+
+
+def warm_up():
+    """Run once in every worker so the first file doesn't pay the start up costs"""
+    Parser().document.to_dict()
+    return os.getpid()
+
+
+def report_result(result, manifest, export_type, control_number_index=None):
+    """
+    Log the errors of a result, or record it in the manifest when it was exported.
+    The result is also added to the metrics in badx12.common.metrics.REGISTRY.
+    :param control_number_index: a ControlNumberIndex to record the control numbers
+        of exported files in, control numbers used before are logged as warnings.
+    """
+    record_metrics(result)
+    if result.issues:
+        logger.error(
+            f"{result.path} contains the following errors. Issues: {result.issues}"
+        )
+    elif result.error is not None:
+        logger.error(
+            f"{result.path} caused the following error. Exception: {result.error}"
+        )
+    else:
+        manifest.add(result.path, export_type, result.sha256, result.output)
+        if control_number_index is not None:
+            record_control_numbers(result, control_number_index)
+
+
+def record_control_numbers(result, control_number_index):
+    """Add the control numbers of a result to the index and warn about duplicates"""
+    duplicates = control_number_index.add(
+        result.path, result.control_numbers, result.sha256
+    )
+    for duplicate in duplicates:
+        control_number = duplicate.control_number
+        metrics.DUPLICATE_CONTROL_NUMBERS.inc(labels=(control_number.level,))
+        logger.warning(
+            f"{result.path} reuses {control_number.level} control number "
+            f"{control_number.control_number} from {control_number.sender} to "
+            f"{control_number.receiver}, first seen in {duplicate.previous_path} "
+            f"dated {duplicate.previous_date}"
+        )
+
+
+def record_metrics(result):
+    """Count a result's file, bytes, segments, errors and parse time"""
+    if result.output is not None:
+        status = "exported"
+    elif result.issues:
+        status = "invalid"
+    else:
+        status = "failed"
+
+    metrics.FILES.inc(labels=(status,))
+    metrics.BYTES.inc(result.byte_size)
+    metrics.SEGMENTS.inc(result.segment_count)
+    metrics.TRANSACTION_SETS.inc(result.transaction_set_count)
+    for error_type in result.error_types:
+        metrics.ERRORS.inc(labels=(error_type,))
+    if result.parse_seconds is not None:
+        metrics.PARSE_SECONDS.observe(result.parse_seconds)
+
+
+def output_name(path, sha256):
+    """The deterministic output name of an input, its stem and a content hash prefix"""
+    return f"{Path(path).stem}.{sha256[:16]}"
+
+
+class Job:
+    """A file moving through the parse pipeline"""
+
+    __slots__ = (
+        "path",
+        "byte_size",
+        "sha256",
+        "text",
+        "document",
+        "payload",
+        "issues",
+        "error",
+        "error_types",
+        "segment_count",
+        "transaction_set_count",
+        "parse_seconds",
+        "control_numbers",
+        "output",
+        "seconds",
+    )
+
+    def __init__(self, path):
+        self.path = path
+        self.byte_size = 0
+        self.sha256 = None
+        self.text = None
+        self.document = None
+        self.payload = None
+        self.issues = []
+        self.error = None
+        self.error_types = []
+        self.segment_count = 0
+        self.transaction_set_count = 0
+        self.parse_seconds = None
+        self.control_numbers = []
+        self.output = None
+        self.seconds = 0.0
+
+    def failed(self):
+        return bool(self.issues) or self.error is not None
+
+    def to_result(self):
+        return ParseResult(
+            self.path,
+            self.byte_size,
+            self.sha256,
+            self.output,
+            self.issues,
+            self.error,
+            self.error_types,
+            self.segment_count,
+            self.transaction_set_count,
+            self.parse_seconds,
+            self.control_numbers,
+        )
+
+
+class ParsePipeline:
+    """
+    Parse files through overlapping read, parse, serialize and write stages.
+    Reading and writing run in threads. When jobs is greater than one a worker
+    process parses and formats each file in one call, so only the formatted
+    text comes back, otherwise parsing and serializing run in threads.
+    """
+
+    def __init__(
+        self,
+        export_type,
+        output_dir,
+        jobs=1,
+        readers=1,
+        serializers=None,
+        writers=1,
+        queue_size=8,
+        cache_dir=None,
+        cache_size=None,
+    ):
+        self.export_type = export_type.lower()
+        self.output_dir = output_dir
+        self.jobs = jobs or os.cpu_count() or 1
+        self.serializers = serializers or self.jobs
+        self.cache_dir = cache_dir
+        self.cache_size = cache_size
+        self._executor = None
+        self.profile = profiling.active()
+        stage = self._timed if self.profile is not None else lambda func: func
+        self.pipeline = Pipeline(
+            [
+                Stage("read", stage(self._read), readers),
+                Stage("parse", stage(self._parse), self.jobs),
+                Stage("serialize", stage(self._serialize), self.serializers),
+                Stage("write", stage(self._write), writers),
+            ],
+            queue_size=queue_size,
+        )
+
+    def run(self, files):
+        """
+        Parse, validate and export files.
+        :param files: an iterable of EDI file paths.
+        :return: a generator of ParseResult in the same order as files.
+        """
+        # Worker processes would keep their timings to themselves, so files are
+        # parsed in this process, on the stage threads, while profiling.
+        pool_size = max(self.jobs, self.serializers)
+        if pool_size > 1 and self.profile is None:
+            from concurrent.futures import ProcessPoolExecutor
+
+            self._executor = ProcessPoolExecutor(max_workers=pool_size)
+
+        try:
+            for job in self.pipeline.run(Job(f) for f in files):
+                if self.profile is not None:
+                    self.profile.add_file(job.path, job.seconds)
+                yield job.to_result()
+        finally:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+    def utilization(self):
+        """The share of the run each stage was busy, see Pipeline.utilization()"""
+        return self.pipeline.utilization()
+
+    @staticmethod
+    def _timed(func):
+        """Add the time each stage spends on a file to the file's total"""
+
+        def timed(job):
+            started = time.perf_counter()
+            try:
+                return func(job)
+            finally:
+                job.seconds += time.perf_counter() - started
+
+        return timed
+
+    def _call(self, func, *args):
+        if self._executor is None:
+            return func(*args)
+        return self._executor.submit(func, *args).result()
+
+    def _read(self, job):
+        try:
+            with profiling.phase("read_file"), open(job.path, "rb") as f:
+                data = f.read()
+            job.byte_size = len(data)
+            job.sha256 = hashlib.sha256(data).hexdigest()
+            # Decoded with universal newlines, like a file opened in text mode,
+            # so CRLF terminated segments don't end in a CR.
+            job.text = io.TextIOWrapper(io.BytesIO(data), encoding="utf-8").read()
+        except READ_ERRORS as e:
+            job.error = str(e)
+            job.error_types = [type(e).__name__]
+        return job
+
+    def _parse(self, job):
+        if job.failed():
+            return job
+        text, job.text = job.text, None
+        if self._executor is not None and self.export_type != "sqlite":
+            parsed, job.payload = self._call(
+                parse_and_format,
+                text,
+                self.export_type,
+                self.cache_dir,
+                self.cache_size,
+            )
+        else:
+            parsed = self._call(parse_text, text, self.cache_dir, self.cache_size)
+        job.document, job.issues, job.error = parsed[:3]
+        job.error_types = parsed.error_types
+        job.segment_count = parsed.segment_count
+        job.transaction_set_count = parsed.transaction_set_count
+        job.parse_seconds = parsed.seconds
+        job.control_numbers = parsed.control_numbers
+        return job
+
+    def _serialize(self, job):
+        if job.document is not None and self.export_type != "sqlite":
+            job.payload = self._call(format_document, job.document, self.export_type)
+            job.document = None
+        return job
+
+    def _write(self, job):
+        if job.failed():
+            return job
+
+        name = output_name(job.path, job.sha256)
+        if job.payload is not None:
+            job.output = write_formatted(
+                job.payload, self.export_type, self.output_dir, name
+            )
+        else:
+            job.output = export_file(
+                job.document, self.export_type, self.output_dir, name
+            )
+
+        job.payload = job.document = None
+        return job
+
+
+def parse_text(text, cache_dir=None, cache_size=None):
+    """
+    Parse and validate a document.
+    :param text: the document text, or the path of an EDI file.
+    :return: a ParsedText, its document is None when the text couldn't be parsed
+    or isn't valid.
+    """
+    cache = _get_cache(cache_dir, cache_size) if cache_dir else None
+    started = time.perf_counter()
+    try:
+        document = Parser(text, cache=cache).document
+        report = document.validate()
+    except PARSE_ERRORS as e:
+        seconds = time.perf_counter() - started
+        return ParsedText(None, [], e.msg, [type(e).__name__], 0, 0, seconds, [])
+
+    seconds = time.perf_counter() - started
+    stats = document.stats
+    if not report.is_document_valid():
+        return ParsedText(
+            None,
+            [error.msg for error in report.error_list],
+            None,
+            [type(error).__name__ for error in report.error_list],
+            stats.segment_count,
+            stats.transaction_set_count,
+            seconds,
+            [],
+        )
+
+    return ParsedText(
+        document,
+        [],
+        None,
+        [],
+        stats.segment_count,
+        stats.transaction_set_count,
+        seconds,
+        extract_control_numbers(document),
+    )
+
+
+def parse_and_format(text, export_type, cache_dir=None, cache_size=None):
+    """
+    Parse, validate and format a document in one call, so that a worker process
+    sends back the formatted text instead of the document.
+    :return: a (ParsedText without its document, formatted text) tuple, the
+        text is None when the document couldn't be parsed or isn't valid.
+    """
+    parsed = parse_text(text, cache_dir, cache_size)
+    if parsed.document is None:
+        return parsed, None
+    payload = format_document(parsed.document, export_type)
+    return parsed._replace(document=None), payload
+
+
+@lru_cache(maxsize=None)
+def _get_cache(cache_dir, cache_size):
+    """One cache per process, so the cache size is only measured once per worker"""
+    from badx12.cache import ParseCache
+
+    return ParseCache(cache_dir, cache_size)
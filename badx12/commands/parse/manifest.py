@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+import os
+import sqlite3
+import time
+
+from badx12.common.paths import file_digest
+
+MANIFEST_NAME = ".badx12-manifest.db"
+MANIFEST_BATCH_SIZE = 100
+
+
+class Manifest:
+    """
+    A record of the files already exported to an output directory.
+    Files are matched on path and export type, then on size and mtime, and
+    only hashed when those changed, so unchanged files are skipped with a stat.
+    """
+
+    def __init__(self, output_dir):
+        self.path = output_dir / MANIFEST_NAME
+        self.skipped = 0
+        self._pending = []
+        self._connection = sqlite3.connect(str(self.path))
+        with self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                "path TEXT, "
+                "export_type TEXT, "
+                "size INTEGER, "
+                "mtime_ns INTEGER, "
+                "sha256 TEXT, "
+                "output TEXT, "
+                "processed_at REAL, "
+                "PRIMARY KEY (path, export_type))"
+            )
+
+    def pending(self, files, export_type):
+        """
+        Filter out the files that were already exported.
+        :param files: an iterable of input paths.
+        :param export_type: the export type being produced.
+        :return: a generator of the paths that still need processing.
+        """
+        for path in files:
+            if self.is_done(path, export_type):
+                self.skipped += 1
+            else:
+                yield path
+
+    def is_done(self, path, export_type):
+        """Determine if a file was already exported unchanged"""
+        row = self._connection.execute(
+            "SELECT size, mtime_ns, sha256, output FROM files "
+            "WHERE path = ? AND export_type = ?",
+            (_key(path), export_type),
+        ).fetchone()
+        if row is None:
+            return False
+
+        size, mtime_ns, sha256, output = row
+        if not os.path.exists(output):
+            return False
+
+        stat = os.stat(path)
+        if (stat.st_size, stat.st_mtime_ns) == (size, mtime_ns):
+            return True
+
+        if stat.st_size == size and file_digest(path) == sha256:
+            self.add(path, export_type, sha256, output)
+            return True
+
+        return False
+
+    def add(self, path, export_type, sha256, output):
+        """Record an exported file, records are written in batches"""
+        stat = os.stat(path)
+        self._pending.append(
+            (
+                _key(path),
+                export_type,
+                stat.st_size,
+                stat.st_mtime_ns,
+                sha256,
+                str(output),
+                time.time(),
+            )
+        )
+        if len(self._pending) >= MANIFEST_BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        """Write the pending records"""
+        with self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?)",
+                self._pending,
+            )
+        self._pending = []
+
+    def close(self):
+        self.flush()
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _key(path):
+    return os.path.abspath(str(path))
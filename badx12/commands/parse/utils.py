@@ -1,37 +1,159 @@
 # -*- coding: utf-8 -*-
+import csv
+import io
 import json
 import logging
-import time
+import os
+import sqlite3
+import tempfile
+from itertools import islice
 
-from dicttoxml import dicttoxml  # type: ignore
+from badx12.common import profiling
+from badx12.document import Record
 
-logging.getLogger("dicttoxml").setLevel(logging.WARNING)
+SQLITE_BATCH_SIZE = 5000
 
 
-def export_file(dict_obj, export_type=None, output_dir=None):
-    obj, output_path = _parse_params(dict_obj, export_type, output_dir)
-    with open(output_path, "w") as f:
+def export_file(document, export_type, output_dir, name):
+    """
+    Export a document to output_dir / name.export_type.
+    The output is written to a temporary file first and moved in place, so an
+    interrupted export never leaves a partial file behind.
+    :return: the path of the exported file.
+    """
+    export_type, output_path = _parse_params(export_type, output_dir, name)
+    func = {"json": _json, "xml": _xml, "csv": _csv, "sqlite": _sqlite}.get(
+        export_type, _json
+    )
+    _atomic_write(output_dir, output_path, lambda temp_path: func(document, temp_path))
+
+    return output_path
+
+
+def write_formatted(obj, export_type, output_dir, name):
+    """
+    Write the output of format_document() to output_dir / name.export_type, atomically.
+    :return: the path of the exported file.
+    """
+    export_type, output_path = _parse_params(export_type, output_dir, name)
+    newline = "" if export_type == "csv" else None
+    _atomic_write(
+        output_dir, output_path, lambda temp_path: _write_text(obj, temp_path, newline)
+    )
+
+    return output_path
+
+
+def _atomic_write(output_dir, output_path, write):
+    """Call write with a temporary path, then move the result to output_path"""
+    fd, temp_path = tempfile.mkstemp(dir=str(output_dir), prefix=".", suffix=".tmp")
+    os.close(fd)
+    try:
+        write(temp_path)
+        os.replace(temp_path, str(output_path))
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+def _parse_params(export_type, output_dir, name):
+    output_dir.mkdir(exist_ok=True)
+    export_type = (export_type or "json").lower()
+    file_name = f"{name}.{export_type}"
+
+    output_path = output_dir / file_name
+
+    return export_type, output_path
+
+
+def format_document(document, export_type):
+    """
+    Format a document as JSON, XML or CSV text.
+    :return: the formatted document as a string.
+    """
+    export_type = export_type.lower()
+    if export_type == "csv":
+        out = io.StringIO()
+        with profiling.phase("encode"):
+            _write_csv(document, out)
+        return out.getvalue()
+
+    obj = {"json": _json_text, "xml": _xml_text}[export_type](document)
+    if isinstance(obj, bytes):
+        obj = obj.decode("utf-8")
+
+    return obj
+
+
+def _json_text(document):
+    obj = document.to_dict()
+    with profiling.phase("encode"):
+        return json.dumps(obj, indent=2)
+
+
+def _xml_text(document):
+    # dicttoxml is slow to import and only needed for XML exports.
+    from dicttoxml import dicttoxml  # type: ignore
+
+    logging.getLogger("dicttoxml").setLevel(logging.WARNING)
+    obj = document.to_dict()
+    with profiling.phase("encode"):
+        return dicttoxml(obj)
+
+
+def _write_text(obj, output_path, newline=None):
+    with profiling.phase("write"), open(output_path, "w", newline=newline) as f:
         if isinstance(obj, bytes):
             obj = obj.decode("utf-8")
 
         f.write(obj)
 
 
-def _parse_params(dict_obj, export_type, output_dir):
-    output_dir.mkdir(exist_ok=True)
-    file_name = f"{int(time.time())}.{export_type.lower()}"
+def _json(document, output_path):
+    _write_text(_json_text(document), output_path)
 
-    func = {"json": _json, "xml": _xml}.get(export_type.lower(), "json")
 
-    output_path = output_dir / file_name
-    obj = func(dict_obj)
+def _xml(document, output_path):
+    _write_text(_xml_text(document), output_path)
+
+
+def _csv(document, output_path):
+    with profiling.phase("write"), open(output_path, "w", newline="") as f:
+        _write_csv(document, f)
+
+
+def _write_csv(document, f):
+    writer = csv.writer(f)
+    writer.writerow(Record._fields)
+    writer.writerows(document.to_records())
 
-    return obj, output_path
 
+def _sqlite(document, output_path):
+    with profiling.phase("write"):
+        _write_sqlite(document, output_path)
 
-def _json(dict_obj):
-    return json.dumps(dict_obj, indent=2)
 
+def _write_sqlite(document, output_path):
+    connection = sqlite3.connect(str(output_path))
+    try:
+        with connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS records ("
+                "interchange_control_number TEXT, "
+                "group_control_number TEXT, "
+                "transaction_set_control_number TEXT, "
+                "segment_ordinal INTEGER, "
+                "segment_id TEXT, "
+                "element_position INTEGER, "
+                "value TEXT)"
+            )
 
-def _xml(dict_obj):
-    return dicttoxml(dict_obj)
+        records = document.to_records()
+        insert = f"INSERT INTO records VALUES ({', '.join('?' * len(Record._fields))})"
+        with connection:
+            batch = list(islice(records, SQLITE_BATCH_SIZE))
+            while batch:
+                connection.executemany(insert, batch)
+                batch = list(islice(records, SQLITE_BATCH_SIZE))
+    finally:
+        connection.close()
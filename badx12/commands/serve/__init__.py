@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+import logging
+import os
+
+import click
+
+logger = logging.getLogger(__name__)
+
+
+@click.command(
+    "serve", help="Serve parse, validate and convert requests over local HTTP"
+)
+@click.option(
+    "--host", default="127.0.0.1", show_default=True, help="Address to listen on."
+)
+@click.option(
+    "-p", "--port", default=8712, show_default=True, type=int, help="Port to listen on."
+)
+@click.option(
+    "-s",
+    "--socket",
+    "socket_path",
+    default=None,
+    type=click.Path(dir_okay=False),
+    help="Listen on a unix domain socket instead of a TCP port.",
+)
+@click.option(
+    "-j",
+    "--jobs",
+    default=0,
+    show_default=True,
+    type=click.IntRange(min=0),
+    help="Number of pre-forked worker processes, 0 uses one per CPU.",
+)
+def serve(host, port, socket_path, jobs):
+    # Imported here, listing the commands in --help doesn't load the server.
+    from concurrent.futures import ProcessPoolExecutor
+
+    from badx12.commands.parse.batch import warm_up
+
+    from .server import make_server
+
+    jobs = jobs or os.cpu_count() or 1
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        pids = [f.result() for f in [executor.submit(warm_up) for _ in range(jobs)]]
+        server = make_server(executor, jobs, host, port, socket_path)
+        where = socket_path or "http://{}:{}".format(*server.server_address[:2])
+        logger.info(f"Serving on {where} with {len(set(pids))} workers")
+
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            logger.info("Stopping")
+        finally:
+            server.server_close()
+            if socket_path is not None and os.path.exists(socket_path):
+                os.remove(socket_path)
@@ -0,0 +1,295 @@
+# -*- coding: utf-8 -*-
+import io
+import json
+import logging
+import os
+import tempfile
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn, UnixStreamServer
+from urllib.parse import parse_qs, urlparse
+
+from badx12.commands.parse.utils import format_document
+from badx12.common import metrics
+from badx12.parser import Parser
+from badx12.utils.errors import PARSE_ERRORS
+
+logger = logging.getLogger(__name__)
+
+READ_CHUNK_SIZE = 1024 * 1024
+SPOOL_THRESHOLD = 8 * 1024 * 1024
+CONVERT_TYPES = {
+    "json": "application/json",
+    "xml": "application/xml",
+    "csv": "text/csv",
+}
+PROMETHEUS_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+REQUESTS = metrics.Counter(
+    "badx12_requests_total",
+    "Requests handled by the service, by action and status.",
+    label_names=("action", "status"),
+)
+REQUEST_SECONDS = metrics.Histogram(
+    "badx12_request_seconds",
+    "Time to handle a request, including the worker.",
+    label_names=("action",),
+)
+
+
+class RequestError(Exception):
+    """Exception raised for requests the service can't handle.
+    Attributes:
+        status -- the HTTP status to respond with
+        msg  -- explanation of the error
+    """
+
+    def __init__(self, status, msg):
+        self.status = status
+        self.msg = msg
+
+
+def run_request(action, export_type=None, data=None, path=None):
+    """
+    Parse a document and build the response body, this runs in a worker process.
+    :param action: one of parse, validate, convert or records.
+    :param data: the document bytes, for small bodies.
+    :param path: a spooled file holding the document, for large bodies.
+    :return: a (status, content type, body bytes, worker seconds) tuple.
+    """
+    started = time.perf_counter()
+    try:
+        if data is not None:
+            # Universal newlines, like the spooled file opened in text mode.
+            text = io.TextIOWrapper(io.BytesIO(data), encoding="utf-8").read()
+            if os.path.exists(text):
+                raise RequestError(400, "The request body must be EDI text.")
+            document = Parser(text).document
+        else:
+            document = Parser(path).document
+
+        if action == "validate":
+            report = document.validate()
+            body = _json_body(
+                {
+                    "valid": report.is_document_valid(),
+                    "errors": [
+                        {"type": type(error).__name__, "msg": error.msg}
+                        for error in report.error_list
+                    ],
+                }
+            )
+            content_type = "application/json"
+        elif action == "records":
+            body = "".join(
+                json.dumps(record._asdict()) + "\n" for record in document.to_records()
+            ).encode("utf-8")
+            content_type = "application/x-ndjson"
+        elif action == "convert":
+            body = format_document(document, export_type).encode("utf-8")
+            content_type = CONVERT_TYPES[export_type]
+        else:
+            body = _json_body(document.to_dict())
+            content_type = "application/json"
+
+        status = 200
+
+    except PARSE_ERRORS as e:
+        status, content_type = 422, "application/json"
+        body = _json_body({"error": type(e).__name__, "msg": e.msg})
+    except RequestError as e:
+        status, content_type = e.status, "application/json"
+        body = _json_body({"error": type(e).__name__, "msg": e.msg})
+    except UnicodeDecodeError as e:
+        status, content_type = 400, "application/json"
+        body = _json_body(
+            {"error": type(e).__name__, "msg": "The request body must be UTF-8 text."}
+        )
+
+    return status, content_type, body, time.perf_counter() - started
+
+
+def _json_body(obj):
+    return json.dumps(obj).encode("utf-8")
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    """Route requests to the worker pool held by the server"""
+
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately, Nagle would hold the body back
+    # until the client's delayed ack on every keep-alive request.
+    disable_nagle_algorithm = True
+    actions = ("parse", "validate", "convert", "records")
+
+    def setup(self):
+        if not isinstance(self.client_address, tuple):
+            # TCP_NODELAY can't be set on unix domain sockets.
+            self.disable_nagle_algorithm = False
+        super().setup()
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == "/metrics":
+            body = metrics.REGISTRY.to_prometheus().encode("utf-8")
+            return self._send(200, PROMETHEUS_TYPE, body)
+
+        if path != "/health":
+            return self._send_error(RequestError(404, f"Unknown path {self.path}"))
+
+        self._send(
+            200,
+            "application/json",
+            _json_body({"status": "ok", "workers": self.server.workers}),
+        )
+
+    def do_POST(self):
+        started = time.perf_counter()
+        url = urlparse(self.path)
+        action = url.path.strip("/")
+        spooled = None
+        length = self.headers.get("Content-Length")
+        # The body bytes not read yet, drained before an early response.
+        self._unread = int(length) if length and length.isdigit() else 0
+
+        try:
+            if action not in self.actions:
+                raise RequestError(404, f"Unknown path {url.path}")
+
+            export_type = parse_qs(url.query).get("format", ["json"])[0].lower()
+            if action == "convert" and export_type not in CONVERT_TYPES:
+                raise RequestError(400, f"Unsupported format {export_type}")
+
+            if length is None:
+                raise RequestError(411, "A Content-Length header is required.")
+            if not length.isdigit():
+                self.close_connection = True
+                raise RequestError(400, "The Content-Length header must be a number.")
+
+            data, spooled = self._read_body(self._unread)
+            future = self.server.executor.submit(
+                run_request, action, export_type, data=data, path=spooled
+            )
+            status, content_type, body, worker_time = future.result()
+
+        except RequestError as e:
+            self._discard_body()
+            self._count(action, e.status, started)
+            return self._send_error(e)
+
+        except Exception:
+            logger.exception(f"{self.command} {self.path} failed")
+            self._discard_body()
+            self._count(action, 500, started)
+            return self._send_error(RequestError(500, "The request failed."))
+
+        finally:
+            if spooled is not None:
+                os.remove(spooled)
+
+        total_time = self._count(action, status, started)
+        self._send(
+            status,
+            content_type,
+            body,
+            {
+                "X-Badx12-Worker-Time": f"{worker_time * 1000:.3f}",
+                "X-Badx12-Overhead-Time": f"{(total_time - worker_time) * 1000:.3f}",
+            },
+        )
+
+    def _count(self, action, status, started):
+        """Add a request to the service metrics, unknown paths are counted as one action"""
+        action = action if action in self.actions else "unknown"
+        seconds = time.perf_counter() - started
+        REQUESTS.inc(labels=(action, status))
+        REQUEST_SECONDS.observe(seconds, labels=(action,))
+        return seconds
+
+    def _read_body(self, length):
+        """
+        Read the request body in chunks.
+        Bodies over SPOOL_THRESHOLD are spooled to a temporary file which the
+        worker reads directly instead of receiving the text through a pipe.
+        :return: a (bytes, spooled file path) tuple, one of which is None.
+        """
+        if length <= SPOOL_THRESHOLD:
+            data = self.rfile.read(length)
+            self._unread -= len(data)
+            return data, None
+
+        fd, path = tempfile.mkstemp(prefix="badx12-", suffix=".edi")
+        with os.fdopen(fd, "wb") as f:
+            remaining = length
+            while remaining:
+                chunk = self.rfile.read(min(READ_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                f.write(chunk)
+                remaining -= len(chunk)
+                self._unread -= len(chunk)
+
+        return None, path
+
+    def _discard_body(self):
+        """Drain the rest of the body so the connection stays usable"""
+        while self._unread > 0:
+            chunk = self.rfile.read(min(READ_CHUNK_SIZE, self._unread))
+            if not chunk:
+                break
+            self._unread -= len(chunk)
+
+    def _send_error(self, error):
+        self._send(
+            error.status,
+            "application/json",
+            _json_body({"error": type(error).__name__, "msg": error.msg}),
+        )
+
+    def _send(self, status, content_type, body, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        if isinstance(self.client_address, tuple):
+            return self.client_address[0]
+        return "unix"
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} {format % args}")
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class ThreadingUnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+    def server_bind(self):
+        UnixStreamServer.server_bind(self)
+        self.server_name = "localhost"
+        self.server_port = 0
+
+
+def make_server(executor, workers, host="127.0.0.1", port=0, socket_path=None):
+    """
+    Create the HTTP server, on a unix domain socket when socket_path is given.
+    :param executor: the pool of worker processes requests are handed to.
+    :param workers: the number of workers in the pool.
+    """
+    if socket_path is not None:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = ThreadingUnixHTTPServer(socket_path, ServiceHandler)
+    else:
+        server = ThreadingHTTPServer((host, port), ServiceHandler)
+
+    server.executor = executor
+    server.workers = workers
+    return server
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+import logging
+from pathlib import Path
+
+import click
+
+from badx12.utils.errors import PARSE_ERRORS
+
+from .splitter import MAX_CONTROL_NUMBER, SPLIT_KEYS, Splitter
+
+logger = logging.getLogger(__name__)
+
+
+@click.command(
+    "split",
+    help="Split an EDI file into files of fewer transaction sets, each with a new envelope",
+)
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option(
+    "-n",
+    "--per-file",
+    default=None,
+    type=click.IntRange(min=1),
+    help="Number of transaction sets in each output file.",
+)
+@click.option(
+    "--by",
+    default=None,
+    type=click.Choice(SPLIT_KEYS),
+    help="Write the transaction sets of each ST01, or of each ISA sender and "
+    "receiver, to their own files.",
+)
+@click.option(
+    "-o",
+    "--output_dir",
+    default=None,
+    type=click.Path(exists=True, file_okay=False, dir_okay=True),
+    help="Specify an output directory, the input file's directory by default.",
+)
+@click.option(
+    "--control-number",
+    default=1,
+    show_default=True,
+    type=click.IntRange(min=1, max=MAX_CONTROL_NUMBER),
+    help="ISA13 of the first output file, the next files count up from it.",
+)
+def split(path, per_file, by, output_dir, control_number):
+    if per_file is None and by is None:
+        raise click.UsageError("Give --per-file, --by or both.")
+
+    path = Path(path)
+    splitter = Splitter(
+        output_dir or path.parent,
+        per_file=per_file,
+        by=by,
+        control_number=control_number,
+        prefix=path.stem,
+    )
+    try:
+        files = splitter.split(path)
+    except PARSE_ERRORS as e:
+        raise click.ClickException(f"Can't split {path}: {e.msg}")
+
+    for file in files:
+        click.echo(f"{file.path}:{file.transaction_set_count}")
+    logger.info(
+        f"Wrote {sum(file.transaction_set_count for file in files)} transaction sets "
+        f"from {path} to {len(files)} files"
+    )
@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""
+Split an interchange into files of fewer transaction sets.
+
+The input is read one segment at a time and each transaction set is copied to
+its output file as it's read, so memory use doesn't depend on the size of the
+input or of its transaction sets. Every output file gets a new ISA/GS/GE/IEA
+envelope from InterchangeWriter with its own counts and control numbers, and
+the transaction sets of each group are numbered from 1. Body segments are
+copied as they are, with the separators of the input.
+"""
+
+import re
+from collections import namedtuple
+from pathlib import Path
+
+from badx12.stream import SegmentReader
+from badx12.utils.errors import SegmentCountError
+from badx12.writer import InterchangeWriter
+
+BY_ST01 = "ST01"
+BY_PARTNER = "partner"
+SPLIT_KEYS = (BY_ST01, BY_PARTNER)
+
+MAX_CONTROL_NUMBER = 999999999
+
+SplitFile = namedtuple("SplitFile", ["path", "transaction_set_count"])
+
+_UNSAFE = re.compile(r"[^A-Za-z0-9._-]+")
+
+
+class _Output:
+    """An open output file and the source envelopes it was opened for"""
+
+    __slots__ = ("writer", "path", "interchange", "group", "transaction_set_count")
+
+    def __init__(self, writer, path, interchange):
+        self.writer = writer
+        self.path = path
+        self.interchange = interchange
+        self.group = None
+        self.transaction_set_count = 0
+
+
+class Splitter:
+    def __init__(
+        self, output_dir, per_file=None, by=None, control_number=1, prefix="split"
+    ):
+        """
+        Create a new Splitter.
+        :param output_dir: the directory to write the output files to.
+        :param per_file: the most transaction sets in an output file, unlimited
+            by default.
+        :param by: write the transaction sets of each ST01, or of each ISA sender
+            and receiver, to their own files, one of SPLIT_KEYS.
+        :param control_number: the ISA13 of the first output file, the next
+            files count up from it.
+        :param prefix: the start of the output file names, followed by the
+            split key and a sequence number.
+        """
+        if by is not None and by not in SPLIT_KEYS:
+            raise ValueError(f"by must be one of {SPLIT_KEYS}, got {by!r}")
+        self.output_dir = Path(output_dir)
+        self.per_file = per_file
+        self.by = by
+        self.control_number = control_number
+        self.prefix = prefix
+        self._started = []
+        self._file_numbers = {}
+
+    def split(self, source):
+        """
+        Split an interchange, files holding several interchanges are split too.
+        :param source: the path of an x12 file, x12 text, or a binary file object.
+        :return: a list of SplitFile, in the order the files were started,
+            including the files of earlier calls.
+        """
+        reader = SegmentReader(source)
+        element_separator = reader.element_separator
+        st_prefix = "ST" + element_separator
+        segments = iter(reader)
+        outputs = {}
+        isa = gs = None
+        try:
+            for segment in segments:
+                if segment.startswith(st_prefix):
+                    st = segment.split(element_separator)
+                    output = self._output(outputs, reader, isa, gs, st)
+                    self._copy_transaction_set(output, st, segments, element_separator)
+                elif segment.startswith("ISA"):
+                    isa = _elements(segment, element_separator, 16)
+                elif segment.startswith("GS"):
+                    gs = _elements(segment, element_separator, 8)
+        except BaseException:
+            for output in outputs.values():
+                output.writer.abort()
+            raise
+        finally:
+            reader.close()
+
+        for output in outputs.values():
+            output.writer.close()
+        return [
+            SplitFile(output.path, output.transaction_set_count)
+            for output in self._started
+        ]
+
+    def _output(self, outputs, reader, isa, gs, st):
+        """:return: the output for a transaction set, opening a new file when needed."""
+        if isa is None or gs is None:
+            raise SegmentCountError(
+                segment="ST", msg="Found a transaction set outside of an ISA and GS"
+            )
+
+        if self.by == BY_ST01:
+            key = st[1]
+        elif self.by == BY_PARTNER:
+            key = f"{isa[6].strip()}-{isa[8].strip()}"
+        else:
+            key = None
+
+        # The sender, receiver, version and usage of the interchange.
+        interchange = (isa[5], isa[6], isa[7], isa[8], isa[12], isa[14], isa[15])
+        output = outputs.get(key)
+        if (
+            output is None
+            or output.interchange != interchange
+            or (self.per_file and output.transaction_set_count >= self.per_file)
+        ):
+            if output is not None:
+                output.writer.close()
+            output = outputs[key] = self._open(key, reader, isa, interchange)
+
+        group = (gs[1], gs[2], gs[3], gs[7], gs[8])
+        if output.group != group:
+            if output.group is not None:
+                output.writer.close_group()
+            output.writer.open_group(
+                gs[1], gs[2], gs[3], gs[8], responsible_agency=gs[7]
+            )
+            output.group = group
+        return output
+
+    def _open(self, key, reader, isa, interchange):
+        name = self.prefix if key is None else f"{self.prefix}-{_UNSAFE.sub('_', key)}"
+        number = self._file_numbers[name] = self._file_numbers.get(name, 0) + 1
+        path = self.output_dir / f"{name}-{number:04}.edi"
+
+        writer = InterchangeWriter(
+            path,
+            element_separator=reader.element_separator,
+            segment_terminator=reader.segment_terminator,
+            sub_element_separator=reader.sub_element_separator,
+            repetition_separator=isa[11],
+        )
+        writer.open_interchange(
+            isa[6].strip(),
+            isa[8].strip(),
+            self.control_number,
+            sender_qualifier=isa[5],
+            receiver_qualifier=isa[7],
+            version=isa[12],
+            acknowledgment_requested=isa[14],
+            usage_indicator=isa[15],
+        )
+        self.control_number = self.control_number % MAX_CONTROL_NUMBER + 1
+        output = _Output(writer, path, interchange)
+        self._started.append(output)
+        return output
+
+    def _copy_transaction_set(self, output, st, segments, element_separator):
+        se_prefix = "SE" + element_separator
+        ended = []
+
+        def body():
+            for segment in segments:
+                if segment.startswith(se_prefix) or segment == "SE":
+                    ended.append(segment)
+                    return
+                yield segment
+
+        reference = st[3] if len(st) > 3 else None
+        output.writer.add_transaction_set(st[1], body(), reference=reference)
+        if not ended:
+            raise SegmentCountError(
+                segment="SE",
+                msg=f"The transaction set with ST02 {st[2]} ends without an SE segment",
+            )
+        output.transaction_set_count += 1
+
+
+def _elements(segment, element_separator, count):
+    """:return: the segment id and elements of an envelope header."""
+    elements = segment.split(element_separator)
+    if len(elements) <= count:
+        raise SegmentCountError(
+            segment=elements[0],
+            msg=f"Expected {count} elements in {elements[0]}, found {len(elements) - 1}",
+        )
+    return elements
@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+import logging
+import os
+import time
+from functools import partial
+from pathlib import Path
+
+import click
+
+from badx12.common.paths import OUTPUT_DIR
+
+logger = logging.getLogger(__name__)
+
+BUSY_POLL_INTERVAL = 0.05
+
+
+@click.command("watch", help="Watch a directory and parse EDI files as they arrive")
+@click.argument("path", type=click.Path(exists=True, file_okay=False))
+@click.option(
+    "-e",
+    "--export_type",
+    default="JSON",
+    type=click.Choice(["JSON", "XML", "CSV", "SQLITE"]),
+    help="Specify the file output type.",
+)
+@click.option(
+    "-o",
+    "--output_dir",
+    default=None,
+    type=click.Path(exists=True, file_okay=False, dir_okay=True),
+    help="Specify an output directory.",
+)
+@click.option(
+    "-j",
+    "--jobs",
+    default=1,
+    show_default=True,
+    type=click.IntRange(min=0),
+    help="Number of warm worker processes, 0 uses one per CPU.",
+)
+@click.option(
+    "--interval",
+    default=1.0,
+    show_default=True,
+    type=click.FloatRange(min=0.01),
+    help="Seconds between directory scans.",
+)
+@click.option(
+    "--settle",
+    default=1.0,
+    show_default=True,
+    type=click.FloatRange(min=0),
+    help="Seconds a file's size must stay unchanged before it is parsed.",
+)
+@click.option(
+    "-r", "--recursive", is_flag=True, help="Watch the files in sub directories too."
+)
+@click.option(
+    "--include",
+    multiple=True,
+    help="Only parse files matching this glob pattern, can be repeated.",
+)
+@click.option(
+    "--exclude",
+    multiple=True,
+    help="Skip files and directories matching this glob pattern, can be repeated.",
+)
+@click.option(
+    "--once", is_flag=True, help="Parse the files already present, then exit."
+)
+@click.option(
+    "--metrics-file",
+    default=None,
+    type=click.Path(dir_okay=False),
+    help="Keep file, byte, segment and error counts here in the Prometheus text format.",
+)
+@click.option(
+    "--control-number-db",
+    default=None,
+    type=click.Path(dir_okay=False),
+    help="Record ISA13, GS06 and ST02 control numbers in this SQLite database "
+    "and warn about ones already used by another file.",
+)
+def watch(
+    path,
+    export_type,
+    output_dir,
+    jobs,
+    interval,
+    settle,
+    recursive,
+    include,
+    exclude,
+    once,
+    metrics_file,
+    control_number_db,
+):
+    # Imported here, listing the commands in --help doesn't load the pipeline.
+    from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+    from badx12.commands.parse.batch import (
+        ParseResult,
+        parse_file,
+        report_result,
+        warm_up,
+    )
+    from badx12.commands.parse.manifest import Manifest
+    from badx12.common import metrics
+    from badx12.control_numbers import ControlNumberIndex
+
+    from .watcher import DirectoryWatcher
+
+    output_dir = Path(output_dir) if output_dir else OUTPUT_DIR
+    output_dir.mkdir(exist_ok=True)
+    jobs = jobs or os.cpu_count() or 1
+    max_in_flight = jobs * 2
+
+    watcher = DirectoryWatcher(
+        path,
+        settle=0 if once else settle,
+        recursive=recursive,
+        include=include,
+        exclude=exclude,
+    )
+    func = partial(parse_file, export_type=export_type, output_dir=output_dir)
+    manifest = Manifest(output_dir)
+    control_numbers = (
+        ControlNumberIndex(control_number_db) if control_number_db else None
+    )
+    in_flight = {}
+    counts = {"files": 0, "failed": 0}
+
+    def handle(done):
+        for future in done:
+            file, detected = in_flight.pop(future)
+            try:
+                result = future.result()
+            except Exception as e:
+                # A file the parser chokes on fails alone, the watch goes on.
+                result = ParseResult(
+                    file, 0, None, None, [], str(e), [type(e).__name__], 0, 0, None, []
+                )
+            report_result(result, manifest, export_type, control_numbers)
+            counts["files"] += 1
+            counts["failed"] += result.output is None
+            logger.debug(
+                f"{result.path} handled in {(time.monotonic() - detected) * 1000:.1f}ms"
+            )
+        manifest.flush()
+        if control_numbers is not None:
+            control_numbers.flush()
+        if done and metrics_file:
+            metrics.REGISTRY.write(metrics_file)
+
+    logger.info(f"Watching {path} with {jobs} workers, export as {export_type}")
+    started = time.perf_counter()
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor, manifest:
+        for future in [executor.submit(warm_up) for _ in range(jobs)]:
+            future.result()
+
+        try:
+            while True:
+                for file in watcher.poll():
+                    if manifest.is_done(file, export_type):
+                        continue
+
+                    # Backpressure, files wait on disk until a worker frees up.
+                    while len(in_flight) >= max_in_flight:
+                        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                        handle(done)
+
+                    in_flight[executor.submit(func, file)] = (file, time.monotonic())
+
+                done, _ = wait(in_flight, timeout=0)
+                handle(done)
+
+                if once and not watcher.has_candidates():
+                    handle(wait(in_flight).done)
+                    break
+
+                watcher.wait(
+                    min(interval, BUSY_POLL_INTERVAL) if in_flight else interval
+                )
+
+        except KeyboardInterrupt:
+            logger.info("Stopping, waiting for the files in progress")
+            handle(wait(in_flight).done)
+
+        finally:
+            watcher.close()
+            if control_numbers is not None:
+                control_numbers.close()
+
+    logger.info(
+        f"Parsed {counts['files']} files ({counts['failed']} failed) in "
+        f"{time.perf_counter() - started:.2f}s"
+    )
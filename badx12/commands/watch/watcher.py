@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import time
+from pathlib import Path
+
+from badx12.common.paths import iter_files
+
+logger = logging.getLogger(__name__)
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CLOEXEC = 0o2000000
+IN_NONBLOCK = 0o4000
+
+_EVENT = struct.Struct("iIII")
+
+
+class Inotify:
+    """
+    A minimal inotify reader for the files closed after writing or moved into
+    a directory. Only available on Linux, see open_inotify().
+    """
+
+    def __init__(self, directory):
+        self.directory = str(directory)
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        watch = libc.inotify_add_watch(
+            self.fd, os.fsencode(self.directory), IN_CLOSE_WRITE | IN_MOVED_TO
+        )
+        if watch < 0:
+            os.close(self.fd)
+            raise OSError(ctypes.get_errno(), "inotify_add_watch failed")
+
+    def wait(self, timeout):
+        """
+        Block until files are completed or the timeout expires.
+        :param timeout: the maximum number of seconds to wait.
+        :return: a set of the Path of each file completed since the last call.
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return set()
+
+        paths = set()
+        offset = 0
+        while offset < len(data):
+            _, _, _, length = _EVENT.unpack_from(data, offset)
+            offset += _EVENT.size
+            name = data[offset : offset + length].rstrip(b"\0")
+            offset += length
+            if name:
+                paths.add(Path(self.directory, os.fsdecode(name)))
+        return paths
+
+    def close(self):
+        os.close(self.fd)
+
+
+def open_inotify(directory):
+    """Return an Inotify for the directory, or None where inotify isn't available"""
+    try:
+        return Inotify(directory)
+    except (OSError, AttributeError, TypeError) as e:
+        logger.debug(f"inotify is not available, falling back to polling. {e}")
+        return None
+
+
+class DirectoryWatcher:
+    """
+    Detect the files in a directory that are complete and haven't been handled.
+    A file is complete once its size and mtime stayed the same for settle
+    seconds, or as soon as inotify reports it was closed after writing.
+    """
+
+    def __init__(
+        self,
+        directory,
+        settle=1.0,
+        recursive=False,
+        include=(),
+        exclude=(),
+        use_inotify=True,
+    ):
+        self.directory = directory
+        self.settle = settle
+        self.recursive = recursive
+        self.include = include
+        self.exclude = exclude
+        self.inotify = open_inotify(directory) if use_inotify else None
+        self._candidates = {}
+        self._handled = {}
+        self._completed = set()
+
+    def poll(self):
+        """
+        Scan the directory once.
+        :return: a list of the files that became ready since the last poll.
+        """
+        now = time.monotonic()
+        ready = []
+        seen = set()
+        files = iter_files(
+            self.directory,
+            recursive=self.recursive,
+            include=self.include,
+            exclude=self.exclude,
+        )
+
+        # Files are keyed by Path, like the paths inotify reports.
+        for path in files:
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+
+            signature = (stat.st_size, stat.st_mtime_ns)
+            seen.add(path)
+            if self._handled.get(path) == signature:
+                continue
+
+            if path not in self._completed and self.settle > 0:
+                candidate = self._candidates.get(path)
+                if candidate is None or candidate[0] != signature:
+                    self._candidates[path] = (signature, now)
+                    continue
+                if now - candidate[1] < self.settle:
+                    continue
+
+            self._candidates.pop(path, None)
+            self._completed.discard(path)
+            self._handled[path] = signature
+            ready.append(path)
+
+        # Forget files that were removed so the state doesn't grow forever.
+        self._candidates = {k: v for k, v in self._candidates.items() if k in seen}
+        self._handled = {k: v for k, v in self._handled.items() if k in seen}
+        self._completed &= seen
+
+        return ready
+
+    def has_candidates(self):
+        """Determine if files were seen that aren't complete yet"""
+        return bool(self._candidates)
+
+    def wait(self, timeout):
+        """Sleep until the next poll, waking early on inotify events"""
+        if self.inotify is None:
+            time.sleep(timeout)
+        else:
+            self._completed |= self.inotify.wait(timeout)
+
+    def close(self):
+        if self.inotify is not None:
+            self.inotify.close()
+            self.inotify = None
@@ -1,10 +1,61 @@
 # -*- coding: utf-8 -*-
 from collections.abc import Iterable
+from importlib import import_module
 
 import click
 
 
+class LazyGroup(click.Group):
+    """
+    A click group whose commands can be registered as "module:attribute" strings.
+    The module is only imported when the command is invoked or listed, so
+    running one command doesn't pay for importing all the others.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lazy_commands = {}
+
+    def add_lazy_command(self, import_path, name=None):
+        """
+        Register a command without importing it.
+        :param import_path: the command as "package.module:attribute".
+        :param name: the command name, the attribute name by default.
+        """
+        self.lazy_commands[name or import_path.rpartition(":")[2]] = import_path
+
+    def list_commands(self, ctx):
+        return sorted(set(super().list_commands(ctx)) | set(self.lazy_commands))
+
+    def get_command(self, ctx, cmd_name):
+        import_path = self.lazy_commands.pop(cmd_name, None)
+        if import_path is not None:
+            self.add_command(_import_command(import_path), cmd_name)
+        return super().get_command(ctx, cmd_name)
+
+
+def _import_command(import_path):
+    module_name, _, attribute = import_path.partition(":")
+    command = getattr(import_module(module_name), attribute)
+    _check_command(command)
+    return command
+
+
+def _check_command(command):
+    if not isinstance(command, click.core.Command) and not isinstance(
+        command, click.core.Group
+    ):
+        raise TypeError(
+            f"commands must be of type click.core.Command or click.core.Group, got {type(command)}"
+        )
+
+
 def add_commands(click_group, commands):
+    """
+    Add commands to a click group.
+    Commands can be given as "module:attribute" strings, which a LazyGroup only
+    imports when they're needed and any other group imports right away.
+    """
     if not isinstance(click_group, click.core.Group):
         raise TypeError(
             f"add_commands() expects click.core.Group for click_group, got {type(click_group)}"
@@ -16,11 +67,11 @@ def add_commands(click_group, commands):
         )
 
     for command in commands:
-        if not isinstance(command, click.core.Command) and not isinstance(
-            command, click.core.Group
-        ):
-            raise TypeError(
-                f"commands must be of type click.core.Command or click.core.Group, got {type(command)}"
-            )
+        if isinstance(command, str) and ":" in command:
+            if isinstance(click_group, LazyGroup):
+                click_group.add_lazy_command(command)
+                continue
+            command = _import_command(command)
 
+        _check_command(command)
         click_group.add_command(command)
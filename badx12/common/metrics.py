@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""
+Counters and histograms that can be exported in the Prometheus text format.
+
+Metrics live in a Registry, REGISTRY by default, and are safe to update from
+several threads. Updating one is a lock and a dict update, cheap enough to do
+for every file.
+"""
+import os
+import tempfile
+import threading
+from bisect import bisect_left
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Metric:
+    """The base of Counter and Histogram, each defines type_name and samples()"""
+
+    type_name = ""
+
+    def __init__(self, name, description, label_names=(), registry=None):
+        """
+        Create a new Metric
+        :param name: the metric name, such as badx12_files_total.
+        :param description: a one line description, exported as the HELP text.
+        :param label_names: the names of the labels every sample must be given.
+        :param registry: the registry to add the metric to, REGISTRY by default.
+        """
+        self.name = name
+        self.description = description
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+        (REGISTRY if registry is None else registry).register(self)
+
+    def _key(self, labels):
+        if len(labels) != len(self.label_names):
+            raise ValueError(
+                f"{self.name} expects the labels {self.label_names}, got {labels}"
+            )
+        return tuple(str(value) for value in labels)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Counter(Metric):
+    type_name = "counter"
+
+    def inc(self, amount=1, labels=()):
+        """Increase the counter, labels are given in the order of label_names"""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, labels=()):
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        """:return: a list of (suffix, labels dict, value) tuples."""
+        with self._lock:
+            values = sorted(self._values.items())
+        return [("", dict(zip(self.label_names, key)), value) for key, value in values]
+
+
+class Histogram(Metric):
+    type_name = "histogram"
+
+    def __init__(
+        self, name, description, label_names=(), buckets=LATENCY_BUCKETS, **kwargs
+    ):
+        """
+        Create a new Histogram
+        :param buckets: the upper bounds of the buckets, +Inf is added.
+        """
+        super().__init__(name, description, label_names, **kwargs)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, labels=()):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                # One count per bucket, then +Inf, then the sum.
+                counts = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[index] += 1
+            counts[-1] += value
+
+    def count(self, labels=()):
+        counts = self._values.get(self._key(labels))
+        return sum(counts[:-1]) if counts else 0
+
+    def samples(self):
+        """:return: a list of (suffix, labels dict, value) tuples."""
+        with self._lock:
+            values = sorted((key, list(counts)) for key, counts in self._values.items())
+
+        samples = []
+        for key, counts in values:
+            labels = dict(zip(self.label_names, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                samples.append(
+                    ("_bucket", dict(labels, le=_format_value(bound)), cumulative)
+                )
+            samples.append(("_sum", labels, counts[-1]))
+            samples.append(("_count", labels, cumulative))
+        return samples
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"A metric named {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+
+    def get(self, name):
+        return self._metrics[name]
+
+    def clear(self):
+        """Reset every metric to zero"""
+        for metric in list(self._metrics.values()):
+            metric.clear()
+
+    def to_prometheus(self):
+        """Format every metric in the Prometheus text exposition format"""
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.append(
+                f"# HELP {metric.name} {_escape(metric.description, quote=False)}"
+            )
+            lines.append(f"# TYPE {metric.name} {metric.type_name}")
+            for suffix, labels, value in metric.samples():
+                lines.append(
+                    f"{metric.name}{suffix}{_format_labels(labels)} {_format_value(value)}"
+                )
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """
+        Write the metrics to a file, for the node exporter's textfile collector.
+        The file is replaced atomically so a scrape never reads a partial file.
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".", suffix=".prom")
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(self.to_prometheus())
+            os.replace(temp_path, path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+
+def _escape(value, quote=True):
+    value = value.replace("\\", "\\\\").replace("\n", "\\n")
+    return value.replace('"', '\\"') if quote else value
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items())
+    return "{" + pairs + "}"
+
+
+def _format_value(value):
+    return "+Inf" if value == float("inf") else str(value)
+
+
+REGISTRY = Registry()
+
+FILES = Counter(
+    "badx12_files_total", "Files processed, by outcome.", label_names=("status",)
+)
+BYTES = Counter("badx12_bytes_total", "Bytes of EDI read.")
+SEGMENTS = Counter("badx12_segments_total", "Segments parsed.")
+TRANSACTION_SETS = Counter("badx12_transaction_sets_total", "Transaction sets parsed.")
+ERRORS = Counter(
+    "badx12_errors_total",
+    "Validation and parse errors, by error class.",
+    label_names=("type",),
+)
+DUPLICATE_CONTROL_NUMBERS = Counter(
+    "badx12_duplicate_control_numbers_total",
+    "Control numbers already used by another file, by level (ISA, GS or ST).",
+    label_names=("level",),
+)
+PARSE_SECONDS = Histogram(
+    "badx12_parse_seconds", "Time spent parsing and validating one document."
+)
@@ -1,4 +1,54 @@
 # -*- coding: utf-8 -*-
+import hashlib
+import os
+from fnmatch import fnmatch
 from pathlib import Path
 
 OUTPUT_DIR = Path.home() / "Documents" / "badX12"
+
+DIGEST_CHUNK_SIZE = 1024 * 1024
+
+
+def file_digest(path):
+    """Return the sha256 hex digest of a file's content"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(DIGEST_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def iter_files(path, recursive=False, include=(), exclude=()):
+    """
+    Lazily enumerate the files under a path with os.scandir.
+    Patterns are matched against both the file name and its path relative to
+    the given directory, excluded directories are not descended into.
+    :param path: a file, which is yielded as is, or a directory to search.
+    :param recursive: descend into sub directories.
+    :param include: glob patterns a file must match, all files when empty.
+    :param exclude: glob patterns of files and directories to skip.
+    :return: a generator of Path objects.
+    """
+    path = Path(path)
+    if not path.is_dir():
+        yield path
+        return
+
+    def matches(entry, relative, patterns):
+        return any(fnmatch(entry.name, p) or fnmatch(relative, p) for p in patterns)
+
+    directories = [(str(path), "")]
+    while directories:
+        directory, prefix = directories.pop()
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                relative = prefix + entry.name
+                if exclude and matches(entry, relative, exclude):
+                    continue
+
+                if entry.is_dir():
+                    if recursive:
+                        directories.append((entry.path, relative + "/"))
+                elif entry.is_file():
+                    if not include or matches(entry, relative, include):
+                        yield Path(entry.path)
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+import queue
+import threading
+import time
+
+POLL_INTERVAL = 0.05
+
+
+class Stage:
+    def __init__(self, name, func, workers=1):
+        """
+        A step of a pipeline, run by its own pool of threads.
+        :param name: the name the stage is reported under.
+        :param func: called with each item, returns the item for the next stage.
+        :param workers: the number of threads running the stage.
+        """
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.items = 0
+        self.busy = 0.0
+        self._lock = threading.Lock()
+
+    def _record(self, busy):
+        with self._lock:
+            self.items += 1
+            self.busy += busy
+
+
+class _Failure:
+    """Carries an exception raised by a stage to the consumer, in order"""
+
+    __slots__ = ("exception",)
+
+    def __init__(self, exception):
+        self.exception = exception
+
+
+class Pipeline:
+    """
+    Run items through a list of stages connected by bounded queues, so that
+    reading, parsing and writing overlap while memory stays bounded.
+    """
+
+    def __init__(self, stages, queue_size=8):
+        """
+        Create a new Pipeline
+        :param stages: the stages, in the order items pass through them.
+        :param queue_size: the number of items each queue between stages can hold.
+        """
+        self.stages = stages
+        self.queue_size = queue_size
+        self.elapsed = 0.0
+
+    def run(self, items):
+        """
+        Run every item through the stages.
+        Items are enumerated lazily from the calling thread, and exceptions
+        raised by a stage are raised here when the failed item is reached.
+        :param items: an iterable of items for the first stage.
+        :return: a generator of the results, in the same order as items.
+        """
+        started = time.perf_counter()
+        stop = threading.Event()
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in self.stages]
+        # The last queue is only drained by the caller, it must never block a stage.
+        queues.append(queue.Queue())
+        threads = [
+            threading.Thread(
+                target=self._work,
+                args=(stage, queues[index], queues[index + 1], stop),
+                name=f"badx12-{stage.name}-{worker}",
+                daemon=True,
+            )
+            for index, stage in enumerate(self.stages)
+            for worker in range(stage.workers)
+        ]
+        for thread in threads:
+            thread.start()
+
+        capacity = self.queue_size * (len(self.stages) + 1) + sum(
+            stage.workers for stage in self.stages
+        )
+        pending = {}
+        next_sequence = in_flight = 0
+        items = enumerate(items)
+        exhausted = False
+
+        try:
+            while True:
+                while not exhausted and in_flight < capacity:
+                    try:
+                        item = next(items)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    queues[0].put(item)
+                    in_flight += 1
+
+                if in_flight == 0:
+                    break
+
+                sequence, result = queues[-1].get()
+                in_flight -= 1
+                pending[sequence] = result
+
+                while next_sequence in pending:
+                    result = pending.pop(next_sequence)
+                    next_sequence += 1
+                    if isinstance(result, _Failure):
+                        raise result.exception
+                    yield result
+        finally:
+            stop.set()
+            # Wake idle workers right away, busy ones notice stop on their own.
+            for index, stage in enumerate(self.stages):
+                for _ in range(stage.workers):
+                    try:
+                        queues[index].put_nowait(None)
+                    except queue.Full:
+                        break
+            for thread in threads:
+                thread.join()
+            self.elapsed = time.perf_counter() - started
+
+    def utilization(self):
+        """
+        The share of the run each stage's workers spent busy.
+        A stage close to 1.0 is the bottleneck, stages close to 0 are waiting on it.
+        :return: a dict of stage name to utilization.
+        """
+        elapsed = max(self.elapsed, 1e-9)
+        return {
+            stage.name: stage.busy / (elapsed * stage.workers) for stage in self.stages
+        }
+
+    @staticmethod
+    def _work(stage, in_queue, out_queue, stop):
+        func = stage.func
+        while not stop.is_set():
+            try:
+                task = in_queue.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                continue
+
+            if task is None:
+                return
+
+            sequence, item = task
+            if not isinstance(item, _Failure):
+                started = time.perf_counter()
+                try:
+                    item = func(item)
+                except BaseException as e:
+                    item = _Failure(e)
+                stage._record(time.perf_counter() - started)
+
+            while True:
+                try:
+                    out_queue.put((sequence, item), timeout=POLL_INTERVAL)
+                    break
+                except queue.Full:
+                    if stop.is_set():
+                        return
@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+"""
+Opt-in timers and counters per phase and per segment type.
+
+Instrumented code wraps its phases in ``with phase("name"):``. While no Profile
+is enabled phase() returns a shared no-op context manager, so the hooks cost a
+global lookup and a function call.
+"""
+
+import os
+import threading
+import time
+from pathlib import Path
+
+_active = None
+
+
+class Timing:
+    """The number of calls, total and longest duration of one phase"""
+
+    __slots__ = ("count", "seconds", "max_seconds")
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+
+    def add(self, seconds, count=1):
+        self.count += count
+        self.seconds += seconds
+        if seconds > self.max_seconds:
+            self.max_seconds = seconds
+
+
+class Profile:
+    def __init__(self, slowest=5, dump_dir=None):
+        """
+        Collect timings while profiling is enabled.
+        :param slowest: the number of slowest files to list in the breakdown.
+        :param dump_dir: write cProfile and tracemalloc output for the slowest files here.
+        """
+        self.slowest = slowest
+        self.dump_dir = Path(dump_dir) if dump_dir else None
+        self.phases = {}
+        self.segments = {}
+        self.files = []
+        # The stages of the parse pipeline record timings from several threads.
+        self._lock = threading.Lock()
+
+    def phase(self, name):
+        return _Timer(self, name)
+
+    def add(self, name, seconds, count=1):
+        """Record a duration measured elsewhere, such as the parser's own timings"""
+        with self._lock:
+            timing = self.phases.get(name)
+            if timing is None:
+                timing = self.phases[name] = Timing()
+            timing.add(seconds, count)
+
+    def add_segment(self, segment_id, seconds):
+        with self._lock:
+            timing = self.segments.get(segment_id)
+            if timing is None:
+                timing = self.segments[segment_id] = Timing()
+            timing.add(seconds)
+
+    def add_file(self, path, seconds):
+        with self._lock:
+            self.files.append((seconds, str(path)))
+
+    def slowest_files(self):
+        return sorted(self.files, reverse=True)[: self.slowest]
+
+    def dump_slowest(self, func):
+        """
+        Run func again for each of the slowest files, under cProfile and tracemalloc.
+        Writes <name>.prof, readable with pstats or snakeviz, and <name>.memory.txt
+        with the lines that allocated the most memory.
+        :param func: called with the path of each file.
+        :return: the paths written.
+        """
+        global _active
+        self.dump_dir.mkdir(parents=True, exist_ok=True)
+        written = []
+        # The repeated runs are measured by cProfile, not added to this profile.
+        previous, _active = _active, None
+        try:
+            for rank, (_, path) in enumerate(self.slowest_files(), start=1):
+                written += self._dump(rank, path, func)
+        finally:
+            _active = previous
+
+        return written
+
+    def _dump(self, rank, path, func):
+        import cProfile
+        import tracemalloc
+
+        name = f"{rank:02d}-{Path(path).stem}"
+        profiler = cProfile.Profile()
+
+        tracemalloc.start()
+        profiler.enable()
+        try:
+            func(path)
+        finally:
+            profiler.disable()
+            snapshot = tracemalloc.take_snapshot()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+        profile_path = self.dump_dir / f"{name}.prof"
+        profiler.dump_stats(str(profile_path))
+
+        memory_path = self.dump_dir / f"{name}.memory.txt"
+        with open(memory_path, "w") as f:
+            f.write(f"{path}\npeak traced memory: {peak / 1e6:.2f} MB\n\n")
+            for stat in snapshot.statistics("lineno")[:25]:
+                f.write(f"{stat}\n")
+
+        return [profile_path, memory_path]
+
+    def table(self):
+        """Format the timings as a plain text breakdown"""
+        lines = ["Phase breakdown"]
+        lines += _timing_rows(self.phases)
+
+        if self.segments:
+            lines += ["", "Routing by segment id"]
+            lines += _timing_rows(self.segments, limit=15)
+
+        if self.files and self.slowest:
+            lines += ["", "Slowest files"]
+            lines += [
+                f"  {seconds * 1000:>10.2f} ms  {path}"
+                for seconds, path in self.slowest_files()
+            ]
+
+        return os.linesep.join(lines)
+
+
+def _timing_rows(timings, limit=None):
+    total = sum(timing.seconds for timing in timings.values()) or 1e-9
+    rows = sorted(timings.items(), key=lambda item: item[1].seconds, reverse=True)
+    lines = [
+        f"  {'name':<12} {'calls':>9} {'total ms':>12} {'mean ms':>10} "
+        f"{'max ms':>10} {'share':>7}"
+    ]
+    for name, timing in rows[:limit]:
+        lines.append(
+            f"  {name:<12} {timing.count:>9} {timing.seconds * 1000:>12.2f} "
+            f"{timing.seconds * 1000 / max(timing.count, 1):>10.3f} "
+            f"{timing.max_seconds * 1000:>10.3f} {timing.seconds / total:>7.1%}"
+        )
+    return lines
+
+
+class _Timer:
+    __slots__ = ("profile", "name", "started")
+
+    def __init__(self, profile, name):
+        self.profile = profile
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profile.add(self.name, time.perf_counter() - self.started)
+
+
+class _NoTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_NO_TIMER = _NoTimer()
+
+
+def enable(profile=None):
+    """
+    Start collecting timings in this process.
+    :return: the active Profile.
+    """
+    global _active
+    _active = profile or Profile()
+    return _active
+
+
+def disable():
+    global _active
+    _active = None
+
+
+def active():
+    """The enabled Profile, or None while profiling is off"""
+    return _active
+
+
+def phase(name):
+    """Time a block as one call of the named phase, when profiling is enabled"""
+    if _active is None:
+        return _NO_TIMER
+    return _Timer(_active, name)
@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+"""
+An incremental index of interchange, group and transaction set control numbers.
+
+Validation only compares a header's control number against its trailer within
+one document. The index records every ISA13, GS06 and ST02 along with the
+sender, receiver and date of the envelope and the file it came from, so a
+control number that was already used by another file is found with one indexed
+lookup when a file is added. Records are written in batches.
+
+Control numbers are compared per sender and receiver: ISA06 and ISA08 for
+interchanges, GS02 and GS03 for groups and their transaction sets. ST02 only
+has to be unique within its group, so transaction sets are compared within the
+GS06 of their group.
+"""
+import os
+import sqlite3
+import time
+from collections import namedtuple
+
+CONTROL_NUMBER_BATCH_SIZE = 5000
+
+ControlNumber = namedtuple(
+    "ControlNumber",
+    ["level", "sender", "receiver", "group_control_number", "control_number", "date"],
+)
+ControlNumber.__doc__ = """
+A control number, level is ISA, GS or ST. group_control_number is the GS06 of
+a transaction set and empty for the other levels.
+"""
+
+Duplicate = namedtuple(
+    "Duplicate", ["control_number", "path", "previous_path", "previous_date"]
+)
+Duplicate.__doc__ = "A control number of path that previous_path used first"
+
+
+def extract_control_numbers(document):
+    """
+    List the control numbers of a parsed document.
+    :return: a list of ControlNumber in document order.
+    """
+    header = document.interchange.header
+    control_numbers = [
+        ControlNumber(
+            "ISA",
+            header.isa06.content.strip(),
+            header.isa08.content.strip(),
+            "",
+            header.isa13.content,
+            header.isa09.content,
+        )
+    ]
+    for group in document.interchange.groups:
+        sender = group.header.gs02.content
+        receiver = group.header.gs03.content
+        date = group.header.gs04.content
+        gs06 = group.header.gs06.content
+        control_numbers.append(ControlNumber("GS", sender, receiver, "", gs06, date))
+        for transaction_set in group.transaction_sets:
+            st02 = transaction_set.header.st02.content
+            control_numbers.append(
+                ControlNumber("ST", sender, receiver, gs06, st02, date)
+            )
+    return control_numbers
+
+
+class ControlNumberIndex:
+    def __init__(self, path, batch_size=CONTROL_NUMBER_BATCH_SIZE):
+        """
+        Open or create a control number index.
+        :param path: the SQLite database file.
+        :param batch_size: the number of records written at a time.
+        """
+        self.path = path
+        self.batch_size = batch_size
+        self.duplicate_count = 0
+        self._pending = []
+        self._pending_keys = {}
+        self._pending_paths = {}
+        self._connection = sqlite3.connect(str(path))
+        with self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS control_numbers ("
+                "path TEXT, "
+                "ordinal INTEGER, "
+                "level TEXT, "
+                "sender TEXT, "
+                "receiver TEXT, "
+                "group_control_number TEXT, "
+                "control_number TEXT, "
+                "date TEXT, "
+                "sha256 TEXT, "
+                "recorded_at REAL, "
+                "PRIMARY KEY (path, ordinal))"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS control_numbers_key "
+                "ON control_numbers "
+                "(level, sender, receiver, group_control_number, control_number)"
+            )
+
+    def add(self, path, control_numbers, sha256=None):
+        """
+        Record the control numbers of a file and find the ones used before, by
+        a file recorded earlier or earlier in the same one. Adding a file again
+        replaces its records and keeps its place in that order.
+        :param path: the file the control numbers came from.
+        :param control_numbers: an iterable of ControlNumber.
+        :param sha256: the digest of the file, kept for reference.
+        :return: a list of Duplicate.
+        """
+        path = os.path.abspath(str(path))
+        recorded_at = self._recorded_at(path)
+        self._forget(path)
+        duplicates = []
+        seen = {}
+        for ordinal, control_number in enumerate(control_numbers):
+            key = control_number[:5]
+            previous = seen.get(key) or self._previous(key, path, recorded_at)
+            if previous is not None:
+                duplicates.append(Duplicate(control_number, path, *previous))
+            seen.setdefault(key, (path, control_number.date))
+
+            self._pending.append((path, ordinal, *control_number, sha256, recorded_at))
+            self._pending_keys.setdefault(key, (path, control_number.date, recorded_at))
+
+        self.duplicate_count += len(duplicates)
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+        return duplicates
+
+    def _recorded_at(self, path):
+        """:return: when path was first recorded, now for a new file."""
+        recorded_at = self._pending_paths.get(path)
+        if recorded_at is None:
+            (recorded_at,) = self._connection.execute(
+                "SELECT MIN(recorded_at) FROM control_numbers WHERE path = ?", (path,)
+            ).fetchone()
+        if recorded_at is None:
+            recorded_at = time.time()
+        self._pending_paths[path] = recorded_at
+        return recorded_at
+
+    def _forget(self, path):
+        """Drop the records of path, pending or stored, before it's added again"""
+        if any(row[0] == path for row in self._pending):
+            self._pending = [row for row in self._pending if row[0] != path]
+            self._pending_keys = {}
+            for row in self._pending:
+                self._pending_keys.setdefault(row[2:7], (row[0], row[7], row[9]))
+        # Committed with the next batch, the lookups of this connection see it now.
+        self._connection.execute("DELETE FROM control_numbers WHERE path = ?", (path,))
+
+    def _previous(self, key, path, recorded_at):
+        """:return: the (path, date) of an earlier file with the control number, or None."""
+        pending = self._pending_keys.get(key)
+        if pending is not None and pending[0] != path and pending[2] <= recorded_at:
+            return pending[:2]
+
+        return self._connection.execute(
+            "SELECT path, date FROM control_numbers "
+            "WHERE level = ? AND sender = ? AND receiver = ? "
+            "AND group_control_number = ? AND control_number = ? "
+            "AND path != ? AND recorded_at <= ? ORDER BY recorded_at LIMIT 1",
+            (*key, path, recorded_at),
+        ).fetchone()
+
+    def duplicates(self, level=None):
+        """
+        List every control number recorded by more than one file.
+        :param level: only list ISA, GS or ST control numbers.
+        :return: a list of (ControlNumber key, paths) tuples, the key without a date.
+        """
+        self.flush()
+        rows = self._connection.execute(
+            "SELECT DISTINCT level, sender, receiver, group_control_number, "
+            "control_number, path FROM control_numbers JOIN ("
+            "SELECT level, sender, receiver, group_control_number, control_number "
+            "FROM control_numbers WHERE ? IS NULL OR level = ? "
+            "GROUP BY level, sender, receiver, group_control_number, control_number "
+            "HAVING COUNT(DISTINCT path) > 1) "
+            "USING (level, sender, receiver, group_control_number, control_number) "
+            "ORDER BY level, sender, receiver, group_control_number, control_number, path",
+            (level, level),
+        ).fetchall()
+
+        duplicates = {}
+        for row in rows:
+            duplicates.setdefault(row[:5], []).append(row[5])
+        return list(duplicates.items())
+
+    def flush(self):
+        """Write the pending records"""
+        with self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO control_numbers "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                self._pending,
+            )
+        self._pending = []
+        self._pending_keys = {}
+        self._pending_paths = {}
+
+    def close(self):
+        self.flush()
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,326 @@
+# -*- coding: utf-8 -*-
+"""
+Compare two parsed documents segment by segment.
+
+Groups are aligned by GS06 and transaction sets by ST01 and ST02, groups and
+transaction sets whose control numbers changed are paired in order instead.
+Each segment is reduced to a tuple of its element values, so identical
+transaction sets are recognised with one comparison and the common start and
+end of changed ones are skipped before the rest is matched on segment hashes.
+Comparing two mostly identical files takes time linear in their size.
+"""
+from collections import deque, namedtuple
+from difflib import SequenceMatcher
+
+ADDED = "added"
+REMOVED = "removed"
+CHANGED = "changed"
+
+SegmentChange = namedtuple(
+    "SegmentChange",
+    [
+        "kind",
+        "location",
+        "segment_id",
+        "old_position",
+        "new_position",
+        "old",
+        "new",
+        "elements",
+    ],
+)
+SegmentChange.__doc__ = """
+A segment added, removed or changed. location is ISA13/GS06/ST02 of the old
+document, of the new one for added groups, and the positions count the
+segments of a transaction set from its ST, they are None for the interchange
+and group envelopes. old and new are the segment text, None for the side
+without it, and elements lists the ElementChange of a changed segment.
+"""
+
+ElementChange = namedtuple("ElementChange", ["name", "old", "new"])
+ElementChange.__doc__ = "An element that differs, such as PO102, empty when missing"
+
+TransactionSetChange = namedtuple(
+    "TransactionSetChange", ["kind", "location", "transaction_set"]
+)
+TransactionSetChange.__doc__ = "A transaction set only one of the documents has"
+
+
+class DocumentDiff:
+    def __init__(self, old, new):
+        """
+        The differences between two documents, see diff().
+        :param old: the EDIDocument compared against.
+        :param new: the EDIDocument compared.
+        """
+        self.old = old
+        self.new = new
+        self.changes = []
+        self.transaction_set_count = 0
+        self.identical_transaction_set_count = 0
+
+    @property
+    def changed_transaction_set_count(self):
+        return self.transaction_set_count - self.identical_transaction_set_count
+
+    def __bool__(self):
+        return bool(self.changes)
+
+    def __len__(self):
+        return len(self.changes)
+
+    def __iter__(self):
+        return iter(self.changes)
+
+    def __repr__(self):
+        return (
+            f"<DocumentDiff changes={len(self.changes)} "
+            f"transaction_sets={self.transaction_set_count} "
+            f"identical={self.identical_transaction_set_count}>"
+        )
+
+
+def diff(old, new):
+    """
+    Compare two documents.
+    :param old: the EDIDocument compared against.
+    :param new: the EDIDocument compared.
+    :return: a DocumentDiff listing the changes in document order.
+    """
+    result = DocumentDiff(old, new)
+    differ = _Differ(result, old.config, new.config)
+    old_interchange = old.interchange
+    new_interchange = new.interchange
+    isa13 = old_interchange.header.isa13.content
+
+    differ.compare_envelope(isa13, old_interchange.header, new_interchange.header)
+    pairs = _align(
+        old_interchange.groups,
+        new_interchange.groups,
+        key=lambda group: group.header.gs06.content,
+        fallback=lambda group: group.header.gs01.content,
+    )
+    for old_group, new_group in pairs:
+        differ.compare_group(isa13, old_group, new_group)
+    differ.compare_envelope(isa13, old_interchange.trailer, new_interchange.trailer)
+    return result
+
+
+class _Differ:
+    def __init__(self, result, old_config, new_config):
+        self.result = result
+        self.old_separator = old_config.element_separator
+        self.new_separator = new_config.element_separator
+
+    def compare_envelope(self, location, old, new):
+        old_values = _values(old)
+        new_values = _values(new)
+        if old_values != new_values:
+            self.changed(location, old_values, new_values, None, None)
+
+    def compare_group(self, isa13, old, new):
+        if new is None or old is None:
+            group = old or new
+            location = f"{isa13}/{group.header.gs06.content}"
+            self.only_in(REMOVED if new is None else ADDED, location, group.header)
+            for transaction_set in group.transaction_sets:
+                self.transaction_set_only_in(
+                    REMOVED if new is None else ADDED, location, transaction_set
+                )
+            self.only_in(REMOVED if new is None else ADDED, location, group.trailer)
+            return
+
+        location = f"{isa13}/{old.header.gs06.content}"
+        self.compare_envelope(location, old.header, new.header)
+        pairs = _align(
+            old.transaction_sets,
+            new.transaction_sets,
+            key=lambda transaction_set: (
+                transaction_set.header.st01.content,
+                transaction_set.header.st02.content,
+            ),
+            fallback=lambda transaction_set: transaction_set.header.st01.content,
+        )
+        for old_transaction_set, new_transaction_set in pairs:
+            if old_transaction_set is None or new_transaction_set is None:
+                self.transaction_set_only_in(
+                    REMOVED if new_transaction_set is None else ADDED,
+                    location,
+                    old_transaction_set or new_transaction_set,
+                )
+            else:
+                self.compare_transaction_set(
+                    location, old_transaction_set, new_transaction_set
+                )
+        self.compare_envelope(location, old.trailer, new.trailer)
+
+    def compare_transaction_set(self, location, old, new):
+        self.result.transaction_set_count += 1
+        location = f"{location}/{old.header.st02.content}"
+        old_values = _transaction_set_values(old)
+        new_values = _transaction_set_values(new)
+        if old_values == new_values:
+            self.result.identical_transaction_set_count += 1
+            return
+
+        # Skip the common start and end, mostly identical transaction sets leave
+        # only a few segments to match.
+        start = 0
+        end = min(len(old_values), len(new_values))
+        while start < end and old_values[start] == new_values[start]:
+            start += 1
+        old_end = len(old_values)
+        new_end = len(new_values)
+        while (
+            old_end > start
+            and new_end > start
+            and old_values[old_end - 1] == new_values[new_end - 1]
+        ):
+            old_end -= 1
+            new_end -= 1
+
+        old_middle = old_values[start:old_end]
+        new_middle = new_values[start:new_end]
+        matcher = SequenceMatcher(None, old_middle, new_middle, autojunk=False)
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag != "equal":
+                self.compare_block(
+                    location,
+                    old_middle[i1:i2],
+                    new_middle[j1:j2],
+                    start + i1,
+                    start + j1,
+                )
+
+    def compare_block(self, location, old_values, new_values, old_start, new_start):
+        """Pair the segments of a replaced block by id, the rest were added or removed"""
+        matcher = SequenceMatcher(
+            None,
+            [values[:1] for values in old_values],
+            [values[:1] for values in new_values],
+            autojunk=False,
+        )
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag == "equal":
+                for i, j in zip(range(i1, i2), range(j1, j2)):
+                    self.changed(
+                        location,
+                        old_values[i],
+                        new_values[j],
+                        old_start + i + 1,
+                        new_start + j + 1,
+                    )
+                continue
+            for i in range(i1, i2):
+                self.segment_only_in(
+                    REMOVED, location, old_values[i], old_start + i + 1
+                )
+            for j in range(j1, j2):
+                self.segment_only_in(ADDED, location, new_values[j], new_start + j + 1)
+
+    def changed(self, location, old_values, new_values, old_position, new_position):
+        segment_id = old_values[0] if old_values else ""
+        elements = [
+            ElementChange(f"{segment_id}{position:02}", old, new)
+            for position, (old, new) in enumerate(_zip_longest(old_values, new_values))
+            if position and old != new
+        ]
+        self.result.changes.append(
+            SegmentChange(
+                CHANGED,
+                location,
+                segment_id,
+                old_position,
+                new_position,
+                self.old_separator.join(old_values),
+                self.new_separator.join(new_values),
+                elements,
+            )
+        )
+
+    def segment_only_in(self, kind, location, values, position):
+        text = (self.new_separator if kind == ADDED else self.old_separator).join(
+            values
+        )
+        self.result.changes.append(
+            SegmentChange(
+                kind,
+                location,
+                values[0] if values else "",
+                position if kind == REMOVED else None,
+                position if kind == ADDED else None,
+                text if kind == REMOVED else None,
+                text if kind == ADDED else None,
+                [],
+            )
+        )
+
+    def only_in(self, kind, location, segment):
+        self.segment_only_in(kind, location, _values(segment), None)
+
+    def transaction_set_only_in(self, kind, location, transaction_set):
+        self.result.changes.append(
+            TransactionSetChange(
+                kind,
+                f"{location}/{transaction_set.header.st02.content}",
+                transaction_set,
+            )
+        )
+
+
+def _values(segment):
+    """:return: the element values of a segment, without trailing empty elements."""
+    values = [field.content for field in segment.fields]
+    while values and values[-1] == "":
+        values.pop()
+    return tuple(values)
+
+
+def _transaction_set_values(transaction_set):
+    values = [_values(transaction_set.header)]
+    values.extend(_values(segment) for segment in transaction_set.transaction_body)
+    values.append(_values(transaction_set.trailer))
+    return values
+
+
+def _zip_longest(old, new):
+    for position in range(max(len(old), len(new))):
+        yield (
+            old[position] if position < len(old) else "",
+            new[position] if position < len(new) else "",
+        )
+
+
+def _align(old, new, key, fallback):
+    """
+    Pair the items of two lists with the same key, then the remaining ones with
+    the same fallback key in order.
+    :return: a list of (old, new) pairs in the order of old followed by the
+        new items without a pair, None stands in for a missing item.
+    """
+    by_key = {}
+    for item in new:
+        by_key.setdefault(key(item), deque()).append(item)
+
+    pairs = []
+    paired = set()
+    for item in old:
+        candidates = by_key.get(key(item))
+        match = candidates.popleft() if candidates else None
+        if match is not None:
+            paired.add(id(match))
+        pairs.append([item, match])
+
+    unpaired = {}
+    for item in new:
+        if id(item) not in paired:
+            unpaired.setdefault(fallback(item), deque()).append(item)
+    for pair in pairs:
+        if pair[1] is None:
+            candidates = unpaired.get(fallback(pair[0]))
+            if candidates:
+                pair[1] = candidates.popleft()
+                paired.add(id(pair[1]))
+
+    pairs.extend([None, item] for item in new if id(item) not in paired)
+    return [tuple(pair) for pair in pairs]
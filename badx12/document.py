@@ -1,10 +1,24 @@
 # -*- coding: utf-8 -*-
-import pprint as pp
+from collections import Counter, namedtuple
 
+from badx12.common import profiling
 from badx12.utils import Interchange
 
 from ._settings import DocumentSettings
 
+Record = namedtuple(
+    "Record",
+    [
+        "interchange_control_number",
+        "group_control_number",
+        "transaction_set_control_number",
+        "segment_ordinal",
+        "segment_id",
+        "element_position",
+        "value",
+    ],
+)
+
 
 class DocumentConfiguration:
     def __init__(
@@ -36,6 +50,36 @@ class ValidationReport:
         return len(self.error_list) == 0
 
 
+class DocumentStats:
+    def __init__(self):
+        """Statistics collected while a document is parsed"""
+        self.byte_size = 0
+        self.segment_count = 0
+        self.segment_counts = Counter()
+        self.group_count = 0
+        self.transaction_set_count = 0
+        self.timings = {}
+
+    def count_segment(self, segment_id):
+        self.segment_counts[segment_id] += 1
+
+    def finalize(self):
+        """Derive the totals from the per segment id counts"""
+        self.segment_count = sum(self.segment_counts.values())
+        self.group_count = self.segment_counts["GS"]
+        self.transaction_set_count = self.segment_counts["ST"]
+
+    def to_dict(self):
+        return {
+            "byte_size": self.byte_size,
+            "segment_count": self.segment_count,
+            "segment_counts": dict(self.segment_counts),
+            "group_count": self.group_count,
+            "transaction_set_count": self.transaction_set_count,
+            "timings": dict(self.timings),
+        }
+
+
 class EDIDocument:
     """
     An EDI X12 Document
@@ -51,6 +95,7 @@ class EDIDocument:
         )
 
         self.interchange = Interchange()
+        self.stats = DocumentStats()
 
     def format_as_edi(self):
         """Format this document as EDI and return it as a string"""
@@ -59,18 +104,135 @@ class EDIDocument:
     def validate(self):
         """Validate this document and return a validation report"""
         report = ValidationReport()
-        self.interchange.validate(report)
+        with profiling.phase("validate"):
+            self.interchange.validate(report)
         return report
 
     def to_dict(self):
-        return {
-            "document": {
-                "text": self.text,
-                "config": self.config.to_dict(),
-                "interchange": self.interchange.to_dict(),
+        with profiling.phase("to_dict"):
+            return {
+                "document": {
+                    "text": self.text,
+                    "config": self.config.to_dict(),
+                    "interchange": self.interchange.to_dict(),
+                }
             }
-        }
+
+    def view(self):
+        """Return a lazy, read-only Mapping with the same shape as to_dict()"""
+        from badx12.views import DocumentView
+
+        return DocumentView(self)
+
+    def query(self, path):
+        """
+        Select segments or element values with a path, see badx12.query.
+        :param path: the path, such as "GS/ST[ST01=850]/N1[N101=ST]/N104".
+        :return: a list of the results.
+        """
+        from badx12 import query
+
+        return query.findall(path, self)
+
+    def diff(self, other):
+        """
+        Compare this document with another one, see badx12.diff.
+        :param other: the EDIDocument to compare with this one.
+        :return: a DocumentDiff of the segments other added, removed or changed.
+        """
+        from badx12 import diff
+
+        return diff.diff(self, other)
+
+    def to_records(self):
+        """
+        Yield the document as flat element records, in document order.
+        Only elements with content are yielded, the segment id is carried on
+        every record rather than as an element of its own. Segments are numbered
+        by their position in the file, body segments left out by
+        Parser(keep=...) are counted too.
+        :return: a generator of Record tuples.
+        """
+        interchange = self.interchange
+        isa13 = interchange.header.isa13.content
+        ordinal = 1
+
+        yield from _segment_records(interchange.header, ordinal, isa13)
+
+        for group in interchange.groups:
+            gs06 = group.header.gs06.content
+            ordinal += 1
+            yield from _segment_records(group.header, ordinal, isa13, gs06)
+
+            for transaction_set in group.transaction_sets:
+                st02 = transaction_set.header.st02.content
+                ordinal += 1
+                yield from _segment_records(
+                    transaction_set.header, ordinal, isa13, gs06, st02
+                )
+
+                body = transaction_set.transaction_body
+                skipped = dict(transaction_set.skipped_runs)
+                for position, segment in enumerate(body):
+                    ordinal += skipped.get(position, 0) + 1
+                    yield from _segment_records(segment, ordinal, isa13, gs06, st02)
+
+                ordinal += skipped.get(len(body), 0) + 1
+                yield from _segment_records(
+                    transaction_set.trailer, ordinal, isa13, gs06, st02
+                )
+
+            ordinal += 1
+            yield from _segment_records(group.trailer, ordinal, isa13, gs06)
+
+        ordinal += 1
+        yield from _segment_records(interchange.trailer, ordinal, isa13)
+
+    def to_bytes(self):
+        """Serialize this document into the compact binary format"""
+        from badx12 import serialization
+
+        return serialization.dumps(self)
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Load a document serialized with to_bytes()"""
+        from badx12 import serialization
+
+        return serialization.loads(data)
+
+    def __reduce__(self):
+        return _document_from_bytes, (self.to_bytes(),)
 
     def __repr__(self):
-        _pp = pp.PrettyPrinter(indent=2)
-        return _pp.pformat(self.to_dict())
+        header = self.interchange.header
+        groups = self.interchange.groups
+        transaction_sets = sum(len(group.transaction_sets) for group in groups)
+        return (
+            f"<EDIDocument ISA13={header.isa13.content!r} sender={header.isa06.content.strip()!r} "
+            f"receiver={header.isa08.content.strip()!r} groups={len(groups)} "
+            f"transaction_sets={transaction_sets} segments={self.stats.segment_count} "
+            f"bytes={self.stats.byte_size}>"
+        )
+
+
+def _document_from_bytes(data):
+    """Unpickle helper, pickle needs a module level callable"""
+    return EDIDocument.from_bytes(data)
+
+
+def _segment_records(segment, ordinal, isa13, gs06=None, st02=None):
+    """
+    Yield a Record for every populated element of a segment.
+    :param segment: the segment to flatten.
+    :param ordinal: the position of the segment in the document.
+    """
+    fields = segment.fields
+    if not fields:
+        return
+
+    segment_id = fields[0].content
+    for position in range(1, len(fields)):
+        value = fields[position].content
+        if value != "":
+            yield Record(isa13, gs06, st02, ordinal, segment_id, position, value)
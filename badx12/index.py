@@ -0,0 +1,406 @@
+# -*- coding: utf-8 -*-
+"""
+A sidecar offset index for random access into large x12 files.
+
+One scan of the file records the byte range of every interchange, group and
+transaction set along with their control numbers, without parsing any element.
+The index is saved next to the file as <file>.bx12idx and reused as long as the
+file's size and modification time haven't changed. A file opened through the
+index only reads and parses the slice that is asked for.
+
+The index file is a fixed header followed by three arrays of unsigned 64 bit
+ints and the control numbers, separated by line feeds::
+
+    interchanges:      start, end of ISA, end of IEA
+    groups:            start, end of GS, end of GE, interchange number
+    transaction sets:  start, end of SE, group number
+    control numbers:   ISA13..., GS06..., ST01..., ST02...
+"""
+import io
+import os
+import struct
+import sys
+from array import array
+from pathlib import Path
+
+from badx12.parser import Parser
+from badx12.stream import SegmentReader, StreamedTransactionSet, iter_transaction_sets
+from badx12.utils.errors import SerializationError
+
+MAGIC = b"BXIX"
+FORMAT_VERSION = 1
+SUFFIX = ".bx12idx"
+
+_HEADER = struct.Struct("<4sBQqIIII")
+_SWAP = sys.byteorder == "big"
+_INTERCHANGE_WIDTH = 3
+_GROUP_WIDTH = 4
+_TRANSACTION_SET_WIDTH = 3
+
+
+class OffsetIndex:
+    def __init__(self, size=0, mtime_ns=0):
+        """
+        Create a new, empty OffsetIndex, use build() or load() to fill one.
+        :param size: the size of the indexed file.
+        :param mtime_ns: the modification time of the indexed file.
+        """
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.interchanges = array("Q")
+        self.groups = array("Q")
+        self.transaction_sets = array("Q")
+        self.isa13 = []
+        self.gs06 = []
+        self.st01 = []
+        self.st02 = []
+        self._lookups = {}
+
+    @property
+    def interchange_count(self):
+        return len(self.interchanges) // _INTERCHANGE_WIDTH
+
+    @property
+    def group_count(self):
+        return len(self.groups) // _GROUP_WIDTH
+
+    @property
+    def transaction_set_count(self):
+        return len(self.transaction_sets) // _TRANSACTION_SET_WIDTH
+
+    def interchange(self, number):
+        """:return: (start, end of ISA, end) of the interchange, by position in the file."""
+        return _entry(self.interchanges, _INTERCHANGE_WIDTH, number)
+
+    def group(self, number):
+        """:return: (start, end of GS, end, interchange number) of the group."""
+        return _entry(self.groups, _GROUP_WIDTH, number)
+
+    def transaction_set(self, number):
+        """:return: (start, end, group number) of the transaction set."""
+        return _entry(self.transaction_sets, _TRANSACTION_SET_WIDTH, number)
+
+    def find(self, element, control_number):
+        """
+        Find the positions of the envelopes with a control number.
+        :param element: "ISA13", "GS06", "ST01" or "ST02".
+        :param control_number: the value to look for.
+        :return: a list of positions in the file, in order.
+        """
+        lookup = self._lookups.get(element)
+        if lookup is None:
+            lookup = self._lookups[element] = {}
+            for number, value in enumerate(getattr(self, element.lower())):
+                lookup.setdefault(value, []).append(number)
+        return list(lookup.get(control_number, ()))
+
+    def is_current(self, path):
+        """:return: True when the file hasn't changed since it was indexed."""
+        stat = os.stat(path)
+        return stat.st_size == self.size and stat.st_mtime_ns == self.mtime_ns
+
+    def to_bytes(self):
+        strings = "\n".join(self.isa13 + self.gs06 + self.st01 + self.st02)
+        blob = strings.encode("utf-8")
+        arrays = [
+            array("Q", a)
+            for a in (self.interchanges, self.groups, self.transaction_sets)
+        ]
+        if _SWAP:
+            for a in arrays:
+                a.byteswap()
+
+        return b"".join(
+            [
+                _HEADER.pack(
+                    MAGIC,
+                    FORMAT_VERSION,
+                    self.size,
+                    self.mtime_ns,
+                    self.interchange_count,
+                    self.group_count,
+                    self.transaction_set_count,
+                    len(blob),
+                )
+            ]
+            + [a.tobytes() for a in arrays]
+            + [blob]
+        )
+
+    @classmethod
+    def from_bytes(cls, data):
+        try:
+            magic, version, size, mtime_ns, interchanges, groups, sets, blob_length = (
+                _HEADER.unpack_from(data, 0)
+            )
+        except struct.error:
+            raise SerializationError(msg="The data is too short to be a badx12 index.")
+
+        if magic != MAGIC:
+            raise SerializationError(
+                msg=f"Expected magic {MAGIC!r} but found {magic!r}."
+            )
+
+        if version != FORMAT_VERSION:
+            raise SerializationError(
+                msg=f"Unsupported index version {version}, expected {FORMAT_VERSION}."
+            )
+
+        lengths = (
+            interchanges * _INTERCHANGE_WIDTH,
+            groups * _GROUP_WIDTH,
+            sets * _TRANSACTION_SET_WIDTH,
+        )
+        expected_length = _HEADER.size + sum(lengths) * 8 + blob_length
+        if len(data) != expected_length:
+            raise SerializationError(
+                msg=f"Expected {expected_length} bytes of index but found {len(data)}."
+            )
+
+        index = cls(size, mtime_ns)
+        view = memoryview(data)
+        position = _HEADER.size
+        for a, length in zip(
+            (index.interchanges, index.groups, index.transaction_sets), lengths
+        ):
+            a.frombytes(view[position : position + length * 8])
+            position += length * 8
+            if _SWAP:
+                a.byteswap()
+
+        strings = str(view[position:], "utf-8").split("\n") if blob_length else []
+        if len(strings) != interchanges + groups + sets * 2:
+            raise SerializationError(msg="The index control numbers are corrupt.")
+        index.isa13 = strings[:interchanges]
+        index.gs06 = strings[interchanges : interchanges + groups]
+        index.st01 = strings[interchanges + groups : interchanges + groups + sets]
+        index.st02 = strings[interchanges + groups + sets :]
+        return index
+
+    def save(self, path):
+        """Write the index to path, atomically"""
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, "wb") as f:
+                f.write(self.to_bytes())
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            return cls.from_bytes(f.read())
+
+    def __repr__(self):
+        return (
+            f"<OffsetIndex interchanges={self.interchange_count} groups={self.group_count} "
+            f"transaction_sets={self.transaction_set_count}>"
+        )
+
+
+def _entry(offsets, width, number):
+    count = len(offsets) // width
+    if number < 0:
+        number += count
+    if not 0 <= number < count:
+        raise IndexError(f"There is no envelope number {number}, the file has {count}")
+    return tuple(offsets[number * width : (number + 1) * width])
+
+
+def build(path):
+    """
+    Index a file in one scan, reading segment ids and control numbers only.
+    Envelopes left open at the end of the file end where the file does.
+    :param path: the path of the x12 file.
+    :return: an OffsetIndex.
+    """
+    stat = os.stat(path)
+    index = OffsetIndex(stat.st_size, stat.st_mtime_ns)
+    reader = SegmentReader(path)
+    element_separator = reader.element_separator
+    terminator_length = len(reader.segment_terminator.encode("utf-8"))
+    interchange = group = transaction_set = None
+
+    for offset, segment in reader.segments_with_offsets():
+        segment_id = segment.partition(element_separator)[0]
+        if segment_id not in ("ISA", "GS", "ST", "SE", "GE", "IEA"):
+            continue
+
+        end = offset + len(segment.encode("utf-8")) + terminator_length
+        if segment_id == "ST":
+            fields = segment.split(element_separator)
+            transaction_set = (offset, _field(fields, 1), _field(fields, 2))
+        elif segment_id == "SE" and transaction_set is not None:
+            _add_transaction_set(index, transaction_set, end)
+            transaction_set = None
+        elif segment_id == "GS":
+            group = (offset, end, _field(segment.split(element_separator), 6))
+        elif segment_id == "GE" and group is not None:
+            _add_group(index, group, end)
+            group = None
+        elif segment_id == "ISA":
+            interchange = (offset, end, _field(segment.split(element_separator), 13))
+        elif segment_id == "IEA" and interchange is not None:
+            _add_interchange(index, interchange, end)
+            interchange = None
+
+    if transaction_set is not None:
+        _add_transaction_set(index, transaction_set, stat.st_size)
+    if group is not None:
+        _add_group(index, group, stat.st_size)
+    if interchange is not None:
+        _add_interchange(index, interchange, stat.st_size)
+
+    return index
+
+
+def _field(fields, position):
+    return fields[position] if position < len(fields) else ""
+
+
+def _add_interchange(index, interchange, end):
+    start, header_end, isa13 = interchange
+    index.interchanges.extend((start, header_end, end))
+    index.isa13.append(isa13)
+
+
+def _add_group(index, group, end):
+    # The group belongs to the interchange being read, which is added at its IEA.
+    start, header_end, gs06 = group
+    index.groups.extend((start, header_end, end, index.interchange_count))
+    index.gs06.append(gs06)
+
+
+def _add_transaction_set(index, transaction_set, end):
+    start, st01, st02 = transaction_set
+    index.transaction_sets.extend((start, end, index.group_count))
+    index.st01.append(st01)
+    index.st02.append(st02)
+
+
+def index_path_for(path):
+    """The sidecar index path of an x12 file"""
+    return Path(f"{path}{SUFFIX}")
+
+
+def load_or_build(path, index_path=None):
+    """
+    Load the sidecar index of a file, or build and save it when it's missing
+    or the file has changed. An index that can't be saved is still returned.
+    :param path: the path of the x12 file.
+    :param index_path: where the index is kept, next to the file by default.
+    :return: an OffsetIndex.
+    """
+    index_path = Path(index_path) if index_path else index_path_for(path)
+    try:
+        index = OffsetIndex.load(index_path)
+        if index.is_current(path):
+            return index
+    except (OSError, SerializationError):
+        pass
+
+    index = build(path)
+    try:
+        index.save(index_path)
+    except OSError:
+        pass
+    return index
+
+
+class IndexedFile:
+    def __init__(self, path, index_path=None, keep=None):
+        """
+        Open an x12 file for random access through its sidecar index.
+        :param path: the path of the x12 file.
+        :param index_path: where the index is kept, next to the file by default.
+        :param keep: the body segment ids to parse, see Parser(keep=...).
+        """
+        self.path = Path(path)
+        self.keep = keep
+        self.index = load_or_build(self.path, index_path)
+
+    def _read(self, start, end):
+        with open(self.path, "rb") as f:
+            f.seek(start)
+            return f.read(end - start)
+
+    def _number(self, number, element, control_number):
+        if control_number is None:
+            if number is None:
+                raise TypeError(f"Expected a number or a {element} control number")
+            return number
+        numbers = self.index.find(element, control_number)
+        if not numbers:
+            raise KeyError(
+                f"No envelope with {element} {control_number!r} in {self.path}"
+            )
+        return numbers[0]
+
+    def interchange(self, number=None, control_number=None):
+        """
+        Parse one interchange.
+        :param number: the position of the interchange in the file, from 0.
+        :param control_number: the ISA13 to look for instead of a position,
+            the first one in the file is parsed.
+        :return: an EDIDocument of the interchange.
+        """
+        start, _, end = self.index.interchange(
+            self._number(number, "ISA13", control_number)
+        )
+        parser = Parser(keep=self.keep)
+        return parser.parse_document(_decode(self._read(start, end)))
+
+    def group(self, number=None, control_number=None):
+        """
+        Parse one functional group.
+        :param number: the position of the group in the file, from 0.
+        :param control_number: the GS06 to look for instead of a position,
+            the first one in the file is parsed.
+        :return: the Group.
+        """
+        start, _, end, interchange = self.index.group(
+            self._number(number, "GS06", control_number)
+        )
+        isa_start, isa_end, _ = self.index.interchange(interchange)
+        text = self._read(isa_start, isa_end) + self._read(start, end)
+        document = Parser(keep=self.keep).parse_document(_decode(text))
+        return document.interchange.groups[0]
+
+    def transaction_set(self, number=None, control_number=None):
+        """
+        Parse one transaction set.
+        :param number: the position of the transaction set in the file, from 0.
+        :param control_number: the ST02 to look for instead of a position,
+            the first one in the file is parsed.
+        :return: a StreamedTransactionSet, with the headers of its interchange
+            and group and its offset in the file.
+        """
+        start, end, group = self.index.transaction_set(
+            self._number(number, "ST02", control_number)
+        )
+        gs_start, gs_end, _, interchange = self.index.group(group)
+        isa_start, isa_end, _ = self.index.interchange(interchange)
+        text = (
+            self._read(isa_start, isa_end)
+            + self._read(gs_start, gs_end)
+            + self._read(start, end)
+        )
+        streamed = next(iter_transaction_sets(text, keep=self.keep))
+        return StreamedTransactionSet(
+            streamed.interchange_header,
+            streamed.group_header,
+            streamed.transaction_set,
+            start,
+            end - start,
+        )
+
+    def __repr__(self):
+        return f"<IndexedFile {str(self.path)!r} {self.index!r}>"
+
+
+def _decode(data):
+    """Decode with universal newlines, as a file opened in text mode would be"""
+    return io.TextIOWrapper(io.BytesIO(data), encoding="utf-8").read()
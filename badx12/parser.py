@@ -1,8 +1,12 @@
 # -*- coding: utf-8 -*-
+import os
+import time
 from pathlib import Path
 
+from badx12.common import profiling
 from badx12.document import EDIDocument
 from badx12.utils import Element, InterchangeHeader, Segment
+from badx12.utils.element import GENERIC_ELEMENT_DESCRIPTION
 from badx12.utils.errors import InvalidFileTypeError, SegmentTerminatorNotFoundError
 from badx12.utils.group import Group, GroupHeader, GroupTrailer
 from badx12.utils.transaction_set import (
@@ -11,28 +15,92 @@ from badx12.utils.transaction_set import (
     TransactionSetTrailer,
 )
 
+# The envelope segment ids, read once rather than from new segments for every segment routed.
+INTERCHANGE_HEADER_ID = InterchangeHeader().id.name
+INTERCHANGE_TRAILER_ID = EDIDocument().interchange.trailer.id.name
+GROUP_HEADER_ID = GroupHeader().id.name
+GROUP_TRAILER_ID = GroupTrailer().id.name
+TRANSACTION_SET_HEADER_ID = TransactionSetHeader().id.name
+TRANSACTION_SET_TRAILER_ID = TransactionSetTrailer().id.name
+
 
 class Parser:
-    def __init__(self, document=None):
+    def __init__(self, document=None, cache=None, keep=None):
         """Create a new Parser
         :param document:  The text or file to parse into an EDI document.
+        :param cache: a ParseCache or cache directory used to skip parsing unchanged documents.
+        :param keep: the body segment ids to parse, such as {"BEG", "PO1"}, or a
+            callable given each segment id. Other body segments are only counted
+            in their transaction set's skipped_segments. All are kept by default.
         """
         self.document = EDIDocument()
         self.document_text = document
+        self.cache = cache
+        self.keep = keep if keep is None or callable(keep) else frozenset(keep)
+        if cache is not None:
+            # The cache and binary format are only imported when they're used.
+            from badx12.cache import ParseCache
+
+            if not isinstance(cache, ParseCache):
+                self.cache = ParseCache(cache)
 
         if document is not None:
             self.parse_document(document)
 
+    @classmethod
+    def open_indexed(cls, path, index_path=None, keep=None):
+        """
+        Open a large file for random access. A sidecar index of the byte offsets
+        and control numbers of every envelope is built in one scan, saved next
+        to the file and reused until it changes, then only the interchange,
+        group or transaction set asked for is read and parsed.
+        :param path: the path of the x12 file.
+        :param index_path: where the index is kept, <path>.bx12idx by default.
+        :param keep: the body segment ids to parse, all of them by default.
+        :return: a badx12.index.IndexedFile.
+        """
+        from badx12.index import IndexedFile
+
+        return IndexedFile(path, index_path, keep)
+
     def parse_document(self, document):
         """Parse the text document into an object
         :param document:  The text or file to parse into an EDI document.
         """
+        started = time.perf_counter()
         self.document_text = self._validate_document(document)
+        byte_size = self._byte_size(document)
+        read_time = time.perf_counter() - started
+
+        # A callable keep can't be part of the cache key.
+        use_cache = self.cache is not None and not callable(self.keep)
+        if use_cache:
+            started = time.perf_counter()
+            cache_key = self.cache.key(
+                self.document_text,
+                keep=None if self.keep is None else sorted(self.keep),
+            )
+            cached_document = self.cache.get(cache_key)
+            if cached_document is not None:
+                self.document = cached_document
+                stats = self.document.stats
+                stats.byte_size = byte_size
+                stats.timings["read"] = read_time
+                stats.timings["cache"] = time.perf_counter() - started
+                self._profile_timings(stats)
+                return self.document
+
+        stats = self.document.stats
+        stats.byte_size = byte_size
+        stats.timings["read"] = read_time
         self.document.text = self.document_text
 
         if self.document_text.startswith(EDIDocument().interchange.header.id.name):
+            started = time.perf_counter()
             self._parse_interchange_header()
+            stats.timings["header"] = time.perf_counter() - started
             self._separate_and_route_segments()
+            stats.finalize()
 
         else:
             found_segment = self.document_text[:3]
@@ -44,8 +112,20 @@ class Parser:
                 f"{str(len(found_segment))}",
             )
 
+        if use_cache:
+            self.cache.put(cache_key, self.document)
+
+        self._profile_timings(stats)
         return self.document
 
+    @staticmethod
+    def _profile_timings(stats):
+        """Add the phase timings of a parse to the active profile, if any"""
+        profile = profiling.active()
+        if profile is not None:
+            for name, seconds in stats.timings.items():
+                profile.add(name, seconds)
+
     def _validate_document(self, document):
         try:
             is_file = Path(document).is_file()
@@ -64,6 +144,13 @@ class Parser:
 
         return document.replace("\n", "").strip()
 
+    @staticmethod
+    def _byte_size(document):
+        """The size of the document as given, on disk for files and utf-8 encoded for text"""
+        if isinstance(document, str) and not os.path.isfile(document):
+            return len(document.encode("utf-8"))
+        return os.path.getsize(document)
+
     def _parse_interchange_header(self):
         """Parse the interchange header segment"""
         header = self.document.interchange.header
@@ -92,27 +179,56 @@ class Parser:
 
     def _separate_and_route_segments(self):
         """Handles separating all the segments"""
+        stats = self.document.stats
+        started = time.perf_counter()
         self.segment_list = self.document_text.split(
             self.document.config.segment_terminator
         )
+        split_time = time.perf_counter()
+        stats.timings["split"] = split_time - started
+
+        element_separator = self.document.config.element_separator
+        count_segment = stats.count_segment
+        profile = profiling.active()
+        if profile is not None:
+            self._route_segments_profiled(profile)
+        else:
+            for segment in self.segment_list:
+                if segment:
+                    count_segment(segment.partition(element_separator)[0])
+                self._route_segment_to_parser(segment)
+
+        stats.timings["route"] = time.perf_counter() - split_time
+
+    def _route_segments_profiled(self, profile):
+        """Route every segment, timing each one under its segment id"""
+        element_separator = self.document.config.element_separator
+        count_segment = self.document.stats.count_segment
+        perf_counter = time.perf_counter
         for segment in self.segment_list:
+            if not segment:
+                continue
+            segment_id = segment.partition(element_separator)[0]
+            count_segment(segment_id)
+            started = perf_counter()
             self._route_segment_to_parser(segment)
+            profile.add_segment(segment_id, perf_counter() - started)
 
     def _route_segment_to_parser(self, segment):
         """Take a generic segment and determine what segment to parse it as
         :param segment:
         """
-        if segment.startswith(InterchangeHeader().id.name):
+        if segment.startswith(INTERCHANGE_HEADER_ID):
             pass
-        elif segment.startswith(GroupHeader().id.name):
+        elif segment.startswith(GROUP_HEADER_ID):
             self._parse_group_header(segment)
-        elif segment.startswith(GroupTrailer().id.name):
+        elif segment.startswith(GROUP_TRAILER_ID):
             self._parse_group_trailer(segment)
-        elif segment.startswith(TransactionSetHeader().id.name):
+        elif segment.startswith(TRANSACTION_SET_HEADER_ID):
             self._parse_transaction_set_header(segment)
-        elif segment.startswith(TransactionSetTrailer().id.name):
+        elif segment.startswith(TRANSACTION_SET_TRAILER_ID):
             self._parse_transaction_set_trailer(segment)
-        elif segment.startswith(EDIDocument().interchange.trailer.id.name):
+        elif segment.startswith(INTERCHANGE_TRAILER_ID):
             self._parse_interchange_trailer(segment)
         else:
             self._parse_unknown_body(segment)
@@ -136,7 +252,7 @@ class Parser:
         element = Element()
         element.name = "GEN" + str(index)
         element.content = value
-        element.description = "A generic element created by the parser"
+        element.description = GENERIC_ELEMENT_DESCRIPTION
         element.required = False
         length = len(value)
         element.min_length = length
@@ -197,6 +313,14 @@ class Parser:
 
     def _parse_unknown_body(self, segment):
         if segment:
+            keep = self.keep
+            if keep is not None:
+                element_separator = self.document.config.element_separator
+                segment_id = segment.partition(element_separator)[0]
+                if not (keep(segment_id) if callable(keep) else segment_id in keep):
+                    self._skip_body_segment()
+                    return
+
             generic_segment = Segment()
             generic_field_list = segment.split(self.document.config.element_separator)
             self._parse__unknown_segment(generic_segment, generic_field_list)
@@ -204,3 +328,17 @@ class Parser:
                 self.current_transaction.transaction_body.append(generic_segment)
             except AttributeError:
                 pass
+
+    def _skip_body_segment(self):
+        """Count a body segment that isn't kept, without parsing it"""
+        transaction_set = self.current_transaction
+        try:
+            transaction_set.skipped_segments += 1
+        except AttributeError:
+            return
+        runs = transaction_set.skipped_runs
+        kept = len(transaction_set.transaction_body)
+        if runs and runs[-1][0] == kept:
+            runs[-1][1] += 1
+        else:
+            runs.append([kept, 1])
@@ -0,0 +1,369 @@
+# -*- coding: utf-8 -*-
+"""
+Select segments and element values with path expressions.
+
+    GS/ST[ST01=850]/N1[N101=ST]/N104
+
+A path is a list of segment ids separated by "/", from the envelopes (ISA, GS,
+ST) down to body segments. Each step may be filtered by element predicates,
+[N101=ST] or [N101!=ST], and the path may end with an element of the last
+segment, N104, or a component of a composite element, SVC01-2. Envelope steps
+can be left out, N1/N102 looks in every transaction set. Consecutive body steps
+follow the X12 loops: in N1/N3 the N3 segments are the ones after each N1 and
+before the next one.
+
+Paths are compiled once and cached. A compiled Query can be evaluated against
+a parsed EDIDocument or Interchange, or against the transaction sets of
+badx12.stream.iter_transaction_sets(), which never holds more than one
+transaction set in memory. Query.keep can be given to Parser(keep=...) so only
+the segments a query reads are parsed, Query.stream() does so.
+"""
+import re
+from bisect import bisect_left
+from functools import lru_cache
+
+from badx12 import stream
+from badx12._settings import DocumentSettings
+from badx12.document import EDIDocument
+from badx12.utils import Interchange
+from badx12.utils.errors import QuerySyntaxError
+
+INTERCHANGE, GROUP, TRANSACTION_SET, BODY = range(4)
+
+# Envelope header ids, with their trailer id and level.
+ENVELOPES = {
+    "ISA": ("IEA", INTERCHANGE),
+    "GS": ("GE", GROUP),
+    "ST": ("SE", TRANSACTION_SET),
+}
+
+_SEGMENT_ID = re.compile(r"[A-Z0-9]{2,3}")
+_NAME = re.compile(r"[A-Z0-9]+(?:-\d+)?")
+_PREDICATE = re.compile(
+    r"\[\s*(?P<name>[A-Z0-9]+(?:-\d+)?)\s*(?P<op>!=|=)\s*"
+    r"(?:'(?P<single>[^']*)'|\"(?P<double>[^\"]*)\"|(?P<bare>[^\]]*?))\s*\]"
+)
+_POSITION = re.compile(r"(\d{2})(?:-(\d+))?")
+
+
+class ElementRef:
+    """An element of a segment, or one component of a composite element"""
+
+    __slots__ = ("name", "trailer", "position", "component")
+
+    def __init__(self, name, trailer, position, component=None):
+        self.name = name
+        self.trailer = trailer
+        self.position = position
+        self.component = component
+
+    def value(self, segment, sub_element_separator):
+        """:return: the element content, or None when the segment doesn't have it."""
+        if segment is None or self.position >= len(segment.fields):
+            return None
+        content = segment.fields[self.position].content
+        if self.component is None:
+            return content
+        components = content.split(sub_element_separator)
+        return (
+            components[self.component - 1]
+            if self.component <= len(components)
+            else None
+        )
+
+    def __repr__(self):
+        return f"ElementRef({self.name!r})"
+
+
+class Step:
+    """One segment id of a path and the predicates it is filtered by"""
+
+    __slots__ = ("segment_id", "trailer_id", "level", "predicates")
+
+    def __init__(self, segment_id):
+        self.segment_id = segment_id
+        self.trailer_id, self.level = ENVELOPES.get(segment_id, (None, BODY))
+        self.predicates = []
+
+    def element(self, name):
+        """
+        Resolve an element name such as N104 or SE01 against this step.
+        :return: an ElementRef, or None when the name isn't an element of this step.
+        """
+        for segment_id, trailer in ((self.segment_id, False), (self.trailer_id, True)):
+            if segment_id and name.startswith(segment_id):
+                match = _POSITION.fullmatch(name[len(segment_id) :])
+                if match:
+                    component = int(match.group(2)) if match.group(2) else None
+                    return ElementRef(name, trailer, int(match.group(1)), component)
+        return None
+
+    def matches(self, header, trailer, sub_element_separator):
+        for element, negate, expected in self.predicates:
+            value = element.value(
+                trailer if element.trailer else header, sub_element_separator
+            )
+            if (value == expected) == negate:
+                return False
+        return True
+
+    def __repr__(self):
+        return f"Step({self.segment_id!r})"
+
+
+class Query:
+    def __init__(self, path):
+        """
+        Compile a query path, use compile() to reuse compiled paths.
+        :param path: the path, such as "GS/ST[ST01=850]/N1[N101=ST]/N104".
+        """
+        self.path = path
+        self.envelope_steps = {}
+        self.body_steps = []
+        self.element = None
+        self._parse(path)
+        # The body segments the query reads, anything else can be skipped.
+        self.segment_ids = frozenset(step.segment_id for step in self.body_steps)
+        # Queries of the envelopes select whole transaction sets, their bodies
+        # are kept.
+        self.keep = self.segment_ids if self.body_steps else None
+        self.depth = BODY if self.body_steps else max(self.envelope_steps, default=BODY)
+        # A stream reads the IEA and GE trailers only after their transaction sets.
+        trailer_elements = [
+            element
+            for level, step in self.envelope_steps.items()
+            if level != TRANSACTION_SET
+            for element, _, _ in step.predicates
+        ]
+        if self.depth in (INTERCHANGE, GROUP) and self.element is not None:
+            trailer_elements.append(self.element)
+        self.streamable = not any(element.trailer for element in trailer_elements)
+
+    def _parse(self, path):
+        steps = []
+        position = 0
+        while True:
+            match = _NAME.match(path, position)
+            if match is None:
+                self._error(position, "expected a segment id or an element")
+            name = match.group()
+            position = match.end()
+
+            element = steps[-1].element(name) if steps else None
+            if element is not None:
+                if position != len(path):
+                    self._error(position, f"the element {name} must end the path")
+                self.element = element
+                break
+
+            if not _SEGMENT_ID.fullmatch(name):
+                self._error(match.start(), f"{name} is not a segment id")
+            step = Step(name)
+            if steps and step.level <= steps[-1].level and step.level != BODY:
+                self._error(
+                    match.start(), f"{name} can't follow {steps[-1].segment_id}"
+                )
+
+            position = self._parse_predicates(step, position)
+            steps.append(step)
+
+            if position == len(path):
+                break
+            if path[position] != "/":
+                self._error(position, "expected /")
+            position += 1
+
+        for step in steps:
+            if step.level == BODY:
+                self.body_steps.append(step)
+            else:
+                self.envelope_steps[step.level] = step
+
+    def _parse_predicates(self, step, position):
+        match = _PREDICATE.match(self.path, position)
+        while match is not None:
+            element = step.element(match.group("name"))
+            if element is None:
+                self._error(
+                    match.start(),
+                    f"{match.group('name')} is not an element of {step.segment_id}",
+                )
+            value = next(
+                value
+                for value in match.group("single", "double", "bare")
+                if value is not None
+            )
+            step.predicates.append((element, match.group("op") == "!=", value))
+            position = match.end()
+            match = _PREDICATE.match(self.path, position)
+
+        if self.path.startswith("[", position):
+            self._error(position, "expected a predicate such as [N101=ST]")
+        return position
+
+    def _error(self, position, msg):
+        raise QuerySyntaxError(
+            path=self.path, msg=f"{msg} at position {position} of {self.path!r}"
+        )
+
+    def iterate(self, target):
+        """
+        Evaluate the query lazily.
+        :param target: an EDIDocument, an Interchange, or an iterable of
+            StreamedTransactionSet such as badx12.stream.iter_transaction_sets().
+        :return: a generator of element values when the path ends with an
+            element, otherwise of the selected Interchange, Group, TransactionSet
+            or Segment objects. Streamed ISA and GS steps select the header segment.
+        :raises QuerySyntaxError: when a streamed path reads an IEA or GE element.
+        """
+        if isinstance(target, EDIDocument):
+            target = target.interchange
+        if isinstance(target, Interchange):
+            sub_element_separator = (
+                target.header.isa16.content or DocumentSettings.sub_element_separator
+            )
+            return self._iter_interchange(target, sub_element_separator)
+        if not self.streamable:
+            raise QuerySyntaxError(
+                path=self.path,
+                msg=f"{self.path!r} reads an IEA or GE trailer, which isn't streamed",
+            )
+        return self._iter_stream(target)
+
+    def stream(self, source, chunk_size=None):
+        """
+        Evaluate the query while reading a file one transaction set at a time,
+        parsing only the body segments the query reads.
+        :param source: the path of an x12 file, x12 text, or a binary file object.
+        :return: a generator of results, see iterate().
+        """
+        return self.iterate(
+            stream.iter_transaction_sets(
+                source, chunk_size or stream.CHUNK_SIZE, keep=self.keep
+            )
+        )
+
+    def findall(self, target):
+        """Evaluate the query, :return: a list of the results."""
+        return list(self.iterate(target))
+
+    def first(self, target, default=None):
+        """Evaluate the query until the first result, :return: it or default."""
+        return next(iter(self.iterate(target)), default)
+
+    def _results(self, obj, header, trailer, sub_element_separator):
+        """Yield obj, or the selected element of it when it has one"""
+        if self.element is None:
+            yield obj
+            return
+        value = self.element.value(
+            trailer if self.element.trailer else header, sub_element_separator
+        )
+        if value is not None:
+            yield value
+
+    def _matches(self, level, header, trailer, sub_element_separator):
+        step = self.envelope_steps.get(level)
+        return step is None or step.matches(header, trailer, sub_element_separator)
+
+    def _iter_interchange(self, interchange, sub):
+        if not self._matches(INTERCHANGE, interchange.header, interchange.trailer, sub):
+            return
+        if self.depth == INTERCHANGE:
+            yield from self._results(
+                interchange, interchange.header, interchange.trailer, sub
+            )
+            return
+
+        for group in interchange.groups:
+            if not self._matches(GROUP, group.header, group.trailer, sub):
+                continue
+            if self.depth == GROUP:
+                yield from self._results(group, group.header, group.trailer, sub)
+                continue
+
+            for transaction_set in group.transaction_sets:
+                yield from self._iter_transaction_set(transaction_set, sub)
+
+    def _iter_stream(self, streamed_transaction_sets):
+        last_header = None
+        for streamed in streamed_transaction_sets:
+            interchange_header = streamed.interchange_header
+            group_header = streamed.group_header
+            sub = (
+                interchange_header.isa16.content
+                if interchange_header is not None
+                else DocumentSettings.sub_element_separator
+            )
+            # The trailers of the interchange and group haven't been read yet.
+            if not self._matches(INTERCHANGE, interchange_header, None, sub):
+                continue
+            if not self._matches(GROUP, group_header, None, sub):
+                continue
+
+            if self.depth in (INTERCHANGE, GROUP):
+                # Select each header once, not once per transaction set.
+                header = (
+                    interchange_header if self.depth == INTERCHANGE else group_header
+                )
+                if header is not last_header and header is not None:
+                    last_header = header
+                    yield from self._results(header, header, None, sub)
+                continue
+
+            yield from self._iter_transaction_set(streamed.transaction_set, sub)
+
+    def _iter_transaction_set(self, transaction_set, sub):
+        header = transaction_set.header
+        trailer = transaction_set.trailer
+        if not self._matches(TRANSACTION_SET, header, trailer, sub):
+            return
+        if self.depth == TRANSACTION_SET:
+            yield from self._results(transaction_set, header, trailer, sub)
+            return
+
+        for segment in self._select_body(transaction_set, sub):
+            yield from self._results(segment, segment, None, sub)
+
+    def _select_body(self, transaction_set, sub):
+        """
+        Match the body steps using the segment index, each step after the first
+        only looks between its parent segment and the next segment with the
+        parent's id.
+        """
+        body = transaction_set.transaction_body
+        index = transaction_set.segment_index()
+        scopes = [(0, len(body))]
+        for step in self.body_steps:
+            positions = index.get(step.segment_id, ())
+            matched = []
+            for start, end in scopes:
+                at = bisect_left(positions, start)
+                while at < len(positions) and positions[at] < end:
+                    position = positions[at]
+                    at += 1
+                    if step.matches(body[position], None, sub):
+                        loop_end = positions[at] if at < len(positions) else len(body)
+                        matched.append((position, min(loop_end, end)))
+            scopes = [(position + 1, end) for position, end in matched]
+            if not scopes:
+                return []
+        return [body[start - 1] for start, _ in scopes]
+
+    def __repr__(self):
+        return f"Query({self.path!r})"
+
+
+@lru_cache(maxsize=256)
+def compile(path):
+    """
+    Compile a query path, compiled paths are cached.
+    :param path: the path, such as "GS/ST[ST01=850]/N1[N101=ST]/N104".
+    :return: a Query.
+    """
+    return Query(path)
+
+
+def findall(path, target):
+    """Evaluate a query path against a document, interchange or stream, :return: a list."""
+    return compile(path).findall(target)
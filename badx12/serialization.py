@@ -0,0 +1,272 @@
+# -*- coding: utf-8 -*-
+"""
+Compact binary serialization of parsed documents.
+
+A serialized document is a small fixed header followed by three blocks:
+
+* the string table offsets, one unsigned int per string plus a final end offset
+* the string table itself, every distinct element value encoded once as utf-8
+* the structure, a flat run of unsigned ints holding string table indexes
+
+The structure is laid out in document order. Every segment is written as its
+field count followed by one string index per field, and every envelope writes
+the number of children it holds before them::
+
+    config, ISA, group count, (GS, set count, (ST, body count, skipped..., body..., SE)..., GE)..., IEA
+
+The skipped body segments left out by Parser(keep=...) are written as their
+count and the number of runs, followed by the position and length of each run.
+
+Only element content is stored, element definitions are rebuilt on load the
+same way the parser builds them.
+"""
+
+import struct
+import sys
+from array import array
+from collections import Counter
+
+from badx12.document import EDIDocument
+from badx12.utils import Element, Segment
+from badx12.utils.element import GENERIC_ELEMENT_DESCRIPTION
+from badx12.utils.errors import SerializationError
+from badx12.utils.group import Group, GroupHeader, GroupTrailer
+from badx12.utils.transaction_set import (
+    TransactionSet,
+    TransactionSetHeader,
+    TransactionSetTrailer,
+)
+
+MAGIC = b"BX12"
+FORMAT_VERSION = 3
+
+_HEADER = struct.Struct("<4sBIII")
+_SWAP = sys.byteorder == "big"
+
+
+def dumps(document):
+    """
+    Serialize a document into the compact binary format.
+    :param document: the EDIDocument to serialize.
+    :return: the serialized document as bytes.
+    """
+    strings = {}
+    structure = array("I")
+
+    def add_segment(segment):
+        fields = segment.fields
+        structure.append(len(fields))
+        structure.extend([strings.setdefault(f.content, len(strings)) for f in fields])
+
+    config = document.config
+    structure.extend(
+        [
+            strings.setdefault(value, len(strings))
+            for value in (
+                document.text,
+                config.version,
+                config.element_separator,
+                config.segment_terminator,
+                config.sub_element_separator,
+            )
+        ]
+    )
+
+    interchange = document.interchange
+    add_segment(interchange.header)
+    structure.append(len(interchange.groups))
+    for group in interchange.groups:
+        add_segment(group.header)
+        structure.append(len(group.transaction_sets))
+        for transaction_set in group.transaction_sets:
+            add_segment(transaction_set.header)
+            structure.append(len(transaction_set.transaction_body))
+            structure.append(transaction_set.skipped_segments)
+            structure.append(len(transaction_set.skipped_runs))
+            for run in transaction_set.skipped_runs:
+                structure.extend(run)
+            for segment in transaction_set.transaction_body:
+                add_segment(segment)
+            add_segment(transaction_set.trailer)
+        add_segment(group.trailer)
+    add_segment(interchange.trailer)
+
+    offsets = array("I", [0])
+    position = 0
+    for value in strings:
+        position += len(value)
+        offsets.append(position)
+    blob = "".join(strings).encode("utf-8")
+
+    if _SWAP:
+        offsets.byteswap()
+        structure.byteswap()
+
+    return b"".join(
+        [
+            _HEADER.pack(
+                MAGIC, FORMAT_VERSION, len(strings), len(blob), len(structure)
+            ),
+            offsets.tobytes(),
+            blob,
+            structure.tobytes(),
+        ]
+    )
+
+
+def loads(data):
+    """
+    Load a document from the compact binary format.
+    :param data: bytes produced by dumps().
+    :return: the EDIDocument.
+    """
+    string_count, blob_length, structure_length = _read_header(data)
+
+    view = memoryview(data)
+    position = _HEADER.size
+    offsets = array("I")
+    offsets.frombytes(view[position : position + (string_count + 1) * 4])
+    position += (string_count + 1) * 4
+    try:
+        text = str(view[position : position + blob_length], "utf-8")
+    except UnicodeDecodeError:
+        raise SerializationError(msg="The string table of the document isn't utf-8.")
+    position += blob_length
+    structure = array("I")
+    structure.frombytes(view[position : position + structure_length * 4])
+
+    if _SWAP:
+        offsets.byteswap()
+        structure.byteswap()
+
+    strings = [text[offsets[i] : offsets[i + 1]] for i in range(string_count)]
+    next_int = iter(structure.tolist()).__next__
+
+    def next_str():
+        return strings[next_int()]
+
+    segment_counts = Counter()
+
+    def load_fields(segment):
+        fields = segment.fields
+        for index in range(next_int()):
+            fields[index].content = next_str()
+        segment_counts[fields[0].content] += 1
+        return segment
+
+    def load_generic():
+        segment = Segment()
+        fields = segment.fields
+        for index in range(next_int()):
+            value = next_str()
+            length = len(value)
+            fields.append(
+                Element(
+                    _generic_name(index),
+                    GENERIC_ELEMENT_DESCRIPTION,
+                    False,
+                    length,
+                    length,
+                    value,
+                )
+            )
+        if fields:
+            segment_counts[fields[0].content] += 1
+        return segment
+
+    try:
+        document = EDIDocument()
+        document.text = next_str()
+        config = document.config
+        config.version = next_str()
+        config.element_separator = next_str()
+        config.segment_terminator = next_str()
+        config.sub_element_separator = next_str()
+
+        interchange = document.interchange
+        load_fields(interchange.header)
+        document.version = interchange.header.isa12.content
+
+        for _ in range(next_int()):
+            group = Group()
+            group.header = load_fields(GroupHeader())
+            for _ in range(next_int()):
+                transaction_set = TransactionSet()
+                transaction_set.header = load_fields(TransactionSetHeader())
+                body = transaction_set.transaction_body
+                body_count = next_int()
+                transaction_set.skipped_segments = next_int()
+                transaction_set.skipped_runs = [
+                    [next_int(), next_int()] for _ in range(next_int())
+                ]
+                for _ in range(body_count):
+                    body.append(load_generic())
+                transaction_set.trailer = load_fields(TransactionSetTrailer())
+                group.transaction_sets.append(transaction_set)
+            group.trailer = load_fields(GroupTrailer())
+            interchange.groups.append(group)
+
+        load_fields(interchange.trailer)
+    except (StopIteration, IndexError):
+        raise SerializationError(msg="The serialized document is truncated or corrupt.")
+
+    document.stats.segment_counts = segment_counts
+    document.stats.finalize()
+
+    return document
+
+
+def _read_header(data):
+    """
+    Check the header of a serialized document against its magic, version and length.
+    :return: the string count, string table length and structure length.
+    """
+    try:
+        magic, version, string_count, blob_length, structure_length = (
+            _HEADER.unpack_from(data, 0)
+        )
+    except struct.error:
+        raise SerializationError(msg="The data is too short to be a badx12 document.")
+
+    if magic != MAGIC:
+        raise SerializationError(msg=f"Expected magic {MAGIC!r} but found {magic!r}.")
+
+    if version != FORMAT_VERSION:
+        raise SerializationError(
+            msg=f"Unsupported format version {version}, expected {FORMAT_VERSION}."
+        )
+
+    expected_length = (
+        _HEADER.size + (string_count + 1) * 4 + blob_length + structure_length * 4
+    )
+    if len(data) != expected_length:
+        raise SerializationError(
+            msg=f"Expected {expected_length} bytes of serialized document but found "
+            f"{len(data)}."
+        )
+
+    return string_count, blob_length, structure_length
+
+
+def dump(document, fp):
+    """Serialize a document into a binary file object"""
+    fp.write(dumps(document))
+
+
+def load(fp):
+    """Load a document from a binary file object"""
+    return loads(fp.read())
+
+
+_GENERIC_NAMES = []
+
+
+def _generic_name(index):
+    """Return the cached generic element name for a field position"""
+    try:
+        return _GENERIC_NAMES[index]
+    except IndexError:
+        _GENERIC_NAMES.extend(
+            "GEN" + str(i) for i in range(len(_GENERIC_NAMES), index + 1)
+        )
+        return _GENERIC_NAMES[index]
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""
+Read an interchange one segment or one transaction set at a time.
+
+The input is read in fixed size chunks, so memory use depends on the size of
+the largest transaction set rather than the size of the file. Offsets are byte
+offsets into the input, usable with seek() on the file.
+"""
+import io
+import os
+from collections import namedtuple
+
+from badx12.parser import Parser
+from badx12.utils import InterchangeHeader
+from badx12.utils.errors import InvalidFileTypeError, SegmentTerminatorNotFoundError
+from badx12.utils.group import Group
+
+CHUNK_SIZE = 1024**2
+
+# Enough to hold the fixed length ISA segment, with room for line breaks.
+_HEADER_SIZE = 512
+
+StreamedTransactionSet = namedtuple(
+    "StreamedTransactionSet",
+    ["interchange_header", "group_header", "transaction_set", "offset", "length"],
+)
+StreamedTransactionSet.__doc__ = """
+A transaction set with the headers of its interchange and group. offset and
+length are the byte range from the start of ST to the end of SE's terminator.
+"""
+
+
+class SegmentReader:
+    def __init__(self, source, chunk_size=CHUNK_SIZE):
+        """
+        Create a new SegmentReader
+        :param source: the path of an x12 file, x12 text, or a binary file object.
+        :param chunk_size: the number of bytes read at a time.
+        """
+        self.chunk_size = chunk_size
+        self._file, self._close = _open_source(source)
+        self._first_chunk = self._read_header()
+
+        header = self._first_chunk.lstrip()
+        if not header.startswith(b"ISA"):
+            found_segment = header[:3].decode("utf-8", "replace")
+            raise InvalidFileTypeError(
+                segment=found_segment,
+                msg=f"Expected Element Envelope: ISA but found Element Envelope: {found_segment}.",
+            )
+
+        fields = header.replace(b"\r", b"").replace(b"\n", b"").split(header[3:4])
+        isa16 = fields[16] if len(fields) > 16 else b""
+        if not isa16[1:2]:
+            raise SegmentTerminatorNotFoundError(
+                msg="The segment terminator is not present in the Interchange Header, can't parse file."
+            )
+
+        self.element_separator = header[3:4].decode("utf-8")
+        self.sub_element_separator = isa16[0:1].decode("utf-8")
+        self.segment_terminator = isa16[1:2].decode("utf-8")
+
+    def _read_header(self):
+        data = b""
+        while len(data) < _HEADER_SIZE:
+            chunk = self._file.read(_HEADER_SIZE - len(data))
+            if not chunk:
+                break
+            data += chunk
+        return data
+
+    def __iter__(self):
+        for _, segment in self.segments_with_offsets():
+            yield segment
+
+    def segments_with_offsets(self):
+        """
+        Yield every segment with its position in the input, line breaks around
+        segments are skipped.
+        :return: a generator of (byte offset, segment text) tuples.
+        """
+        terminator = self.segment_terminator.encode("utf-8")
+        pending = b""
+        offset = 0
+        chunk = self._first_chunk
+        try:
+            while chunk:
+                parts = (pending + chunk).split(terminator)
+                pending = parts.pop()
+                for part in parts:
+                    segment = part.lstrip(b"\r\n")
+                    if segment.strip():
+                        yield (
+                            offset + len(part) - len(segment),
+                            segment.rstrip(b"\r\n").decode("utf-8"),
+                        )
+                    offset += len(part) + len(terminator)
+                chunk = self._file.read(self.chunk_size)
+
+            segment = pending.lstrip(b"\r\n")
+            if segment.strip():
+                yield offset + len(pending) - len(segment), segment.rstrip().decode(
+                    "utf-8"
+                )
+        finally:
+            self.close()
+
+    def close(self):
+        if self._close:
+            self._file.close()
+
+
+def _open_source(source):
+    """:return: a binary file object and whether it should be closed after reading."""
+    if isinstance(source, (bytes, bytearray)):
+        return io.BytesIO(source), True
+    if isinstance(source, os.PathLike):
+        return open(source, "rb"), True
+    if isinstance(source, str):
+        try:
+            is_file = os.path.isfile(source)
+        except (OSError, ValueError):
+            is_file = False
+        if is_file:
+            return open(source, "rb"), True
+        return io.BytesIO(source.encode("utf-8")), True
+    if hasattr(source, "read"):
+        return source, False
+
+    raise TypeError(
+        f"{SegmentReader.__name__}() expects source to be a path, x12 text or a binary file, "
+        f"got {type(source)}"
+    )
+
+
+def iter_segments(source, chunk_size=CHUNK_SIZE):
+    """
+    Yield the segments of an interchange as text, without element parsing.
+    :param source: the path of an x12 file, x12 text, or a binary file object.
+    """
+    return iter(SegmentReader(source, chunk_size))
+
+
+def iter_transaction_sets(source, chunk_size=CHUNK_SIZE, keep=None):
+    """
+    Yield the transaction sets of one or more interchanges as they are read.
+    Only the transaction set being read is kept in memory, each one is a
+    TransactionSet as found in a parsed document.
+    :param source: the path of an x12 file, x12 text, or a binary file object.
+    :param keep: the body segment ids to parse, see Parser(keep=...).
+    :return: a generator of StreamedTransactionSet tuples.
+    """
+    reader = SegmentReader(source, chunk_size)
+    parser = Parser(keep=keep)
+    config = parser.document.config
+    config.element_separator = reader.element_separator
+    config.segment_terminator = reader.segment_terminator
+    config.sub_element_separator = reader.sub_element_separator
+
+    element_separator = reader.element_separator
+    terminator_length = len(reader.segment_terminator.encode("utf-8"))
+    interchange_header = None
+    group_header = None
+    started = None
+    parser.current_group = Group()
+    for offset, segment in reader.segments_with_offsets():
+        segment_id = segment.partition(element_separator)[0]
+        if segment_id == "ST":
+            started = offset
+            parser._parse_transaction_set_header(segment)
+        elif segment_id == "SE":
+            parser._parse_transaction_set_trailer(segment)
+            # Only the group header is kept, not the transaction sets read so far.
+            transaction_set = parser.current_group.transaction_sets.pop()
+            yield StreamedTransactionSet(
+                interchange_header,
+                group_header,
+                transaction_set,
+                started,
+                offset + len(segment.encode("utf-8")) + terminator_length - started,
+            )
+            parser.current_transaction = None
+        elif segment_id == "GS":
+            parser._parse_group_header(segment)
+            group_header = parser.current_group.header
+        elif segment_id == "ISA":
+            interchange_header = InterchangeHeader()
+            parser._parse_segment(interchange_header, segment.split(element_separator))
+            group_header = None
+        elif segment_id not in ("GE", "IEA"):
+            parser._parse_unknown_body(segment)
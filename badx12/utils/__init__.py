@@ -4,8 +4,10 @@ from .envelope import (
     Envelope,
     GroupEnvelope,
     InterchangeEnvelope,
+    SegmentList,
     TransactionSetEnvelope,
 )
 from .errors import FieldValidationError, IDMismatchError, SegmentCountError
 from .interchange import Interchange, InterchangeHeader, InterchangeTrailer
 from .segment import Segment
+from .template import SegmentTemplate
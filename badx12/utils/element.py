@@ -1,8 +1,8 @@
 # -*- coding: utf-8 -*-
-import pprint as pp
-
 from .errors import FieldValidationError
 
+GENERIC_ELEMENT_DESCRIPTION = "A generic element created by the parser"
+
 
 class Element(object):
     """A generic segment"""
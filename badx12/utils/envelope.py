@@ -2,6 +2,41 @@
 from .segment import Segment
 
 
+def _modifies(method):
+    def modified(self, *args):
+        self.version += 1
+        return method(self, *args)
+
+    modified.__name__ = method.__name__
+    modified.__doc__ = method.__doc__
+    return modified
+
+
+class SegmentList(list):
+    """
+    A list of segments that counts its modifications, so indexes built over it
+    can tell when they're out of date.
+    """
+
+    version = 0
+
+    append = _modifies(list.append)
+    extend = _modifies(list.extend)
+    insert = _modifies(list.insert)
+    pop = _modifies(list.pop)
+    remove = _modifies(list.remove)
+    clear = _modifies(list.clear)
+    reverse = _modifies(list.reverse)
+    __setitem__ = _modifies(list.__setitem__)
+    __delitem__ = _modifies(list.__delitem__)
+    __iadd__ = _modifies(list.__iadd__)
+    __imul__ = _modifies(list.__imul__)
+
+    def sort(self, *, key=None, reverse=False):
+        self.version += 1
+        list.sort(self, key=key, reverse=reverse)
+
+
 class Envelope(object):
     def __init__(self):
         self.header = Segment()
@@ -26,10 +61,7 @@ class Envelope(object):
         :param document_configuration: config for formatting.
         :return: document as a string of EDI.
         """
-        document = ""
-        for item in self.body:
-            document += item.format_as_edi(document_configuration)
-        return document
+        return "".join(item.format_as_edi(document_configuration) for item in self.body)
 
     def validate(self, report):
         """
@@ -74,8 +106,13 @@ class GroupEnvelope(Envelope):
 class TransactionSetEnvelope(Envelope):
     def __init__(self):
         Envelope.__init__(self)
+        self.body = SegmentList()
         self.transaction_body = self.body
+        # Body segments the parser counted but didn't keep, see Parser(keep=...).
+        self.skipped_segments = 0
+        # Where they were, a [kept body segments before it, length] pair per run.
+        self.skipped_runs = []
 
     def number_of_segments(self):
         header_trailer_count = 2
-        return len(self.transaction_body) + header_trailer_count
+        return len(self.transaction_body) + self.skipped_segments + header_trailer_count
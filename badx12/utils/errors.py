@@ -55,3 +55,45 @@ class SegmentTerminatorNotFoundError(Exception):
 
     def __init__(self, msg):
         self.msg = msg
+
+
+class SerializationError(Exception):
+    """Exception raised when a serialized document can't be loaded.
+    Attributes:
+        msg  -- explanation of the error
+    """
+
+    def __init__(self, msg):
+        self.msg = msg
+
+
+class QuerySyntaxError(Exception):
+    """Exception raised when a query path can't be compiled.
+    Attributes:
+        path -- the query path
+        msg  -- explanation of the error
+    """
+
+    def __init__(self, path, msg):
+        self.path = path
+        self.msg = msg
+
+
+class EnvelopeError(Exception):
+    """Exception raised when envelopes are opened or closed out of order.
+    Attributes:
+        msg  -- explanation of the error
+    """
+
+    def __init__(self, msg):
+        self.msg = msg
+
+
+# The errors raised for a document that can't be parsed, each carries a msg.
+PARSE_ERRORS = (
+    InvalidFileTypeError,
+    FieldValidationError,
+    SegmentCountError,
+    IDMismatchError,
+    SegmentTerminatorNotFoundError,
+)
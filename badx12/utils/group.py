@@ -1,6 +1,4 @@
 # -*- coding: utf-8 -*-
-import pprint as pp
-
 from badx12.utils import Element, GroupEnvelope, Segment
 from badx12.utils.errors import IDMismatchError, SegmentCountError
 
@@ -1,6 +1,4 @@
 # -*- coding: utf-8 -*-
-import pprint as pp
-
 from .element import Element
 from .envelope import InterchangeEnvelope
 from .errors import IDMismatchError, SegmentCountError
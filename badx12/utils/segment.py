@@ -1,9 +1,8 @@
 # -*- coding: utf-8 -*-
-import pprint as pp
-
 from badx12._settings import DocumentSettings
 
 from .element import Element
+from .template import SegmentTemplate
 
 
 class Segment(object):
@@ -28,43 +27,46 @@ class Segment(object):
         self.element_separator = document_configuration.element_separator
         self.segment_terminator = document_configuration.segment_terminator
         self.sub_element_separator = document_configuration.sub_element_separator
-        return str(self)
-
-    def _all_fields_empty(self):
-        """determine if all fields are empty"""
-        for field in self.fields:
-            if field.content != "":
-                return False
-        return True
-
-    def _get_fields_as_string(self, out):
-        """processes all the fields in the segment and returns the string representation"""
-        for index, field in enumerate(self.fields):
-            if field.content:
-                out += str(field)
-                out = self._add_separators_to_fields(index, out)
-        out = self._add_segment_terminator(out)
+        return self._format(self.element_separator, self.segment_terminator)
 
-        return out
+    def _format(self, element_separator, segment_terminator):
+        fields = self.fields
+        if type(self) is not Segment:
+            return self.template().format(
+                [field.content for field in fields[1:]],
+                element_separator,
+                segment_terminator,
+            )
 
-    def _add_separators_to_fields(self, index, out):
-        """adds field separators to all the element strings"""
-        if index < self.field_count:
-            # if the next field is required add the separator
-            if self.fields[index + 1].required:
-                out += self.element_separator
-            # if the next field is optional but has content add the separator
-            elif self.fields[index + 1].content:
-                out += self.element_separator
-            # finally if the next field is not the last element add the separator
-            elif index + 1 != self.field_count:
-                out += self.element_separator
-        return out
+        # A plain segment, such as a generic body segment, is formatted without
+        # compiling a template: only its trailing empty elements are checked.
+        values = [field.content for field in fields]
+        count = len(values)
+        while count > 1 and not values[count - 1] and not fields[count - 1].required:
+            count -= 1
+        if count <= 1 and not any(values):
+            return ""
+        if count < len(values):
+            values = values[:count]
+        try:
+            return element_separator.join(values) + segment_terminator
+        except TypeError:
+            return element_separator.join(map(str, values)) + segment_terminator
 
-    def _add_segment_terminator(self, out):
-        """Adds the segment terminator to the segment string"""
-        out += self.segment_terminator
-        return out
+    def template(self):
+        """
+        Get the compiled template of this segment's definition. Templates are
+        compiled once for each Segment subclass, a plain Segment defines its own
+        elements and is compiled every time.
+        :return: a SegmentTemplate.
+        """
+        segment_class = type(self)
+        if segment_class is Segment:
+            return SegmentTemplate.from_segment(self)
+        template = _TEMPLATES.get(segment_class)
+        if template is None:
+            template = _TEMPLATES[segment_class] = SegmentTemplate.from_segment(self)
+        return template
 
     def to_dict(self):
         return {
@@ -77,8 +79,8 @@ class Segment(object):
 
     def __str__(self):
         """Return the segment as a string"""
-        out = ""
-        if self._all_fields_empty():
-            return out
-        out = self._get_fields_as_string(out)
-        return out
+        return self._format(self.element_separator, self.segment_terminator)
+
+
+# Compiled templates of Segment subclasses.
+_TEMPLATES = {}
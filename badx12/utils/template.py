@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""
+Compiled segment templates.
+
+A template is compiled once from a segment definition and formats a tuple of
+element values into a delimited segment in one step: the values are joined and
+trailing empty elements are trimmed, up to the last required element of the
+definition. Segment.template() compiles the template of a Segment subclass,
+such as an envelope header or trailer, once per class.
+"""
+from badx12._settings import DocumentSettings
+
+
+class SegmentTemplate:
+    __slots__ = ("segment_id", "element_count", "minimum_count")
+
+    def __init__(self, segment_id, required=()):
+        """
+        Compile a segment template.
+        :param segment_id: the segment id, such as N1.
+        :param required: whether each element after the id is required, the
+            elements up to the last required one are never trimmed.
+        """
+        self.segment_id = segment_id
+        self.element_count = len(required)
+        self.minimum_count = 0
+        for position, flag in enumerate(required, start=1):
+            if flag:
+                self.minimum_count = position
+
+    @classmethod
+    def from_segment(cls, segment):
+        """
+        Compile the template of a segment definition.
+        :param segment: a Segment, its id and which of its elements are required.
+        :return: a SegmentTemplate.
+        """
+        fields = segment.fields
+        return cls(
+            fields[0].content if fields else "",
+            [field.required for field in fields[1:]],
+        )
+
+    def format(
+        self,
+        values,
+        element_separator=DocumentSettings.element_separator,
+        segment_terminator=DocumentSettings.segment_terminator,
+    ):
+        """
+        Format a segment.
+        :param values: the element values after the segment id, strings.
+        :return: the delimited segment with its terminator, or an empty string
+            when the id and every value are empty.
+        """
+        count = len(values)
+        minimum = self.minimum_count
+        while count > minimum and not values[count - 1]:
+            count -= 1
+
+        if count == 0:
+            return self.segment_id + segment_terminator if self.segment_id else ""
+        if not self.segment_id and not any(values):
+            return ""
+        if count < len(values):
+            values = values[:count]
+        try:
+            elements = element_separator.join(values)
+        except TypeError:
+            elements = element_separator.join(map(str, values))
+        return self.segment_id + element_separator + elements + segment_terminator
+
+    def __repr__(self):
+        return f"SegmentTemplate({self.segment_id!r})"
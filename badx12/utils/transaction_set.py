@@ -10,6 +10,51 @@ class TransactionSet(TransactionSetEnvelope):
         TransactionSetEnvelope.__init__(self)
         self.header = TransactionSetHeader()
         self.trailer = TransactionSetTrailer()
+        self._index = None
+        self._index_body = None
+        self._index_version = None
+
+    def segment_index(self):
+        """
+        Map each segment id in the body to the positions of its segments.
+        The index is built on first use and rebuilt after the body is modified
+        through its list methods, segments edited in place aren't noticed.
+        :return: a dict of segment id to a tuple of positions in transaction_body.
+        """
+        body = self.transaction_body
+        # A plain list assigned in place of the SegmentList has no version and is
+        # indexed again on every call.
+        version = getattr(body, "version", None)
+        if (
+            version is None
+            or body is not self._index_body
+            or version != self._index_version
+        ):
+            index = {}
+            for position, segment in enumerate(body):
+                segment_id = segment.fields[0].content if segment.fields else ""
+                index.setdefault(segment_id, []).append(position)
+            self._index = {key: tuple(value) for key, value in index.items()}
+            self._index_body = body
+            self._index_version = version
+        return self._index
+
+    def find(self, segment_id):
+        """
+        Find the body segments with a segment id.
+        :param segment_id: the id, such as "N1" or "PO1".
+        :return: a list of the segments, in document order.
+        """
+        body = self.transaction_body
+        return [body[position] for position in self.segment_index().get(segment_id, ())]
+
+    def first(self, segment_id, default=None):
+        """
+        Find the first body segment with a segment id.
+        :return: the segment, or default when there's none.
+        """
+        positions = self.segment_index().get(segment_id)
+        return self.transaction_body[positions[0]] if positions else default
 
     def validate(self, report):
         """
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""
+Read-only Mapping and Sequence views over a parsed document.
+
+The views have the same shape as the to_dict() output but hold references to
+the underlying objects and only build a child view when it's accessed, so
+reaching into one group of a large document never converts the rest of it.
+"""
+from collections.abc import Mapping, Sequence
+
+from badx12.document import EDIDocument
+from badx12.utils import Element, Interchange, Segment
+from badx12.utils.group import Group
+from badx12.utils.transaction_set import (
+    TransactionSet,
+    TransactionSetHeader,
+    TransactionSetTrailer,
+)
+
+
+class ObjectView(Mapping):
+    """A lazy, read-only mapping over one object"""
+
+    __slots__ = ("_obj",)
+    _getters = {}  # type: dict
+
+    def __init__(self, obj):
+        self._obj = obj
+
+    def __getitem__(self, key):
+        try:
+            getter = self._getters[key]
+        except KeyError:
+            raise KeyError(key) from None
+        return getter(self._obj)
+
+    def __iter__(self):
+        return iter(self._getters)
+
+    def __len__(self):
+        return len(self._getters)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({type(self._obj).__name__})"
+
+
+class ListView(Sequence):
+    """A lazy, read-only sequence that wraps every item in a view on access"""
+
+    __slots__ = ("_items", "_factory")
+
+    def __init__(self, items, factory):
+        self._items = items
+        self._factory = factory
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return ListView(self._items[index], self._factory)
+        return self._factory(self._items[index])
+
+    def __len__(self):
+        return len(self._items)
+
+    def __eq__(self, other):
+        if not isinstance(other, Sequence) or isinstance(other, str):
+            return NotImplemented
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+
+    def __repr__(self):
+        return f"{type(self).__name__}(len={len(self._items)})"
+
+
+def _element_dict(element):
+    return element.to_dict()
+
+
+class SegmentView(ObjectView):
+    __slots__ = ()
+    _getters = {
+        "field_count": lambda segment: segment.field_count,
+        "fields": lambda segment: ListView(segment.fields, _element_dict),
+        "element_separator": lambda segment: segment.element_separator,
+        "segment_terminator": lambda segment: segment.segment_terminator,
+        "sub_element_separator": lambda segment: segment.sub_element_separator,
+    }
+
+
+class TransactionSetSegmentView(ObjectView):
+    """The transaction set header and trailer don't carry their separators"""
+
+    __slots__ = ()
+    _getters = {
+        "field_count": lambda segment: segment.field_count,
+        "fields": lambda segment: ListView(segment.fields, _element_dict),
+    }
+
+
+def _segment_view(segment):
+    if isinstance(segment, (TransactionSetHeader, TransactionSetTrailer)):
+        return TransactionSetSegmentView(segment)
+    return SegmentView(segment)
+
+
+class TransactionSetView(ObjectView):
+    __slots__ = ()
+    _getters = {
+        "header": lambda transaction_set: _segment_view(transaction_set.header),
+        "trailer": lambda transaction_set: _segment_view(transaction_set.trailer),
+        "body": lambda transaction_set: ListView(transaction_set.body, _segment_view),
+    }
+
+
+class GroupView(ObjectView):
+    __slots__ = ()
+    _getters = {
+        "header": lambda group: _segment_view(group.header),
+        "trailer": lambda group: _segment_view(group.trailer),
+        "body": lambda group: ListView(group.body, TransactionSetView),
+        "transaction_sets": lambda group: ListView(
+            group.transaction_sets, TransactionSetView
+        ),
+    }
+
+
+class InterchangeView(ObjectView):
+    __slots__ = ()
+    _getters = {
+        "header": lambda interchange: _segment_view(interchange.header),
+        "trailer": lambda interchange: _segment_view(interchange.trailer),
+        "body": lambda interchange: ListView(interchange.body, GroupView),
+        "groups": lambda interchange: ListView(interchange.groups, GroupView),
+    }
+
+
+class _DocumentBodyView(ObjectView):
+    __slots__ = ()
+    _getters = {
+        "text": lambda document: document.text,
+        "config": lambda document: document.config.to_dict(),
+        "interchange": lambda document: InterchangeView(document.interchange),
+    }
+
+
+class DocumentView(ObjectView):
+    __slots__ = ()
+    _getters = {"document": _DocumentBodyView}
+
+
+_VIEWS = (
+    (EDIDocument, DocumentView),
+    (Interchange, InterchangeView),
+    (Group, GroupView),
+    (TransactionSet, TransactionSetView),
+    (Segment, _segment_view),
+    (Element, _element_dict),
+)
+
+
+def view(obj):
+    """
+    Return a lazy view over a document or any of its parts.
+    :param obj: an EDIDocument, Interchange, Group, TransactionSet or Segment.
+    :return: a read-only Mapping with the same shape as obj.to_dict().
+    """
+    for cls, factory in _VIEWS:
+        if isinstance(obj, cls):
+            return factory(obj)
+
+    raise TypeError(
+        f"{view.__name__}() expects an EDIDocument or one of its parts, got {type(obj)}"
+    )
+
+
+def json_default(obj):
+    """
+    Serialize views with json.dumps(view, default=json_default).
+    Children are converted one level at a time as the encoder reaches them.
+    """
+    if isinstance(obj, ObjectView):
+        return dict(obj)
+    if isinstance(obj, ListView):
+        return list(obj)
+
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
@@ -0,0 +1,359 @@
+# -*- coding: utf-8 -*-
+"""
+Write interchanges one transaction set at a time.
+
+    with InterchangeWriter("outbound.edi") as writer:
+        writer.open_interchange("SENDER", "RECEIVER", control_number=1)
+        writer.open_group("PO", "SENDER", "RECEIVER", "004010")
+        for order in orders:
+            writer.add_transaction_set("850", order_segments(order))
+        writer.close_group()
+        writer.close_interchange()
+
+Segments are written as they're given and only the counts and control numbers
+of the open envelopes are kept, so the size of a batch doesn't affect memory
+use. SE01, GE01 and IEA01 are counted and SE02, GE02 and IEA02 repeat the
+control numbers of their headers. Group and transaction set control numbers
+are numbered from 1 when they aren't given.
+"""
+import re
+from datetime import datetime
+
+from badx12._settings import DocumentSettings
+from badx12.document import ValidationReport
+from badx12.utils import InterchangeHeader, Segment, SegmentTemplate
+from badx12.utils.errors import EnvelopeError, FieldValidationError
+from badx12.utils.group import GroupHeader
+from badx12.utils.transaction_set import TransactionSetHeader
+
+
+class InterchangeWriter:
+    def __init__(
+        self,
+        out,
+        element_separator=DocumentSettings.element_separator,
+        segment_terminator=DocumentSettings.segment_terminator,
+        sub_element_separator=DocumentSettings.sub_element_separator,
+        repetition_separator="^",
+        line_breaks=False,
+    ):
+        """
+        Create a new interchange writer.
+        :param out: the path of the file to write, or a text stream.
+        :param line_breaks: write a newline after every segment terminator.
+        """
+        if hasattr(out, "write"):
+            self.out = out
+            self._owns_out = False
+        else:
+            self.out = open(out, "w", encoding="utf-8", newline="")
+            self._owns_out = True
+        self.element_separator = element_separator
+        self.segment_terminator = segment_terminator + ("\n" if line_breaks else "")
+        self.sub_element_separator = sub_element_separator
+        self.repetition_separator = repetition_separator
+        self._segment_terminator = segment_terminator
+        # Separators that can't appear in a segment at all, element and
+        # component separators are counted instead. Before version 00501 ISA11
+        # is a code, U, rather than a separator.
+        reserved = [segment_terminator]
+        if not repetition_separator.isalnum():
+            reserved.append(repetition_separator)
+        self._separators = (element_separator, sub_element_separator, *reserved)
+        self._reserved = re.compile("|".join(map(re.escape, reserved)))
+
+        self.segment_count = 0
+        self.interchange_control_number = None
+        self.group_control_number = None
+        self.group_count = 0
+        self.transaction_set_count = 0
+        self._next_group_control_number = 1
+        self._next_transaction_set_control_number = 1
+
+    def open_interchange(
+        self,
+        sender_id,
+        receiver_id,
+        control_number,
+        sender_qualifier="ZZ",
+        receiver_qualifier="ZZ",
+        date=None,
+        version=DocumentSettings.version,
+        acknowledgment_requested="0",
+        usage_indicator="P",
+    ):
+        """
+        Write an ISA segment.
+        :param sender_id: ISA06, padded to 15 characters.
+        :param receiver_id: ISA08, padded to 15 characters.
+        :param control_number: ISA13, an int is padded with zeros to 9 digits.
+        :param date: the datetime of ISA09 and ISA10, now by default.
+        :param usage_indicator: ISA15, P for production or T for test data.
+        """
+        if self.interchange_control_number is not None:
+            raise EnvelopeError(msg="An interchange is already open")
+        date = date or datetime.now()
+        if isinstance(control_number, int):
+            control_number = f"{control_number:09}"
+
+        header = InterchangeHeader()
+        values = (
+            "00",
+            " " * 10,
+            "00",
+            " " * 10,
+            sender_qualifier,
+            str(sender_id).ljust(15),
+            receiver_qualifier,
+            str(receiver_id).ljust(15),
+            date.strftime("%y%m%d"),
+            date.strftime("%H%M"),
+            self.repetition_separator,
+            version,
+            control_number,
+            acknowledgment_requested,
+            usage_indicator,
+            self.sub_element_separator,
+        )
+        self._write_header(header, values)
+        self.interchange_control_number = control_number
+        self.group_count = 0
+
+    def open_group(
+        self,
+        functional_id,
+        sender_code,
+        receiver_code,
+        version,
+        control_number=None,
+        date=None,
+        responsible_agency="X",
+    ):
+        """
+        Write a GS segment.
+        :param functional_id: GS01, such as PO for purchase orders.
+        :param version: GS08, such as 004010 or 005010X221A1.
+        :param control_number: GS06, the next number after the previous group's
+            by default.
+        :param date: the datetime of GS04 and GS05, now by default.
+        """
+        if self.interchange_control_number is None:
+            raise EnvelopeError(msg="A group must be opened in an interchange")
+        if self.group_control_number is not None:
+            raise EnvelopeError(msg="A group is already open")
+        date = date or datetime.now()
+        if control_number is None:
+            control_number = self._next_group_control_number
+        control_number = str(control_number)
+        if control_number.isdigit():
+            self._next_group_control_number = int(control_number) + 1
+
+        values = (
+            functional_id,
+            sender_code,
+            receiver_code,
+            date.strftime("%Y%m%d"),
+            date.strftime("%H%M"),
+            control_number,
+            responsible_agency,
+            version,
+        )
+        self._write_header(GroupHeader(), values)
+        self.group_control_number = control_number
+        self.transaction_set_count = 0
+        self._next_transaction_set_control_number = 1
+
+    def add_transaction_set(
+        self, transaction_set_id, segments, control_number=None, reference=None
+    ):
+        """
+        Write a transaction set, its ST and SE segments are added.
+        :param transaction_set_id: ST01, such as 850.
+        :param segments: an iterable of the body segments, each a sequence of the
+            segment id and element values, a (SegmentTemplate, values) pair or
+            a Segment. An element given as a sequence is a composite and its
+            components are joined.
+        :param control_number: ST02, an int is padded with zeros to 4 digits,
+            numbered from 1 in each group by default.
+        :param reference: ST03, the implementation convention reference.
+        :return: the control number of the transaction set.
+        """
+        if self.group_control_number is None:
+            raise EnvelopeError(msg="A transaction set must be added to a group")
+        if control_number is None:
+            control_number = self._next_transaction_set_control_number
+        if isinstance(control_number, int):
+            self._next_transaction_set_control_number = control_number + 1
+            control_number = f"{control_number:04}"
+
+        values = (transaction_set_id, control_number, reference or "")
+        self._write_header(TransactionSetHeader(), values)
+        count = 2
+        for segment in segments:
+            if (
+                type(segment) is tuple
+                and len(segment) == 2
+                and isinstance(segment[0], SegmentTemplate)
+            ):
+                self.write_segment(segment[1], template=segment[0])
+            else:
+                self.write_segment(segment)
+            count += 1
+        self.write_segment(("SE", str(count), control_number))
+        self.transaction_set_count += 1
+        return control_number
+
+    def close_group(self):
+        """Write the GE segment of the open group"""
+        if self.group_control_number is None:
+            raise EnvelopeError(msg="No group is open")
+        self.write_segment(
+            ("GE", str(self.transaction_set_count), self.group_control_number)
+        )
+        self.group_control_number = None
+        self.group_count += 1
+
+    def close_interchange(self):
+        """Write the IEA segment of the open interchange, closing its open group"""
+        if self.interchange_control_number is None:
+            raise EnvelopeError(msg="No interchange is open")
+        if self.group_control_number is not None:
+            self.close_group()
+        self.write_segment(
+            ("IEA", str(self.group_count), self.interchange_control_number)
+        )
+        self.interchange_control_number = None
+
+    def write_segment(self, elements, template=None):
+        """
+        Write a segment, trailing empty elements are left out.
+        :param elements: the segment id and element values, an element given as
+            a sequence is a composite and its components are joined. A Segment
+            is written as it is, its elements may already hold composites, and
+            a string is a segment already delimited with the writer's separators.
+        :param template: a SegmentTemplate, elements are then the values after
+            the segment id and are only trimmed after its last required element.
+        """
+        if isinstance(elements, str):
+            if self._segment_terminator in elements:
+                raise FieldValidationError(
+                    segment=elements.split(self.element_separator, 1)[0],
+                    msg=f"The segment {elements!r} contains the segment terminator",
+                )
+            self.out.write(elements + self.segment_terminator)
+            self.segment_count += 1
+            return
+
+        if isinstance(elements, Segment):
+            values = [field.content for field in elements.fields]
+            component_separators = None
+        else:
+            values = []
+            component_separators = 0
+            for value in elements:
+                if isinstance(value, (list, tuple)):
+                    values.append(self.sub_element_separator.join(map(str, value)))
+                    component_separators += len(value) - 1
+                else:
+                    values.append(value if isinstance(value, str) else str(value))
+
+        if template is None:
+            while values and values[-1] == "":
+                values.pop()
+            if not values or values[0] == "":
+                raise FieldValidationError(
+                    segment="",
+                    msg=f"The segment {elements!r} has no segment id",
+                )
+        text = self.element_separator.join(values)
+        # One search of the segment instead of one per element, a separator in a
+        # value shows up as a separator more than the segment should have.
+        if component_separators is None:
+            invalid = self._segment_terminator in text
+        else:
+            invalid = (
+                self._reserved.search(text)
+                or text.count(self.sub_element_separator) != component_separators
+            )
+        if invalid or text.count(self.element_separator) != len(values) - 1:
+            raise self._separator_error(elements, template)
+        if template is not None:
+            text = template.format(values, self.element_separator, "")
+        self.out.write(text + self.segment_terminator)
+        self.segment_count += 1
+
+    def _separator_error(self, elements, template=None):
+        """:return: a FieldValidationError for the element holding a separator."""
+        if isinstance(elements, Segment):
+            elements = [field.content for field in elements.fields]
+            separators = (self.element_separator, self._segment_terminator)
+        else:
+            separators = self._separators
+        if template is not None:
+            elements = [template.segment_id, *elements]
+        segment_id = str(elements[0]) if elements else ""
+        for value in elements:
+            components = value if isinstance(value, (list, tuple)) else (value,)
+            for component in map(str, components):
+                if any(separator in component for separator in separators):
+                    break
+            else:
+                continue
+            return FieldValidationError(
+                segment=segment_id,
+                msg=f"The {segment_id} element {value!r} contains a separator",
+            )
+
+    def _write_header(self, header, values):
+        """
+        Validate the elements of an envelope header against its definition and
+        write it.
+        :param header: an empty InterchangeHeader, GroupHeader or TransactionSetHeader.
+        """
+        report = ValidationReport()
+        for position, value in enumerate(values, start=1):
+            header.fields[position].content = value
+            header.fields[position].validate(report)
+        if not report.is_document_valid():
+            raise report.error_list[0]
+
+        segment_id = header.fields[0].content
+        if segment_id != "ISA":
+            self.write_segment(values, template=header.template())
+            return
+
+        # ISA11 and ISA16 are the separators themselves.
+        checked = (segment_id,) + values[:10] + values[11:15]
+        if any(s in value for value in checked for s in self._separators):
+            raise self._separator_error(checked)
+        self.out.write(
+            self.element_separator.join((segment_id,) + values)
+            + self.segment_terminator
+        )
+        self.segment_count += 1
+
+    def close(self):
+        """Close the open group and interchange, and the file when it was opened here"""
+        if self.interchange_control_number is not None:
+            self.close_interchange()
+        if self._owns_out:
+            self.out.close()
+
+    def __enter__(self):
+        return self
+
+    def abort(self):
+        """
+        Close the file when it was opened here, without the trailers of the open
+        envelopes. An interchange cut short isn't closed with trailers it
+        doesn't match.
+        """
+        self.interchange_control_number = self.group_control_number = None
+        if self._owns_out:
+            self.out.close()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
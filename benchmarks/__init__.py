@@ -0,0 +1,2 @@
+# -*- coding: utf-8 -*-
+"""Synthetic corpus generation and performance benchmarks for badx12."""
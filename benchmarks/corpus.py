@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+"""
+Generate valid synthetic X12 interchanges of a configurable size.
+
+The output only depends on the arguments, the same seed always produces the
+same bytes, so corpora can be regenerated instead of checked in.
+"""
+import argparse
+import random
+import string
+from pathlib import Path
+
+BODY_SEGMENT_IDS = (
+    "BPR",
+    "TRN",
+    "REF",
+    "DTM",
+    "N1",
+    "N3",
+    "N4",
+    "PER",
+    "LX",
+    "CLP",
+    "NM1",
+    "AMT",
+    "SVC",
+    "CAS",
+)
+ALPHABET = string.ascii_uppercase + string.digits
+SIZE_UNITS = {"KB": 1024, "MB": 1024 ** 2, "GB": 1024 ** 3}
+
+
+class CorpusSpec:
+    def __init__(
+        self,
+        segments_per_set=30,
+        sets_per_group=100,
+        groups=1,
+        size=None,
+        min_elements=2,
+        max_elements=8,
+        min_width=1,
+        max_width=12,
+        element_separator="*",
+        segment_terminator="~",
+        sub_element_separator=":",
+        line_breaks=False,
+        seed=0,
+    ):
+        """
+        Describe a synthetic interchange.
+        :param segments_per_set: the number of body segments in each transaction set.
+        :param sets_per_group: the number of transaction sets in each group.
+        :param groups: the number of groups, ignored when size is given.
+        :param size: add transaction sets until the interchange reaches this many bytes.
+        :param min_elements: the fewest elements in a body segment.
+        :param max_elements: the most elements in a body segment.
+        :param min_width: the shortest element value.
+        :param max_width: the longest element value.
+        :param line_breaks: write a newline after every segment terminator.
+        :param seed: the random seed, the same spec always generates the same bytes.
+        """
+        separators = {element_separator, segment_terminator, sub_element_separator}
+        if len(separators) != 3 or separators & set(ALPHABET + " "):
+            raise ValueError(
+                "The separators must be distinct and not letters, digits or spaces."
+            )
+
+        self.segments_per_set = segments_per_set
+        self.sets_per_group = min(sets_per_group, 999999)
+        self.groups = groups
+        self.size = size
+        self.min_elements = min_elements
+        self.max_elements = max_elements
+        self.min_width = min_width
+        self.max_width = max_width
+        self.element_separator = element_separator
+        self.segment_terminator = segment_terminator
+        self.sub_element_separator = sub_element_separator
+        self.line_breaks = line_breaks
+        self.seed = seed
+
+    def to_dict(self):
+        return dict(vars(self))
+
+
+def generate(spec, out):
+    """
+    Write a synthetic interchange.
+    Segments are written as they're generated, so the size of the interchange
+    doesn't affect memory use.
+    :param spec: a CorpusSpec.
+    :param out: a text stream to write the interchange to.
+    :return: the number of segments written.
+    """
+    rng = random.Random(spec.seed)
+    e = spec.element_separator
+    terminator = spec.segment_terminator + ("\n" if spec.line_breaks else "")
+    repetition_separator = "^" if "^" not in (e, spec.segment_terminator) else "!"
+    written = segment_count = 0
+
+    def write(*elements):
+        nonlocal written, segment_count
+        segment = e.join(elements) + terminator
+        out.write(segment)
+        written += len(segment)
+        segment_count += 1
+
+    write(
+        "ISA",
+        "00",
+        " " * 10,
+        "00",
+        " " * 10,
+        "ZZ",
+        "SENDER".ljust(15),
+        "ZZ",
+        "RECEIVER".ljust(15),
+        "200101",
+        "1200",
+        repetition_separator,
+        "00501",
+        "000000001",
+        "0",
+        "T",
+        spec.sub_element_separator,
+    )
+
+    def more():
+        return group < spec.groups if spec.size is None else written < spec.size
+
+    group = 0
+    while more():
+        group += 1
+        control_number = str(group)
+        write(
+            "GS",
+            "HP",
+            "SENDER",
+            "RECEIVER",
+            "20200101",
+            "1200",
+            control_number,
+            "X",
+            "005010X221A1",
+        )
+        set_count = 0
+        while set_count < spec.sets_per_group and (spec.size is None or more()):
+            set_count += 1
+            set_control_number = str(set_count).zfill(4)
+            write("ST", "835", set_control_number)
+            for _ in range(spec.segments_per_set):
+                write(*_body_segment(rng, spec))
+            write("SE", str(spec.segments_per_set + 2), set_control_number)
+        write("GE", str(set_count), control_number)
+
+    write("IEA", str(group), "000000001")
+    return segment_count
+
+
+def _body_segment(rng, spec):
+    segment = [rng.choice(BODY_SEGMENT_IDS)]
+    for _ in range(rng.randint(spec.min_elements, spec.max_elements)):
+        value = "".join(
+            rng.choices(ALPHABET, k=rng.randint(spec.min_width, spec.max_width))
+        )
+        if len(value) > 2 and rng.random() < 0.1:
+            value = value[:2] + spec.sub_element_separator + value[2:]
+        segment.append(value)
+    return segment
+
+
+def write_corpus(spec, path):
+    """
+    Generate a corpus file unless it already exists.
+    :return: the path of the corpus.
+    """
+    path = Path(path)
+    if not path.exists():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        partial = path.with_name(path.name + ".partial")
+        with open(partial, "w", newline="") as f:
+            generate(spec, f)
+        partial.replace(path)
+    return path
+
+
+def parse_size(size):
+    """Parse a size such as 1MB, 100MB or 1GB into bytes"""
+    size = size.strip().upper()
+    for unit, multiplier in SIZE_UNITS.items():
+        if size.endswith(unit):
+            return int(float(size[: -len(unit)]) * multiplier)
+    return int(size)
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arg_parser.add_argument("output", help="The file to write the interchange to.")
+    arg_parser.add_argument("--size", help="The target size, such as 1MB or 1GB.")
+    arg_parser.add_argument("--groups", type=int, default=1)
+    arg_parser.add_argument("--sets-per-group", type=int, default=100)
+    arg_parser.add_argument("--segments-per-set", type=int, default=30)
+    arg_parser.add_argument("--max-elements", type=int, default=8)
+    arg_parser.add_argument("--max-width", type=int, default=12)
+    arg_parser.add_argument("--element-separator", default="*")
+    arg_parser.add_argument("--segment-terminator", default="~")
+    arg_parser.add_argument("--sub-element-separator", default=":")
+    arg_parser.add_argument("--line-breaks", action="store_true")
+    arg_parser.add_argument("--seed", type=int, default=0)
+    args = arg_parser.parse_args(argv)
+
+    spec = CorpusSpec(
+        segments_per_set=args.segments_per_set,
+        sets_per_group=args.sets_per_group,
+        groups=args.groups,
+        size=parse_size(args.size) if args.size else None,
+        max_elements=args.max_elements,
+        max_width=args.max_width,
+        element_separator=args.element_separator,
+        segment_terminator=args.segment_terminator,
+        sub_element_separator=args.sub_element_separator,
+        line_breaks=args.line_breaks,
+        seed=args.seed,
+    )
+    with open(args.output, "w", newline="") as f:
+        generate(spec, f)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""
+Measure the start up time of badx12 against a time budget.
+
+Each command runs in a fresh interpreter several times and the fastest run is
+reported, minus the start up time of a bare interpreter, so the numbers are the
+cost badx12 itself adds. Exits with status 1 when a command is over budget.
+
+    python -m benchmarks.startup
+"""
+import argparse
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+SAMPLE = Path(__file__).parents[1] / "tests" / "files" / "edi" / "X221-era-sample.edi"
+
+# Milliseconds on top of a bare interpreter, see the README.
+BUDGETS = {
+    "import": 100,
+    "help": 200,
+    "parse": 150,
+}
+
+
+def commands(output_dir):
+    python = sys.executable
+    return {
+        "import": [python, "-c", "import badx12"],
+        "help": [python, "-m", "badx12", "--help"],
+        "parse": [python, "-m", "badx12", "parse", str(SAMPLE)]
+        + ["--output_dir", output_dir, "--force"],
+    }
+
+
+def best_time(command, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        subprocess.run(
+            command, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def measure(repeat=10):
+    """:return: a dict of command name to milliseconds over a bare interpreter."""
+    baseline = best_time([sys.executable, "-c", "pass"], repeat)
+    with tempfile.TemporaryDirectory() as output_dir:
+        return {
+            name: (best_time(command, repeat) - baseline) * 1000
+            for name, command in commands(output_dir).items()
+        }
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arg_parser.add_argument("--repeat", type=int, default=10)
+    args = arg_parser.parse_args(argv)
+
+    over_budget = False
+    for name, milliseconds in measure(args.repeat).items():
+        budget = BUDGETS[name]
+        over_budget |= milliseconds > budget
+        status = "ok" if milliseconds <= budget else "OVER BUDGET"
+        print(f"{name:<8} {milliseconds:>8.1f} ms  budget {budget:>4} ms  {status}")
+
+    sys.exit(1 if over_budget else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark tokenizing, parsing, validating, converting and exporting synthetic corpora.
+
+Every benchmark runs in its own process so that its peak RSS isn't inflated by
+the benchmarks before it. Results are written to a JSON file which can be
+compared against a previous run with --compare.
+
+    python -m benchmarks.suite --sizes 1MB,100MB --output results.json
+    python -m benchmarks.suite --sizes 1MB --compare results.json
+"""
+import argparse
+import atexit
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+from benchmarks.corpus import CorpusSpec, parse_size, write_corpus
+
+try:
+    import resource
+except ImportError:  # pragma: no cover, not available on Windows
+    resource = None
+
+RESULTS_VERSION = 2
+CORPUS_DIR = Path(__file__).parent / ".corpus"
+
+
+def tokenize(text):
+    """Split a document into segments and elements the way the parser does"""
+    element_separator = text[3:4]
+    segment_terminator = text[105:106]
+    return [
+        segment.split(element_separator)
+        for segment in text.replace("\n", "").split(segment_terminator)
+        if segment
+    ]
+
+
+def _read(path):
+    with open(path, "r") as f:
+        return f.read()
+
+
+def _count_segments(path, chunk_size=1024 * 1024):
+    with open(path, "r") as f:
+        segment_terminator = f.read(106)[105:106]
+        f.seek(0)
+        return sum(
+            chunk.count(segment_terminator)
+            for chunk in iter(lambda: f.read(chunk_size), "")
+        )
+
+
+def _tokenize(path):
+    text = _read(path)
+    return lambda: tokenize(text)
+
+
+def _parse(path):
+    from badx12 import Parser
+
+    return Parser(path).document
+
+
+def _cli_export(path):
+    output_dir = tempfile.mkdtemp(prefix="badx12-bench-")
+    atexit.register(shutil.rmtree, output_dir, True)
+    command = [sys.executable, "-m", "badx12", "parse", str(path)]
+    command += ["--output_dir", output_dir, "--force"]
+
+    def run():
+        subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+
+    return run
+
+
+# Each benchmark takes the corpus path, does its untimed set up and returns the
+# function to time.
+BENCHMARKS = {
+    "tokenize": _tokenize,
+    "parse": lambda path: lambda: _parse(path),
+    "validate": lambda path: _parse(path).validate,
+    "to_dict": lambda path: _parse(path).to_dict,
+    "format_as_edi": lambda path: _parse(path).format_as_edi,
+    "cli_export": _cli_export,
+}
+
+
+def run_benchmark(name, path, repeat=3, trace=True):
+    """
+    Time one benchmark in the current process.
+    :param repeat: the number of timed runs, the fastest is reported.
+    :param trace: also run it once under tracemalloc to measure allocations.
+    :return: a dict of measurements.
+    """
+    func = BENCHMARKS[name](path)
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+
+    result = {"seconds": min(timings), "mean_seconds": sum(timings) / len(timings)}
+
+    # Allocations are measured separately, tracing slows the timed runs down a lot.
+    if trace and name != "cli_export":
+        tracemalloc.start()
+        baseline = tracemalloc.get_traced_memory()[0]
+        func()
+        result["allocated_peak_mb"] = (
+            tracemalloc.get_traced_memory()[1] - baseline
+        ) / 1e6
+        tracemalloc.stop()
+
+    if resource is not None and name == "cli_export":
+        result["peak_rss_mb"] = _max_rss_mb(
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+        )
+
+    return result
+
+
+def run_isolated(name, path, repeat=3, trace=True):
+    """Run a benchmark in a child process and add the child's peak RSS"""
+    command = [sys.executable, "-m", "benchmarks.suite", "--child", name, str(path)]
+    command += ["--repeat", str(repeat)] + ([] if trace else ["--no-trace"])
+    process = subprocess.Popen(command, stdout=subprocess.PIPE)
+    output = process.stdout.read()
+
+    if resource is not None and hasattr(os, "wait4"):
+        _, status, usage = os.wait4(process.pid, 0)
+        process.returncode = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -1
+        peak_rss_mb = _max_rss_mb(usage.ru_maxrss)
+    else:
+        process.wait()
+        peak_rss_mb = None
+
+    if process.returncode != 0:
+        raise RuntimeError(f"The {name} benchmark failed on {path}")
+
+    result = json.loads(output)
+    if peak_rss_mb is not None:
+        result["peak_rss_mb"] = max(peak_rss_mb, result.get("peak_rss_mb", 0))
+    return result
+
+
+def _max_rss_mb(max_rss):
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS.
+    return max_rss / 1e6 if sys.platform == "darwin" else max_rss / 1e3
+
+
+def run_suite(sizes, benchmarks=None, repeat=3, trace=True, corpus_dir=CORPUS_DIR):
+    """
+    Run benchmarks against a corpus of each size.
+    :param sizes: corpus sizes such as "1MB" or "1GB".
+    :param benchmarks: the names of the benchmarks to run, all of them by default.
+    :return: the results document.
+    """
+    benchmarks = benchmarks or list(BENCHMARKS)
+    results = []
+    for size in sizes:
+        spec = CorpusSpec(size=parse_size(size))
+        path = write_corpus(
+            spec, Path(corpus_dir) / f"synthetic-{size}-{spec.seed}.edi"
+        )
+        byte_size = path.stat().st_size
+        segment_count = _count_segments(path)
+
+        for name in benchmarks:
+            result = run_isolated(name, path, repeat=repeat, trace=trace)
+            result.update(
+                {
+                    "benchmark": name,
+                    "size": size,
+                    "bytes": byte_size,
+                    "segments": segment_count,
+                    "mb_per_second": byte_size / 1e6 / result["seconds"],
+                    "segments_per_second": segment_count / result["seconds"],
+                    "corpus": spec.to_dict(),
+                }
+            )
+            results.append(result)
+            print(_format_result(result), file=sys.stderr)
+
+    from badx12 import __version__
+
+    return {
+        "version": RESULTS_VERSION,
+        "badx12": __version__,
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "repeat": repeat,
+        "results": results,
+    }
+
+
+def _format_result(result):
+    line = (
+        f"{result['benchmark']:<14} {result['size']:>6} "
+        f"{result['seconds']:>9.3f}s {result['mb_per_second']:>9.2f} MB/s "
+        f"{result['segments_per_second']:>12.0f} seg/s"
+    )
+    if "peak_rss_mb" in result:
+        line += f" {result['peak_rss_mb']:>9.1f} MB rss"
+    if "allocated_peak_mb" in result:
+        line += f" {result['allocated_peak_mb']:>9.1f} MB allocated"
+    return line
+
+
+def compare(baseline, current):
+    """
+    Compare two results documents.
+    :return: a list of (benchmark, size, baseline seconds, current seconds, ratio)
+    for the benchmarks present in both, a ratio above 1 is a slowdown. Results
+    measured on corpora generated from different specs aren't compared.
+    """
+    previous = {(r["benchmark"], r["size"]): r for r in baseline["results"]}
+    rows = []
+    for result in current["results"]:
+        before = previous.get((result["benchmark"], result["size"]))
+        if before is not None and before.get("corpus") == result.get("corpus"):
+            rows.append(
+                (
+                    result["benchmark"],
+                    result["size"],
+                    before["seconds"],
+                    result["seconds"],
+                    result["seconds"] / before["seconds"],
+                )
+            )
+    return rows
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arg_parser.add_argument("--sizes", default="1MB", help="e.g. 1MB,100MB,1GB")
+    arg_parser.add_argument(
+        "--benchmarks", default=",".join(BENCHMARKS), help="Comma separated names."
+    )
+    arg_parser.add_argument("--repeat", type=int, default=3)
+    arg_parser.add_argument(
+        "--no-trace", action="store_true", help="Skip measuring allocations."
+    )
+    arg_parser.add_argument("--corpus-dir", default=str(CORPUS_DIR))
+    arg_parser.add_argument("--output", help="Write the results to this JSON file.")
+    arg_parser.add_argument("--compare", help="A previous results file to compare to.")
+    arg_parser.add_argument("--child", nargs=2, help=argparse.SUPPRESS)
+    args = arg_parser.parse_args(argv)
+
+    if args.child:
+        name, path = args.child
+        result = run_benchmark(name, path, repeat=args.repeat, trace=not args.no_trace)
+        print(json.dumps(result))
+        return
+
+    results = run_suite(
+        args.sizes.split(","),
+        benchmarks=args.benchmarks.split(","),
+        repeat=args.repeat,
+        trace=not args.no_trace,
+        corpus_dir=args.corpus_dir,
+    )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        for name, size, before, after, ratio in compare(baseline, results):
+            print(
+                f"{name:<14} {size:>6} {before:>9.3f}s -> {after:>9.3f}s {ratio:>6.2f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
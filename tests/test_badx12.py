@@ -4,14 +4,45 @@
 """Tests for `badx12` package."""
 
 import collections
+import http.client
+import io
+import json
+import os
+import pickle
 import shutil
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
+import click
 import pytest
 from click.testing import CliRunner
 
-from badx12 import Parser, cli
-from badx12.common.click import add_commands
-from badx12.utils import errors as err
+from badx12 import EDIDocument, Parser, cli, query
+from badx12.cache import ParseCache
+from badx12.commands import get_command
+from badx12.commands.parse.batch import ParsePipeline, parse_and_format
+from badx12.commands.serve.server import make_server
+from badx12.commands.watch.watcher import DirectoryWatcher
+from badx12.common import metrics, profiling
+from badx12.common.click import LazyGroup, add_commands
+from badx12.common.paths import iter_files
+from badx12.common.pipeline import Pipeline, Stage
+from badx12.control_numbers import (
+    ControlNumber,
+    ControlNumberIndex,
+    extract_control_numbers,
+)
+from badx12.index import OffsetIndex
+from badx12.stream import iter_segments, iter_transaction_sets
+from badx12.utils import SegmentTemplate, errors as err
+from badx12.utils.transaction_set import TransactionSetHeader
+from badx12.views import json_default, view
+from badx12.writer import InterchangeWriter
+from benchmarks.corpus import CorpusSpec, generate
+from benchmarks.suite import compare, run_suite, tokenize
 from tests.utils import TEST_FILE_DIR, TEST_TEMP_FILE_DIR
 
 
@@ -32,7 +63,7 @@ def test_cli(test_files, cli_runner):
     good_files = test_files["edi"]
     bad_files = test_files["errors"].glob("*.edi")
 
-    for ext in ["json", "xml"]:
+    for ext in ["json", "xml", "csv", "sqlite"]:
         for f in good_files:
             TEST_TEMP_FILE_DIR.mkdir()
             result = cli_runner.invoke(
@@ -82,6 +113,57 @@ def test_click_common():
         add_commands(cli, ("command", "command"))
 
 
+def test_lazy_imports():
+    code = (
+        "import sys, badx12; "
+        "from click.testing import CliRunner; "
+        "sys.argv[1:] and CliRunner().invoke(badx12.cli, sys.argv[1:]); "
+        "print(' '.join(sorted(m for m in sys.modules if m.startswith(("
+        "'badx12.commands.', 'badx12.serialization', 'dicttoxml', 'multiprocessing', "
+        "'http.server')))))"
+    )
+
+    def imported(*args):
+        output = subprocess.run(
+            [sys.executable, "-c", code, *args],
+            check=True,
+            stdout=subprocess.PIPE,
+            cwd=str(TEST_FILE_DIR.parents[1]),
+        ).stdout
+        return set(output.decode().split())
+
+    assert imported() == set()
+    loaded = imported("parse", "--help")
+    assert "badx12.commands.parse" in loaded
+    assert not loaded & {"badx12.commands.serve", "dicttoxml", "http.server"}
+    # Listing the commands doesn't load the server or the worker pools.
+    loaded = imported("--help")
+    assert "badx12.commands.serve" in loaded
+    assert not loaded & {
+        "badx12.commands.serve.server",
+        "http.server",
+        "multiprocessing",
+    }
+    assert get_command("diff").name == "diff"
+    with pytest.raises(KeyError):
+        get_command("missing")
+    assert set(cli.list_commands(None)) == {
+        "parse",
+        "watch",
+        "serve",
+        "grep",
+        "diff",
+        "split",
+    }
+
+    with pytest.raises(TypeError):
+        add_commands(click.Group(), ("badx12.common.paths:OUTPUT_DIR",))
+
+    group = LazyGroup()
+    add_commands(group, ("badx12.commands.parse:parse",))
+    assert group.get_command(None, "parse").name == "parse"
+
+
 def test_edi(test_files):
     files = test_files["edi"]
     assert len(files) > 0
@@ -125,3 +207,885 @@ def test_coverage(test_files):
     parser = Parser((test_files["errors"] / "unknown_segment_error.edi"))
     repr(parser.document)
     str(parser.document.interchange.header)
+
+
+def test_corpus(tmp_path):
+    specs = [
+        CorpusSpec(segments_per_set=5, sets_per_group=3, groups=2),
+        CorpusSpec(
+            size=20000,
+            sets_per_group=4,
+            element_separator="|",
+            segment_terminator="'",
+            sub_element_separator=">",
+            line_breaks=True,
+            seed=7,
+        ),
+    ]
+    for spec in specs:
+        out = io.StringIO()
+        segment_count = generate(spec, out)
+        text = out.getvalue()
+        document = Parser(text).document
+
+        assert document.validate().is_document_valid() is True
+        assert document.stats.segment_count == segment_count == len(tokenize(text))
+        regenerated = io.StringIO()
+        generate(spec, regenerated)
+        assert regenerated.getvalue() == text
+
+    assert len(text) >= 20000
+    assert document.stats.group_count > 1
+
+    with pytest.raises(ValueError):
+        CorpusSpec(element_separator="~")
+
+    baseline = {"results": [{"benchmark": "parse", "size": "1MB", "seconds": 2.0}]}
+    current = {"results": [{"benchmark": "parse", "size": "1MB", "seconds": 3.0}]}
+    assert compare(baseline, current) == [("parse", "1MB", 2.0, 3.0, 1.5)]
+    current["results"][0]["corpus"] = CorpusSpec(size=1024 * 1024, seed=1).to_dict()
+    assert compare(baseline, current) == []
+
+    results = run_suite(
+        ["16KB"], ["tokenize"], repeat=1, trace=False, corpus_dir=tmp_path
+    )
+    assert results["results"][0]["corpus"] == CorpusSpec(size=16 * 1024).to_dict()
+
+
+def test_records():
+    parser = Parser((TEST_FILE_DIR / "edi" / "X221-era-sample.edi"))
+    document = parser.document
+    records = list(document.to_records())
+
+    assert records[0].segment_id == "ISA"
+    assert records[0].element_position == 1
+    assert records[-1].segment_id == "IEA"
+    assert all(r.interchange_control_number == "000000195" for r in records)
+
+    st_records = [r for r in records if r.segment_id == "ST"]
+    assert st_records[0].value == "835"
+    assert st_records[1].value == st_records[1].transaction_set_control_number
+
+    segment_count = 2
+    for group in document.interchange.groups:
+        segment_count += 2
+        for transaction_set in group.transaction_sets:
+            segment_count += transaction_set.number_of_segments()
+    assert records[-1].segment_ordinal == segment_count
+
+    # Segments left out by keep are still counted, the others keep their ordinals.
+    keep = {"BPR", "CLP"}
+    projected = Parser(parser.document_text, keep=keep).document
+    envelopes = {"ISA", "GS", "ST", "SE", "GE", "IEA"}
+    kept = [r for r in records if r.segment_id in keep | envelopes]
+    for loaded in (projected, EDIDocument.from_bytes(projected.to_bytes())):
+        assert list(loaded.to_records()) == kept
+
+
+def test_segment_index():
+    document = Parser((TEST_FILE_DIR / "edi" / "X221-era-sample.edi")).document
+    transaction_set = document.interchange.groups[0].transaction_sets[0]
+    body = transaction_set.transaction_body
+
+    svc = [s for s in body if s.fields[0].content == "SVC"]
+    assert transaction_set.find("SVC") == svc and len(svc) == 5
+    assert transaction_set.first("CLP").fields[1].content == "7722337"
+    assert transaction_set.find("PO1") == []
+    assert transaction_set.first("PO1") is None
+
+    body.insert(0, svc[-1])
+    assert transaction_set.segment_index()["SVC"][0] == 0
+    del body[0]
+    body.remove(svc[0])
+    assert transaction_set.find("SVC") == svc[1:]
+    body.append(svc[0])
+    assert transaction_set.find("SVC")[-1] is svc[0]
+
+    transaction_set.transaction_body = list(reversed(body))
+    assert transaction_set.first("SVC") is svc[0]
+
+
+def test_query_and_stream(test_files):
+    for file in test_files["edi"]:
+        document = Parser(file).document
+        streamed = list(iter_transaction_sets(file, chunk_size=64))
+        transaction_sets = [
+            transaction_set
+            for group in document.interchange.groups
+            for transaction_set in group.transaction_sets
+        ]
+        assert [s.transaction_set.to_dict() for s in streamed] == [
+            t.to_dict() for t in transaction_sets
+        ]
+        assert len(list(iter_segments(file))) == document.stats.segment_count
+
+        data = file.read_bytes()
+        for s in streamed:
+            text = data[s.offset : s.offset + s.length].decode("utf-8")
+            assert text.startswith("ST") and text.endswith(
+                document.config.segment_terminator
+            )
+
+    file = TEST_FILE_DIR / "edi" / "X221-era-sample.edi"
+    document = Parser(file).document
+    path = "GS/ST[ST01=835]/N1[N101=PR]/N102"
+    assert query.compile(path) is query.compile(path)
+    assert document.query(path) == ["DELTA DENTAL OF ABC"]
+    assert query.findall(path, iter_transaction_sets(file)) == ["DELTA DENTAL OF ABC"]
+    assert document.query("ST[ST01=850]/N1/N102") == []
+    assert document.query("N1[N101!=PR]/N102") == ["BAN DDS LLC"]
+    assert document.query("ST/SE01") == ["35"]
+    assert document.query("CLP[CLP01=7722337]/SVC/SVC01-2")[0] == "D0120"
+    assert document.query("GS") == document.interchange.groups
+
+    for path in ("GS/ISA", "ST[N101=PR]", "N1/N101/N102", "N1[N101=PR", ""):
+        with pytest.raises(err.QuerySyntaxError):
+            query.compile(path)
+
+
+def test_keep(test_files, tmp_path):
+    for file in test_files["edi"]:
+        document = Parser(file).document
+        projected = Parser(file, keep={"N1", "CLP"}).document
+        assert projected.validate().is_document_valid() == (
+            document.validate().is_document_valid()
+        )
+        for group, projected_group in zip(
+            document.interchange.groups, projected.interchange.groups
+        ):
+            for transaction_set, projected_set in zip(
+                group.transaction_sets, projected_group.transaction_sets
+            ):
+                kept = [
+                    s.to_dict()
+                    for s in transaction_set.transaction_body
+                    if s.fields[0].content in ("N1", "CLP")
+                ]
+                assert [s.to_dict() for s in projected_set.transaction_body] == kept
+                assert (
+                    projected_set.number_of_segments()
+                    == transaction_set.number_of_segments()
+                )
+
+        loaded = EDIDocument.from_bytes(projected.to_bytes())
+        assert loaded.validate().is_document_valid() == (
+            projected.validate().is_document_valid()
+        )
+
+    file = TEST_FILE_DIR / "edi" / "X221-era-sample.edi"
+    document = Parser(file, keep=lambda segment_id: segment_id == "BPR").document
+    transaction_set = document.interchange.groups[0].transaction_sets[0]
+    assert [s.fields[0].content for s in transaction_set.transaction_body] == ["BPR"]
+    assert transaction_set.skipped_segments == 32
+
+    cache = ParseCache(tmp_path)
+    Parser(file, cache=cache)
+    projected = Parser(file, cache=cache, keep={"BPR"}).document
+    assert projected.interchange.groups[0].transaction_sets[0].skipped_segments == 32
+    assert cache.hits == 0
+
+    ship_to = query.compile("N1[N101=PR]/N102")
+    assert ship_to.segment_ids == {"N1"}
+    assert list(ship_to.stream(file)) == ["DELTA DENTAL OF ABC"]
+
+    # A query of the envelopes selects whole transaction sets, bodies included.
+    payments = query.compile("ST[ST01=835]")
+    assert payments.keep is None
+    expected = [s.to_dict() for s in payments.findall(Parser(file).document)]
+    streamed = list(payments.stream(file))
+    assert [s.to_dict() for s in streamed] == expected
+    assert [s.skipped_segments for s in streamed] == [0] * len(expected)
+
+    # The trailers are read after their transaction sets, a stream can't select by them.
+    document = Parser(file).document
+    for path in ("GS/GE01", "GS[GE01=1]/ST", "ISA[IEA01=1]/N1/N102"):
+        assert query.compile(path).findall(document)
+        with pytest.raises(err.QuerySyntaxError):
+            query.compile(path).stream(file)
+    assert list(query.compile("ST/SE01").stream(file)) == document.query("ST/SE01")
+
+
+def test_offset_index(tmp_path):
+    path = tmp_path / "sample.edi"
+    spec = CorpusSpec(segments_per_set=5, sets_per_group=4, groups=3, seed=7)
+    with open(path, "w") as f:
+        generate(spec, f)
+
+    indexed = Parser.open_indexed(path)
+    index = indexed.index
+    assert (index.group_count, index.transaction_set_count) == (3, 12)
+    assert (tmp_path / "sample.edi.bx12idx").exists()
+    assert Parser.open_indexed(path).index.to_bytes() == index.to_bytes()
+
+    document = Parser(path).document
+    transaction_sets = [
+        t for group in document.interchange.groups for t in group.transaction_sets
+    ]
+    for number in (0, 5, -1):
+        streamed = indexed.transaction_set(number)
+        assert streamed.transaction_set.to_dict() == transaction_sets[number].to_dict()
+        assert streamed.offset == index.transaction_set(number)[0]
+
+    streamed = indexed.transaction_set(control_number=index.st02[6])
+    assert streamed.transaction_set.to_dict() == transaction_sets[2].to_dict()
+    assert indexed.group(1).to_dict() == document.interchange.groups[1].to_dict()
+    assert indexed.interchange(0).to_dict()["document"]["interchange"] == (
+        document.to_dict()["document"]["interchange"]
+    )
+    with pytest.raises(KeyError):
+        indexed.group(control_number="missing")
+    with pytest.raises(IndexError):
+        indexed.transaction_set(12)
+
+    with open(path, "a") as f:
+        f.write("\n")
+    assert not OffsetIndex.load(tmp_path / "sample.edi.bx12idx").is_current(path)
+    assert Parser.open_indexed(path).index.is_current(path)
+    with pytest.raises(err.SerializationError):
+        OffsetIndex.from_bytes(index.to_bytes()[:-1])
+
+    # CRLF archives parse like the LF original.
+    crlf_path = tmp_path / "crlf.edi"
+    crlf_path.write_bytes(path.read_bytes().replace(b"~", b"~\r\n"))
+    crlf = Parser.open_indexed(crlf_path)
+    interchange = crlf.interchange(0)
+    assert interchange.validate().is_document_valid() is True
+    assert len(interchange.interchange.groups) == 3
+    assert crlf.group(1).to_dict() == document.interchange.groups[1].to_dict()
+
+
+def test_grep(test_files, cli_runner):
+    edi_dir = str(TEST_FILE_DIR / "edi")
+    result = cli_runner.invoke(cli, ["grep", "CLP01=7722337", edi_dir, "-j", "2"])
+    assert result.exit_code == 0
+    lines = result.output.splitlines()
+    assert len(lines) == 10
+    path, offset, control_numbers, segment = lines[0].split(":", 3)
+    assert control_numbers == "000000195/278/35681"
+    with open(path, "rb") as f:
+        f.seek(int(offset))
+        assert f.read(len(segment)).decode("utf-8") == segment
+
+    result = cli_runner.invoke(cli, ["grep", "-i", "N102~dental", edi_dir, "-l"])
+    assert sorted(result.output.splitlines()) == [
+        str(TEST_FILE_DIR / "edi" / "X221-era-sample.edi"),
+        str(TEST_FILE_DIR / "edi" / "X221-multiple-claims-single-check.edi"),
+    ]
+
+    sample = str(TEST_FILE_DIR / "edi" / "X221-era-sample.edi")
+    result = cli_runner.invoke(cli, ["grep", "SVC01-2~^D02", sample, "-c"])
+    assert result.output == f"{sample}:3\n"
+    assert cli_runner.invoke(cli, ["grep", "N101!=PR", sample]).output.count("\n") == 1
+    assert cli_runner.invoke(cli, ["grep", "PO1", sample]).exit_code == 1
+    assert cli_runner.invoke(cli, ["grep", "CLP01~(", sample]).exit_code == 2
+
+
+def test_diff(cli_runner, tmp_path):
+    sample = TEST_FILE_DIR / "edi" / "X221-era-sample.edi"
+    text = sample.read_text()
+    changed = tmp_path / "changed.edi"
+    changed.write_text(
+        text.replace("SVC*AD:D0220*25*14", "SVC*AD:D0220*30*14")
+        .replace("N3*225 MAIN STREET~", "")
+        .replace("REF*EV*CLEARINGHOUSE~", "REF*EV*CLEARINGHOUSE~REF*ZZ*NEW~")
+    )
+    old = Parser(sample).document
+    result = old.diff(Parser(changed).document)
+
+    assert not old.diff(Parser(text).document)
+    assert result.transaction_set_count == 1
+    assert [(c.kind, c.segment_id, c.old_position, c.new_position) for c in result] == [
+        ("added", "REF", None, 5),
+        ("removed", "N3", 6, None),
+        ("changed", "SVC", 19, 19),
+    ]
+    assert result.changes[2].elements == [("SVC02", "25", "30")]
+
+    # Transaction sets are aligned by control number, not position.
+    spec = CorpusSpec(segments_per_set=5, sets_per_group=3, seed=1)
+    out = io.StringIO()
+    generate(spec, out)
+    document = Parser(out.getvalue()).document
+    reordered = Parser(out.getvalue()).document
+    transaction_sets = reordered.interchange.groups[0].transaction_sets
+    transaction_sets.reverse()
+    del transaction_sets[0]
+    result = document.diff(reordered)
+    assert [(c.kind, c.location) for c in result] == [("removed", "000000001/1/0003")]
+    assert result.identical_transaction_set_count == 2
+
+    result = cli_runner.invoke(cli, ["diff", str(sample), str(changed)])
+    assert result.exit_code == 1
+    assert "    SVC02: '25' -> '30'" in result.output.splitlines()
+    result = cli_runner.invoke(cli, ["diff", "-q", str(sample), str(sample)])
+    assert (result.exit_code, result.output) == (0, "")
+
+
+def test_segment_templates(test_files, tmp_path):
+    for file in test_files["edi"]:
+        text = file.read_text()
+        assert Parser(text).document.format_as_edi() == text.replace("\n", "")
+
+    st = TransactionSetHeader().template()
+    assert st is TransactionSetHeader().template()
+    assert st.format(("850", "0001", "")) == "ST*850*0001~"
+    assert st.format(("850", "", ""), "|", "\n") == "ST|850|\n"
+    n1 = SegmentTemplate("N1", (True, False, False, False))
+    assert n1.format(("", "", "", "")) == "N1*~"
+    assert n1.format(("ST", "", "92", "")) == "N1*ST**92~"
+    assert str(Parser(test_files["edi"][0]).document.interchange.header).startswith(
+        "ISA*00*"
+    )
+
+    path = tmp_path / "outbound.edi"
+    with InterchangeWriter(path) as writer:
+        writer.open_interchange("SENDER", "RECEIVER", control_number=1)
+        writer.open_group("PO", "SENDER", "RECEIVER", "004010")
+        writer.add_transaction_set("850", [(n1, ("ST", "ACME", "", ""))])
+    assert "~ST*850*0001~N1*ST*ACME~SE*3*0001~" in path.read_text()
+
+
+def test_interchange_writer(tmp_path):
+    path = tmp_path / "outbound.edi"
+    sample = Parser(TEST_FILE_DIR / "edi" / "X221-era-sample.edi").document
+    claims = sample.interchange.groups[0].transaction_sets[0]
+    with InterchangeWriter(path, sub_element_separator=":") as writer:
+        writer.open_interchange("SENDER", "RECEIVER", control_number=7)
+        writer.open_group("PO", "SENDER", "RECEIVER", "004010")
+        for number in range(3):
+            segments = [("BEG", "00", "SA", f"PO{number}", "", "20200102")]
+            segments.append(("PO1", "1", 10, "EA", "", ""))
+            assert writer.add_transaction_set("850", segments) == f"{number + 1:04}"
+        writer.close_group()
+        writer.open_group("HP", "SENDER", "RECEIVER", "005010X221A1")
+        writer.add_transaction_set(
+            "835", claims.transaction_body, control_number="35681"
+        )
+        with pytest.raises(err.FieldValidationError):
+            writer.write_segment(("N1", "ST", "A*B"))
+        for empty in ((), ("", ""), ("", "ST")):
+            with pytest.raises(err.FieldValidationError):
+                writer.write_segment(empty)
+        with pytest.raises(err.EnvelopeError):
+            writer.open_interchange("SENDER", "RECEIVER", control_number=8)
+        # The open group and interchange are closed with the writer.
+
+    document = Parser(path).document
+    assert document.validate().is_document_valid()
+    assert document.query("ISA/IEA01") == ["2"]
+    assert document.query("ISA/IEA02") == ["000000007"]
+    assert document.query("GS/GS06") == ["1", "2"]
+    assert document.query("ST[ST01=850]/SE01") == ["4", "4", "4"]
+    assert document.query("ST[ST01=850]/PO1/PO102") == ["10", "10", "10"]
+    assert document.query("ST[ST01=835]/SVC/SVC01-2")[0] == "D0120"
+    assert path.read_text().count("PO1*1*10*EA~") == 3
+
+    with pytest.raises(err.EnvelopeError):
+        InterchangeWriter(io.StringIO()).add_transaction_set("850", [])
+    with pytest.raises(err.FieldValidationError):
+        InterchangeWriter(io.StringIO()).open_interchange("S" * 16, "RECEIVER", 1)
+
+
+def test_split(cli_runner, tmp_path):
+    source = tmp_path / "inbound.edi"
+    with InterchangeWriter(source, repetition_separator="U") as writer:
+        for receiver, control_number in (("RECEIVER", 7), ("OTHER", 8)):
+            writer.open_interchange("SENDER", receiver, control_number, version="00401")
+            writer.open_group("PO", "SENDER", receiver, "004010")
+            for number in range(3):
+                writer.add_transaction_set("850", [f"BEG*00*SA*PO{number}**20200102"])
+            writer.close_group()
+            writer.open_group("IN", "SENDER", receiver, "004010")
+            for number in range(2):
+                writer.add_transaction_set("810", [("BIG", "20200102", f"IN{number}")])
+            writer.close_interchange()
+
+    output_dir = tmp_path / "output"
+    output_dir.mkdir()
+    args = ["split", str(source), "-o", str(output_dir), "--per-file", "2"]
+    result = cli_runner.invoke(cli, args + ["--control-number", "100"])
+    assert result.exit_code == 0
+    counts = [line.rsplit(":", 1) for line in result.output.splitlines()]
+    assert [int(count) for _, count in counts] == [2, 2, 1, 2, 2, 1]
+
+    documents = [Parser(path).document for path, _ in counts]
+    assert all(document.validate().is_document_valid() for document in documents)
+    assert [document.query("ISA/ISA13")[0] for document in documents] == [
+        f"{number:09}" for number in range(100, 106)
+    ]
+    # The second file holds the last 850 and the first 810, in their own groups.
+    assert documents[1].query("GS/GS01") == ["PO", "IN"]
+    assert documents[1].query("ST/ST02") == ["0001", "0001"]
+    assert documents[1].query("BIG/BIG02") == ["IN0"]
+    assert documents[3].query("ISA/ISA08") == ["OTHER".ljust(15)]
+    assert documents[0].query("ISA/ISA11") == ["U"]
+
+    args = ["split", str(source), "-o", str(output_dir), "--by", "ST01"]
+    result = cli_runner.invoke(cli, args)
+    assert sorted(result.output.splitlines()) == [
+        f"{output_dir / 'inbound-810-0001.edi'}:2",
+        f"{output_dir / 'inbound-810-0002.edi'}:2",
+        f"{output_dir / 'inbound-850-0001.edi'}:3",
+        f"{output_dir / 'inbound-850-0002.edi'}:3",
+    ]
+    assert cli_runner.invoke(cli, ["split", str(source)]).exit_code == 2
+
+
+def test_serialization(test_files):
+    for file in test_files["edi"]:
+        document = Parser(file).document
+        data = document.to_bytes()
+        loaded = EDIDocument.from_bytes(data)
+
+        assert loaded.to_dict() == document.to_dict()
+        assert loaded.stats.segment_counts == document.stats.segment_counts
+        assert loaded.format_as_edi() == document.format_as_edi()
+        assert pickle.loads(pickle.dumps(document)).to_dict() == document.to_dict()
+
+    with pytest.raises(err.SerializationError):
+        EDIDocument.from_bytes(b"JSON" + data[4:])
+
+    with pytest.raises(err.SerializationError):
+        EDIDocument.from_bytes(data[: len(data) // 2])
+
+
+def test_parse_cache(test_files, tmp_path):
+    cache = ParseCache(tmp_path / "cache")
+    file = test_files["edi"][0]
+
+    parsed = Parser(file, cache=cache).document
+    cached = Parser(file, cache=cache).document
+
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert cached.to_dict() == parsed.to_dict()
+
+    entry = next((tmp_path / "cache").glob("*/*.bx12"))
+    entry.write_bytes(b"corrupt")
+    assert Parser(file, cache=cache).document.to_dict() == parsed.to_dict()
+    assert cache.misses == 2
+
+    # A damaged string table is corrupt too, not a UnicodeDecodeError.
+    data = entry.read_bytes()
+    position = data.index(b"ISA")
+    entry.write_bytes(data[:position] + b"\xff" + data[position + 1 :])
+    assert Parser(file, cache=cache).document.to_dict() == parsed.to_dict()
+    assert cache.misses == 3
+
+    assert Parser(file, cache=str(tmp_path / "cache")).cache.hits == 1
+
+    cache.max_size = 1
+    Parser(test_files["edi"][1], cache=cache)
+    assert len(list((tmp_path / "cache").glob("*/*.bx12"))) == 0
+
+
+def test_views(test_files):
+    for file in test_files["edi"]:
+        document = Parser(file).document
+        document_view = document.view()
+
+        assert document_view == document.to_dict()
+        assert json.loads(json.dumps(document_view, default=json_default)) == (
+            document.to_dict()
+        )
+
+    group = document.interchange.groups[0]
+    group_view = document_view["document"]["interchange"]["groups"][0]
+    assert group_view == view(group) == group.to_dict()
+    assert group_view["transaction_sets"][:1] == group.to_dict()["transaction_sets"][:1]
+
+    with pytest.raises(KeyError):
+        group_view["groups"]
+
+    with pytest.raises(TypeError):
+        view(document.text)
+
+
+def test_stats(test_files):
+    file = TEST_FILE_DIR / "edi" / "X221-era-sample.edi"
+    document = Parser(file).document
+    stats = document.stats
+
+    assert stats.byte_size == file.stat().st_size
+    assert stats.segment_count == len(
+        {record.segment_ordinal for record in document.to_records()}
+    )
+    assert stats.segment_counts["SVC"] == 5
+    assert stats.group_count == len(document.interchange.groups)
+    assert stats.transaction_set_count == 1
+    assert set(stats.timings) == {"read", "header", "split", "route"}
+
+    assert repr(document) == (
+        "<EDIDocument ISA13='000000195' sender='123456789' receiver='987654321' "
+        "groups=1 transaction_sets=1 segments=39 bytes=%d>" % stats.byte_size
+    )
+
+
+def test_cli_jobs(test_files, cli_runner, tmp_path, caplog):
+    for path in (test_files["edi"][0].parent, test_files["errors"]):
+        output_dir = tmp_path / path.name
+        output_dir.mkdir()
+        result = cli_runner.invoke(
+            cli, ["parse", f"{path}", f"--output_dir={output_dir}", "--jobs=2"]
+        )
+
+        assert result.exit_code == 0
+
+    # One output per input, workers mustn't overwrite each other's files.
+    outputs = list((tmp_path / test_files["edi"][0].parent.name).glob("*.json"))
+    assert sorted(p.name.split(".")[0] for p in outputs) == sorted(
+        f.stem for f in test_files["edi"]
+    )
+
+    # The results are reported in input order.
+    errors = list(iter_files(test_files["errors"]))
+    reported = [
+        record.getMessage().split(" ")[0]
+        for record in caplog.records
+        if record.levelname == "ERROR"
+    ]
+    assert reported == [str(f) for f in errors if str(f) in reported]
+    assert len(reported) > 1
+    results = ParsePipeline("json", tmp_path, jobs=2).run(errors + test_files["edi"])
+    assert [result.path for result in results] == errors + test_files["edi"]
+
+    # A worker process sends back the formatted text, not the parsed document.
+    parsed, payload = parse_and_format(str(test_files["edi"][0]), "json")
+    assert parsed.document is None and parsed.error is None
+    assert json.loads(payload) == Parser(test_files["edi"][0]).document.to_dict()
+
+
+def test_cli_manifest(test_files, cli_runner, tmp_path, caplog):
+    caplog.set_level("INFO")
+    path = test_files["edi"][0].parent
+    args = ["parse", f"{path}", f"--output_dir={tmp_path}"]
+
+    assert cli_runner.invoke(cli, args).exit_code == 0
+    outputs = sorted(p.name for p in tmp_path.glob("*.json"))
+    assert len(outputs) == len(test_files["edi"])
+
+    caplog.clear()
+    assert cli_runner.invoke(cli, args).exit_code == 0
+    assert f"Parsed 0 files (0 failed, {len(outputs)} skipped" in caplog.text
+    assert sorted(p.name for p in tmp_path.glob("*.json")) == outputs
+
+    caplog.clear()
+    assert cli_runner.invoke(cli, args + ["--force"]).exit_code == 0
+    assert f"Parsed {len(outputs)} files (0 failed, 0 skipped" in caplog.text
+    assert sorted(p.name for p in tmp_path.iterdir()) == sorted(
+        outputs + [".badx12-manifest.db"]
+    )
+
+
+def test_control_numbers(test_files, cli_runner, tmp_path, caplog):
+    source = test_files["edi"][0]
+    drop_dir = tmp_path / "drop"
+    drop_dir.mkdir()
+    (tmp_path / "output").mkdir()
+    shutil.copy(source, drop_dir / "first.edi")
+    database = tmp_path / "control-numbers.db"
+    args = ["parse", f"{drop_dir}", f"--output_dir={tmp_path / 'output'}"]
+    args.append(f"--control-number-db={database}")
+
+    assert cli_runner.invoke(cli, args).exit_code == 0
+    assert "reuses" not in caplog.text
+
+    # The same file again is recorded once, a copy under another name reuses all.
+    shutil.copy(source, drop_dir / "second.edi")
+    assert cli_runner.invoke(cli, args + ["--force"]).exit_code == 0
+    control_numbers = extract_control_numbers(Parser(source).document)
+    assert caplog.text.count("reuses") == len(control_numbers)
+    assert f"first seen in {drop_dir / 'first.edi'}" in caplog.text
+
+    with ControlNumberIndex(database) as index:
+        duplicates = index.duplicates()
+        assert len(duplicates) == len(control_numbers)
+        assert {tuple(paths) for _, paths in duplicates} == {
+            (str(drop_dir / "first.edi"), str(drop_dir / "second.edi"))
+        }
+        assert [key[0] for key, _ in index.duplicates(level="ISA")] == ["ISA"]
+
+    # A file added again with fewer control numbers leaves none of its old ones.
+    def st(control_number):
+        return ControlNumber("ST", "S", "R", "1", control_number, "20200101")
+
+    for flush in (False, True):
+        with ControlNumberIndex(tmp_path / f"shrunk-{flush}.db") as index:
+            index.add("a.edi", [st("0001"), st("0002")])
+            if flush:
+                index.flush()
+            assert index.add("a.edi", [st("0001")]) == []
+            assert index.add("b.edi", [st("0002")]) == []
+            assert [d.previous_path for d in index.add("c.edi", [st("0001")])] == [
+                os.path.abspath("a.edi")
+            ]
+            assert len(index.duplicates()) == 1
+
+
+def test_pipeline(test_files, cli_runner, tmp_path, caplog):
+    def slow_square(n):
+        time.sleep(0.001 * (n % 3))
+        return n * n
+
+    def fail_on_five(n):
+        if n == 5:
+            raise ValueError(n)
+        return n
+
+    pipeline = Pipeline([Stage("square", slow_square, 3), Stage("id", fail_on_five)])
+    assert list(pipeline.run(range(5))) == [n * n for n in range(5)]
+    assert set(pipeline.utilization()) == {"square", "id"}
+
+    pipeline = Pipeline([Stage("id", fail_on_five, 2)], queue_size=1)
+    results = pipeline.run(range(100))
+    assert [next(results) for _ in range(5)] == [0, 1, 2, 3, 4]
+    with pytest.raises(ValueError):
+        next(results)
+
+    caplog.set_level("INFO")
+    path = test_files["edi"][0].parent
+    args = ["parse", f"{path}", f"--output_dir={tmp_path}", "--readers=2"]
+    assert (
+        cli_runner.invoke(cli, args + ["--writers=2", "--queue-size=1"]).exit_code == 0
+    )
+    assert len(list(tmp_path.glob("*.json"))) == len(test_files["edi"])
+    assert "Stage utilization: read" in caplog.text
+
+    # CRLF terminated segments parse as they do in text mode, and a file that
+    # isn't UTF-8 fails on its own without stopping the run.
+    inputs = tmp_path / "inputs"
+    inputs.mkdir()
+    data = test_files["edi"][0].read_bytes()
+    (inputs / "a_crlf.edi").write_bytes(data.replace(b"~", b"~\r\n"))
+    (inputs / "b_utf16.edi").write_bytes(b"\xff\xfe" + data)
+    (inputs / "c_lf.edi").write_bytes(data)
+    results = list(ParsePipeline("json", tmp_path).run(sorted(inputs.iterdir())))
+    assert [result.error_types for result in results] == [
+        [],
+        ["UnicodeDecodeError"],
+        [],
+    ]
+    assert results[0].output is not None and results[2].output is not None
+    assert results[0].segment_count == results[2].segment_count
+    assert results[1].output is None and results[1].byte_size == len(data) + 2
+    result = cli_runner.invoke(cli, ["parse", f"{inputs}", f"--output_dir={tmp_path}"])
+    assert result.exit_code == 0
+
+
+def test_metrics(test_files, cli_runner, tmp_path):
+    registry = metrics.Registry()
+    files = metrics.Counter("files_total", "Files.", ("status",), registry=registry)
+    latency = metrics.Histogram(
+        "seconds", "Latency.", buckets=(0.1, 1), registry=registry
+    )
+    files.inc(labels=("ok",))
+    files.inc(2, labels=('say "hi"\n',))
+    latency.observe(0.05)
+    latency.observe(5)
+
+    assert registry.to_prometheus().splitlines() == [
+        "# HELP files_total Files.",
+        "# TYPE files_total counter",
+        'files_total{status="ok"} 1',
+        'files_total{status="say \\"hi\\"\\n"} 2',
+        "# HELP seconds Latency.",
+        "# TYPE seconds histogram",
+        'seconds_bucket{le="0.1"} 1',
+        'seconds_bucket{le="1"} 1',
+        'seconds_bucket{le="+Inf"} 2',
+        "seconds_sum 5.05",
+        "seconds_count 2",
+    ]
+    with pytest.raises(ValueError):
+        files.inc()
+    with pytest.raises(ValueError):
+        metrics.Counter("files_total", "Again.", registry=registry)
+
+    metrics.REGISTRY.clear()
+    metrics_file = tmp_path / "badx12.prom"
+    for path in (test_files["edi"][0], test_files["errors"]):
+        args = ["parse", f"{path}", f"--output_dir={tmp_path}"]
+        args.append(f"--metrics-file={metrics_file}")
+        assert cli_runner.invoke(cli, args).exit_code == 0
+
+    document = Parser(test_files["edi"][0]).document
+    assert metrics.FILES.value(("exported",)) == 1
+    assert metrics.FILES.value(("invalid",)) >= 1
+    assert metrics.SEGMENTS.value() >= document.stats.segment_count
+    assert metrics.ERRORS.value(("InvalidFileTypeError",)) == 1
+    assert metrics.ERRORS.value(("SegmentCountError",)) >= 1
+    assert metrics.PARSE_SECONDS.count() == sum(
+        metrics.FILES.value((status,)) for status in ("exported", "invalid", "failed")
+    )
+    assert 'badx12_files_total{status="exported"} 1' in metrics_file.read_text()
+
+
+def test_profile(test_files, cli_runner, tmp_path, monkeypatch):
+    path = test_files["edi"][0].parent
+    args = ["--profile", f"--profile-dir={tmp_path / 'profile'}", "--profile-slowest=2"]
+    args += ["parse", f"{path}", f"--output_dir={tmp_path}", "--jobs=2"]
+    result = cli_runner.invoke(cli, args)
+
+    assert result.exit_code == 0
+    assert "Phase breakdown" in result.output
+    assert "Routing by segment id" in result.output
+    for phase in ("route", "validate", "to_dict", "encode", "write"):
+        assert f"  {phase} " in result.output
+    assert len(list((tmp_path / "profile").glob("*.prof"))) == 2
+    assert len(list(tmp_path.glob("*.json"))) == len(test_files["edi"])
+    assert profiling.active() is None
+
+    profile = profiling.enable()
+    try:
+        document = Parser(test_files["edi"][0]).document
+        document.validate()
+    finally:
+        profiling.disable()
+
+    assert profile.phases["validate"].count == 1
+    assert sum(t.count for t in profile.segments.values()) == (
+        document.stats.segment_count
+    )
+
+    # The pipeline stages record into one profile from several threads, a
+    # thread switch in the middle of an update mustn't lose counts.
+    class SlowTiming(profiling.Timing):
+        __slots__ = ()
+
+        def add(self, seconds, count=1):
+            total = self.count
+            time.sleep(0)
+            self.count = total + count
+
+    monkeypatch.setattr(profiling, "Timing", SlowTiming)
+    profile = profiling.Profile()
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        for _ in range(4):
+            executor.submit(lambda: [profile.add("read", 0.001) for _ in range(200)])
+    assert profile.phases["read"].count == 800
+
+
+def test_iter_files(test_files, cli_runner, tmp_path):
+    edi_names = sorted(f.name for f in test_files["edi"])
+
+    assert list(iter_files(TEST_FILE_DIR)) == []
+    assert list(iter_files(test_files["edi"][0])) == [test_files["edi"][0]]
+
+    found = iter_files(TEST_FILE_DIR, recursive=True, exclude=["errors", "temp"])
+    assert sorted(f.name for f in found) == edi_names
+
+    found = iter_files(TEST_FILE_DIR, recursive=True, include=["errors/*"])
+    assert sorted(found) == sorted(test_files["errors"].glob("*.edi"))
+
+    found = iter_files(TEST_FILE_DIR, recursive=True, include=["X279*"])
+    assert len(list(found)) == len([n for n in edi_names if n.startswith("X279")])
+
+    result = cli_runner.invoke(
+        cli,
+        [
+            "parse",
+            f"{TEST_FILE_DIR}",
+            f"--output_dir={tmp_path}",
+            "--recursive",
+            "--include=*.edi",
+            "--exclude=errors",
+            "--jobs=2",
+        ],
+    )
+    assert result.exit_code == 0
+    assert len(list(tmp_path.glob("*.json"))) == len(edi_names)
+
+
+def test_watch(test_files, cli_runner, tmp_path):
+    drop_dir = tmp_path / "drop"
+    output_dir = tmp_path / "output"
+    drop_dir.mkdir()
+    output_dir.mkdir()
+
+    watcher = DirectoryWatcher(drop_dir, settle=0.01, use_inotify=False)
+    shutil.copy(test_files["edi"][0], drop_dir)
+    assert watcher.poll() == []
+    assert watcher.has_candidates()
+    time.sleep(0.02)
+    assert watcher.poll() == [drop_dir / test_files["edi"][0].name]
+    assert watcher.poll() == []
+
+    for f in test_files["edi"][1:4]:
+        shutil.copy(f, drop_dir)
+
+    (drop_dir / "utf16.edi").write_bytes(
+        b"\xff\xfe" + test_files["edi"][0].read_bytes()
+    )
+
+    args = ["watch", f"{drop_dir}", f"--output_dir={output_dir}", "--once"]
+    for _ in range(2):
+        result = cli_runner.invoke(cli, args + ["--jobs=2"])
+        assert result.exit_code == 0
+        assert len(list(output_dir.glob("*.json"))) == 4
+
+    # Both backends report the same Path keys.
+    watcher = DirectoryWatcher(drop_dir, settle=60)
+    if watcher.inotify is not None:
+        (drop_dir / "late.edi").write_bytes(test_files["edi"][0].read_bytes())
+        watcher.wait(1)
+        assert watcher.poll() == [drop_dir / "late.edi"]
+    watcher.close()
+
+
+def test_serve(test_files):
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        server = make_server(executor, 2, port=0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        connection = http.client.HTTPConnection(*server.server_address[:2])
+
+        def request(method, path, body=None):
+            connection.request(method, path, body)
+            response = connection.getresponse()
+            return response.status, response.read(), response
+
+        good = (TEST_FILE_DIR / "edi" / "X221-era-sample.edi").read_bytes()
+        bad = (test_files["errors"] / "error_validation.edi").read_bytes()
+
+        status, body, _ = request("GET", "/health")
+        assert (status, json.loads(body)["workers"]) == (200, 2)
+
+        status, body, response = request("POST", "/parse", good)
+        assert status == 200
+        assert json.loads(body) == Parser(good.decode()).document.to_dict()
+        assert float(response.getheader("X-Badx12-Overhead-Time")) >= 0
+
+        status, body, _ = request("POST", "/validate", bad)
+        assert status == 200 and json.loads(body)["valid"] is False
+
+        status, body, _ = request("POST", "/records", good)
+        records = [json.loads(line) for line in body.decode().splitlines()]
+        assert records[0]["segment_id"] == "ISA"
+
+        status, body, _ = request("POST", "/convert?format=csv", good)
+        assert body.decode().startswith("interchange_control_number,")
+
+        status, body, _ = request("POST", "/convert?format=pdf", good)
+        assert status == 400
+
+        status, body, _ = request("POST", "/parse", b"bad file")
+        assert (status, json.loads(body)["error"]) == (422, "InvalidFileTypeError")
+
+        status, body, _ = request("POST", "/parse", str(TEST_FILE_DIR).encode())
+        assert status == 400
+
+        status, body, _ = request("POST", "/validate", good.replace(b"~", b"~\r\n"))
+        assert status == 200 and json.loads(body)["valid"] is True
+
+        status, body, _ = request("POST", "/validate", b"\xff\xfe" + good)
+        assert (status, json.loads(body)["error"]) == (400, "UnicodeDecodeError")
+
+        status, body, _ = request("POST", "/unknown", good)
+        assert status == 404
+
+        status, body, response = request("GET", "/metrics")
+        assert status == 200
+        assert response.getheader("Content-Type").startswith("text/plain")
+        assert 'badx12_requests_total{action="parse",status="422"}' in body.decode()
+        assert 'badx12_requests_total{action="unknown",status="404"}' in body.decode()
+
+        server.shutdown()
+        server.server_close()